@@ -0,0 +1,8 @@
+#!/usr/bin/env bash
+# Runs the benchmark suite and, if a baseline is given, compares the results against it:
+#   ./run_benchmarks.sh [baseline.json]
+echo "Running the benchmarks..."
+python src/benchmark_suite.py run --output benchmark_results.json || exit 1
+if [ -n "$1" ]; then
+    python src/benchmark_suite.py compare "$1" benchmark_results.json
+fi
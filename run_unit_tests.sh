@@ -1,4 +1,16 @@
 #!/usr/bin/env bash
 echo "Running some units tests..."
 python src/test_lib_helpers.py
-echo "Done"
\ No newline at end of file
+python src/test_lib_readers.py
+python src/test_lib_aggregator.py
+python src/test_lib_writers.py
+python src/test_lib_checkpoint.py
+python src/test_lib_spill.py
+python src/test_lib_benchmark_suite.py
+python src/test_lib_generate_itcont.py
+python src/test_lib_profiler.py
+python src/test_lib_metrics.py
+python src/test_lib_streaming.py
+python src/test_lib_query_server.py
+python src/test_lib_input_cache.py
+echo "Done"
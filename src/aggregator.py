@@ -0,0 +1,566 @@
+"""
+The aggregation of the contributions for the medianvals_by_zip.txt and medianvals_by_date.txt files.
+
+find_political_donors_delta.py hands the parsed input lines to a ContributionAggregator, writes the lines it returns
+for the zip file and, once the input is exhausted, writes the lines of the date file.
+
+"""
+import time
+from array import array
+from itertools import groupby, ifilter, izip
+from operator import itemgetter
+
+import numpy as np
+
+# import my helpers
+import helpers, spill
+
+# Number of contribution values of the date file whose medians are calculated together (see IterateDateLines)
+DATE_CHUNK_VALUES = 1 << 20
+
+
+class ContributionAggregator(object):
+    """
+        Holds the contribution values organized by id and zip code (for the zip file) and by id and date (for the date
+        file) and creates the output lines.
+
+        The ids and zip codes are interned (see helpers.KeyInterner) and the values are kept in two flat dicts keyed by
+        packed integers (see helpers.PackKey): dat_zip[PackKey(id, zip)] holds the group number of the recipient and zip
+        code in zip_store, which is created by zip_store_factory (see helpers.ZipStreamingStoreFactory) and holds the
+        running median, total and number of contributions of all the groups, and dat_date[PackKey(id, YYYYMMDD)] holds
+        an instance of date_accumulator_class (see helpers.DateAccumulatorFactory).  The zip code interner also remembers the zip
+        codes that are invalid so each distinct zip code is only checked once.
+        If rejections (helpers.RejectionAccounting) is given, the reasons for rejecting entries are recorded with it.
+        If changed_date_keys is set to a set (see TrackDateChanges), the keys of dat_date that get contributions are
+        added to it, so that only the changed lines of the date file need to be calculated.
+        If new_zip_keys and new_date_keys are set to lists (see TrackNewGroups), the keys of the groups that are created
+        are appended to them, so that indexes of the groups can be kept up to date (see query_server.py).
+        If date_memory_budget is given, the values of dat_date are spilled to disk whenever their estimated memory
+        passes it (see CheckDateMemory and spill.py).
+        If negative_as_retraction is set, an entry with a negative TRANSACTION_AMT is a refund: it retracts a
+        contribution of the same (positive) amount from the values of its recipient and zip code and of its recipient
+        and date, instead of being added to them (see _RetractZip and _RetractDate).  The zip store must be able to
+        remove values in O(log n) (helpers.ZipStreamingDeletableStore), the date accumulators in O(1)
+        (helpers.DateAccumulatorFrequency), and the values of the date file must not be spilled.
+
+    """
+
+    # for the aggregators pickled before the retractions (see checkpoint.py)
+    negative_as_retraction = False
+    retracted_zip = 0
+    retracted_date = 0
+
+    def __init__(self, zip_store_factory=helpers.ZipStreamingStore,
+                 date_accumulator_class=helpers.DateAccumulatorArray, rejections=None, date_memory_budget=None,
+                 spill_directory=None, negative_as_retraction=False):
+        self.zip_store_factory = zip_store_factory
+        self.date_accumulator_class = date_accumulator_class
+        self.rejections = rejections
+        self.date_memory_budget = date_memory_budget
+        self.date_spiller = spill.DateSpiller(spill_directory)
+        # number of values of the date file that were spilled
+        self.date_values_spilled = 0
+
+        # the ids and the zip codes as small integers
+        self.id_codes = helpers.KeyInterner()
+        self.zip_codes = helpers.KeyInterner()
+
+        # create data structures for storing values for the zip and date files
+        self.zip_store = zip_store_factory()
+        self.dat_zip = {}
+        self.dat_date = {}
+        self.changed_date_keys = None
+        self.new_zip_keys = None
+        self.new_date_keys = None
+
+        self.line_number = 0
+        self.skipped_zip = 0
+        self.skipped_date = 0
+
+        # retract the contributions with a negative amount, and count the retracted ones
+        self.negative_as_retraction = negative_as_retraction
+        if negative_as_retraction and not hasattr(self.zip_store, 'remove'):
+            raise ValueError('The retractions need a zip store that can remove values')
+        if negative_as_retraction and not date_accumulator_class.FAST_REMOVE:
+            raise ValueError('The retractions need date accumulators that remove values in constant time')
+        self.retracted_zip = 0
+        self.retracted_date = 0
+
+    def ProcessRecord(self, record, record_seconds=None):
+        """
+        Takes in a parsed input line, adds the contribution to the zip and date values and returns the line for the
+        zip file.
+
+        :param record: tuple of 'CMTE_ID', 'ZIP_CODE', 'TRANSACTION_DT', 'TRANSACTION_AMT', 'OTHER_ID' [tuple]
+        :param record_seconds: seconds by stage of the aggregation, to add the time of each stage of this record to
+                               (see profiler.py); None for no timing [dict]
+        :return: the line for the medianvals_by_zip.txt file or None if the record is not used for it [string]
+        """
+        if record_seconds is not None:
+            t_start = time.time()
+        id, zipcode, dt, amt, other_id = record
+
+        # we don't need the full zip code
+        zipcode = zipcode[:5]
+
+        # Considerations #1 and 5
+        # - the reasons are only split out (for statistics on entry rejections) if requested
+        if (other_id != '') or (id == '') or (amt == ''):
+            self.skipped_zip += 1
+            self.skipped_date += 1
+            if self.rejections is not None:
+                self.rejections.RejectEntry(record)
+            if record_seconds is not None:
+                record_seconds['validate'] += time.time() - t_start
+            return None
+
+        lineOut = None
+        id_code = self.id_codes.codes.get(id)
+        if id_code is None:
+            id_code = self.id_codes.Intern(id)
+
+        # see if the zip code is valid (-1 if not), checking it only the first time we see it
+        zip_code = self.zip_codes.codes.get(zipcode)
+        if zip_code is None:
+            if helpers.CheckZipCode(zipcode):
+                zip_code = self.zip_codes.Intern(zipcode)
+            else:
+                zip_code = self.zip_codes.Reject(zipcode)
+
+        # see if the date is valid (-1 if not); the date is YYYYMMDD
+        date_key = helpers.ParseTransactionDate(dt)
+
+        if self.rejections is not None and (zip_code < 0 or date_key < 0):
+            self.rejections.RejectFields(record, zip_code < 0, date_key < 0)
+
+        # the amount is only converted for a record used for either file, so that one used for neither is skipped
+        # whatever its amount
+        if zip_code < 0 and date_key < 0:
+            self.skipped_zip += 1
+            self.skipped_date += 1
+            if record_seconds is not None:
+                record_seconds['validate'] += time.time() - t_start
+            return None
+        amt = int(amt)
+        if record_seconds is not None:
+            t_stage = time.time()
+            record_seconds['validate'] += t_stage - t_start
+
+        # a refund retracts an earlier contribution
+        if amt < 0 and self.negative_as_retraction:
+            lineOut = self._ProcessRetraction(id_code, zip_code, date_key, -amt, id, zipcode)
+            if record_seconds is not None:
+                record_seconds['zip_ingest'] += time.time() - t_stage
+            return lineOut
+
+        # Check if we can process for zip file; a window of days also needs the date
+        if zip_code >= 0 and (date_key >= 0 or not self.zip_store.needs_dates):
+            # Determine if this is the first time we are encountering this zip code for this id. If so, then
+            # add a group to the store which will track the transaction values and give us the values we need to
+            # write to file.
+            key = id_code * helpers.PACKED_KEY_SPACE + zip_code
+            group = self.dat_zip.get(key)
+            if group is None:
+                group = self.dat_zip[key] = self.zip_store.NewGroup()
+                if self.new_zip_keys is not None:
+                    self.new_zip_keys.append(key)
+
+            # Now we are ready to add the transaction amount
+            trans_median, trans_total, trans_number = self.zip_store.ingest(group, amt, date_key)
+            if record_seconds is not None:
+                t_ingested = time.time()
+                record_seconds['zip_ingest'] += t_ingested - t_stage
+
+            # Create the line to write to file
+            lineOut = helpers.CreateZipOutputString(trans_median, trans_total, trans_number, id, zipcode)
+            if record_seconds is not None:
+                t_stage = time.time()
+                record_seconds['format_write'] += t_stage - t_ingested
+        else:
+            self.skipped_zip += 1
+
+        # Check to see if we can process for the date file
+        if date_key >= 0:
+            # See if this is the first time we are encountering this date, for this id
+            key = id_code * helpers.PACKED_KEY_SPACE + date_key
+            date_accumulator = self.dat_date.get(key)
+            if date_accumulator is None:
+                date_accumulator = self.dat_date[key] = self.date_accumulator_class()
+                if self.new_date_keys is not None:
+                    self.new_date_keys.append(key)
+
+            # Now we are ready to add the transaction amount to the accumulator
+            date_accumulator.ingest(amt)
+            if self.changed_date_keys is not None:
+                self.changed_date_keys.add(key)
+        else:
+            self.skipped_date += 1
+        if record_seconds is not None:
+            record_seconds['date_accumulate'] += time.time() - t_stage
+
+        return lineOut
+
+    def _ProcessRetraction(self, id_code, zip_code, date_key, amt, id, zipcode):
+        """
+        Retracts a contribution from the zip and date values, for ProcessRecord.
+
+        :param id_code: the interned CMTE_ID [int]
+        :param zip_code: the interned zip code, -1 if it is invalid [int]
+        :param date_key: the date as YYYYMMDD, -1 if it is invalid [int]
+        :param amt: the amount of the contribution to retract [int]
+        :param id: CMTE_ID [string]
+        :param zipcode: the 5 digit zip code [string]
+        :return: the line for the medianvals_by_zip.txt file or None if the record is not used for it [string]
+        """
+        lineOut = None
+        if zip_code >= 0:
+            lineOut = self._RetractZip(id_code * helpers.PACKED_KEY_SPACE + zip_code, amt, id, zipcode)
+        else:
+            self.skipped_zip += 1
+        if date_key >= 0:
+            self._RetractDate(id_code * helpers.PACKED_KEY_SPACE + date_key, amt)
+        else:
+            self.skipped_date += 1
+        return lineOut
+
+    def _RetractZip(self, key, amt, id, zipcode):
+        """
+        Retracts a contribution of a recipient and zip code.  A retraction without a matching contribution is skipped.
+
+        :param key: the packed key of the recipient and zip code [int]
+        :param amt: the amount of the contribution to retract [int]
+        :param id: CMTE_ID [string]
+        :param zipcode: the 5 digit zip code [string]
+        :return: the line for the medianvals_by_zip.txt file with the values left (all 0 once every contribution is
+                 retracted), or None if there was no matching contribution [string]
+        """
+        group = self.dat_zip.get(key)
+        values = self.zip_store.remove(group, amt) if group is not None else None
+        if values is None:
+            self.skipped_zip += 1
+            return None
+        self.retracted_zip += 1
+        trans_median, trans_total, trans_number = values
+        return helpers.CreateZipOutputString(trans_median, trans_total, trans_number, id, zipcode)
+
+    def _RetractDate(self, key, amt):
+        """
+        Retracts a contribution of a recipient and date.  A retraction without a matching contribution is skipped; a
+        date whose contributions are all retracted keeps its line in the date file, with all its values 0.
+
+        :param key: the packed key of the recipient and date [int]
+        :param amt: the amount of the contribution to retract [int]
+        :return: Nothing
+        """
+        date_accumulator = self.dat_date.get(key)
+        if date_accumulator is None or not date_accumulator.remove(amt):
+            self.skipped_date += 1
+            return
+        self.retracted_date += 1
+        if self.changed_date_keys is not None:
+            self.changed_date_keys.add(key)
+
+    def ProcessBlocks(self, reader, profiler=None):
+        """
+        Processes the blocks of parsed input lines handed out by a reader (see readers.py) and yields, for every
+        block, the list of lines for the zip file in the same order as the input lines.
+
+        :param reader: iterable of lists of parsed input lines [iterable]
+        :param profiler: adds the time of the aggregation of every block to it, timing one record in every
+                         sample_interval stage by stage; None for no profiling [profiler.StageProfiler]
+        :return: generator of lists of lines for the medianvals_by_zip.txt file [generator]
+        """
+        process_record = self.ProcessRecord
+        for records in reader:
+            zip_lines = []
+            if profiler is None:
+                for record in records:
+                    lineOut = process_record(record)
+                    if lineOut is not None:
+                        zip_lines.append(lineOut)
+            else:
+                t_start = time.time()
+                sample_interval = profiler.sample_interval
+                record_seconds = profiler.record_seconds
+                for record_index, record in enumerate(records):
+                    if record_index % sample_interval:
+                        lineOut = process_record(record)
+                    else:
+                        lineOut = process_record(record, record_seconds)
+                    if lineOut is not None:
+                        zip_lines.append(lineOut)
+                profiler.Add('aggregate', time.time() - t_start)
+                profiler.counts['blocks'] += 1
+                profiler.counts['records'] += len(records)
+                profiler.counts['sampled_records'] += (len(records) + sample_interval - 1) // sample_interval
+                profiler.counts['zip_lines'] += len(zip_lines)
+            self.line_number += len(records)
+            self.CheckDateMemory()
+            yield zip_lines
+
+    def ProcessColumnBlocks(self, blocks, id_keys, zip_keys):
+        """
+        Same as ProcessBlocks for blocks of records that were already parsed and checked, as columns of numpy arrays
+        (see readers.ValidatedBlockReader and input_cache.py).  The checks of ProcessRecord are the flags of the
+        records, so only the running medians, the output lines and the date values are left to do.  Rejections are
+        not recorded.
+
+        :param blocks: iterable of tuples of the columns id, zip, date, amount and flags of the records of a block
+                       [iterable]
+        :param id_keys: the CMTE_ID of each id of the columns; it can grow between blocks [list]
+        :param zip_keys: the zip code of each zip of the columns; it can grow between blocks [list]
+        :return: generator of lists of lines for the medianvals_by_zip.txt file [generator]
+        """
+        # the ids and zip codes of the columns as interned in this aggregator, and as strings
+        id_map_list = []
+        zip_map_list = []
+
+        dat_zip = self.dat_zip
+        zip_store = self.zip_store
+        retract = self.negative_as_retraction
+        create_zip_output_string = helpers.CreateZipOutputString
+        for id_codes, zip_codes, date_keys, amounts, flags in blocks:
+            if len(id_map_list) < len(id_keys) or not id_map_list:
+                id_map_list.extend(self.id_codes.Intern(id) for id in id_keys[len(id_map_list):])
+                id_map = np.array(id_map_list, dtype=np.int64)
+                id_strings = np.array(id_keys, dtype=object)
+            if len(zip_map_list) < len(zip_keys) or not zip_map_list:
+                zip_map_list.extend(self.zip_codes.Intern(zipcode) for zipcode in zip_keys[len(zip_map_list):])
+                zip_map = np.array(zip_map_list, dtype=np.int64)
+                zip_strings = np.array(zip_keys, dtype=object)
+            if zip_store.needs_dates:
+                # a window of days also needs the date
+                zip_date_flags = helpers.FLAG_ZIP | helpers.FLAG_DATE
+                zip_rows = np.flatnonzero((flags & zip_date_flags) == zip_date_flags)
+            else:
+                zip_rows = np.flatnonzero(flags & helpers.FLAG_ZIP)
+            date_rows = np.flatnonzero(flags & helpers.FLAG_DATE)
+            self.skipped_zip += len(flags) - len(zip_rows)
+            self.skipped_date += len(flags) - len(date_rows)
+
+            # the zip file lines, in order
+            zip_lines = []
+            zip_ids = id_codes[zip_rows]
+            zip_zips = zip_codes[zip_rows]
+            for key, amt, date_key, id, zipcode in izip((id_map[zip_ids] * helpers.PACKED_KEY_SPACE +
+                                                         zip_map[zip_zips]).tolist(), amounts[zip_rows].tolist(),
+                                                        date_keys[zip_rows].tolist(), id_strings[zip_ids].tolist(),
+                                                        zip_strings[zip_zips].tolist()):
+                if retract and amt < 0:
+                    lineOut = self._RetractZip(key, -amt, id, zipcode)
+                    if lineOut is not None:
+                        zip_lines.append(lineOut)
+                    continue
+                group = dat_zip.get(key)
+                if group is None:
+                    group = dat_zip[key] = zip_store.NewGroup()
+                    if self.new_zip_keys is not None:
+                        self.new_zip_keys.append(key)
+                trans_median, trans_total, trans_number = zip_store.ingest(group, amt, date_key)
+                zip_lines.append(create_zip_output_string(trans_median, trans_total, trans_number, id, zipcode))
+
+            # the date file values
+            dat_date = self.dat_date
+            keys = (id_map[id_codes[date_rows]] * helpers.PACKED_KEY_SPACE + date_keys[date_rows]).tolist()
+            for key, amt in izip(keys, amounts[date_rows].tolist()):
+                if retract and amt < 0:
+                    self._RetractDate(key, -amt)
+                    continue
+                date_accumulator = dat_date.get(key)
+                if date_accumulator is None:
+                    date_accumulator = dat_date[key] = self.date_accumulator_class()
+                    if self.new_date_keys is not None:
+                        self.new_date_keys.append(key)
+                date_accumulator.ingest(amt)
+            if self.changed_date_keys is not None:
+                # the retractions without a matching contribution have no group
+                self.changed_date_keys.update(ifilter(dat_date.__contains__, keys) if retract else keys)
+
+            self.line_number += len(flags)
+            self.CheckDateMemory()
+            yield zip_lines
+
+    def CheckDateMemory(self):
+        """
+        Spills the values of the date file to disk if their estimated memory passes date_memory_budget.  Every
+        processed input line that is not skipped for the date file adds a value, so this costs nothing per line.
+
+        :return: Nothing
+        """
+        if self.date_memory_budget is None:
+            return
+        number_values = self.line_number - self.skipped_date - self.date_values_spilled
+        if len(self.dat_date) * self.date_accumulator_class.GROUP_BYTES + \
+                number_values * self.date_accumulator_class.VALUE_BYTES > self.date_memory_budget:
+            self.SpillDates()
+
+    def SpillDates(self):
+        """
+        Writes the values of the date file to a sorted run on disk and empties dat_date.
+
+        :return: Nothing
+        """
+        dat_date = self.dat_date
+        self.date_spiller.WriteRun((id_write, date_key, dat_date[key].GetValues())
+                                   for id_write, date_key, key in self._SortDateKeys(dat_date))
+        self.date_values_spilled = self.line_number - self.skipped_date
+        self.dat_date = {}
+
+    def _SortDateKeys(self, date_keys):
+        """
+        Sorts keys of dat_date by the id string and then by YYYYMMDD.
+
+        Only the distinct ids are sorted as strings; each key is then replaced by the rank of its id packed with its
+        date (see helpers.PackKey), so that all the keys are ordered by a single numpy sort of integers.
+
+        :param date_keys: keys of dat_date [collection]
+        :return: list of tuples of id, date as YYYYMMDD and the key [list]
+        """
+        id_keys = self.id_codes.keys
+        id_ranks = np.empty(len(id_keys), dtype=np.int64)
+        id_ranks[sorted(xrange(len(id_keys)), key=id_keys.__getitem__)] = np.arange(len(id_keys))
+
+        keys = np.fromiter(date_keys, dtype=np.int64, count=len(date_keys))
+        id_codes, dates = np.divmod(keys, helpers.PACKED_KEY_SPACE)
+        order = np.argsort(id_ranks[id_codes] * helpers.PACKED_KEY_SPACE + dates)
+
+        return zip([id_keys[id_code] for id_code in id_codes[order].tolist()], dates[order].tolist(),
+                   keys[order].tolist())
+
+    def NumberGroups(self):
+        """
+        Returns the number of groups held in memory: recipients and zip codes, and recipients and dates (those that
+        were spilled to disk are not counted).
+
+        :return: tuple of the number of groups of the zip file and of the date file [tuple]
+        """
+        return len(self.dat_zip), len(self.dat_date)
+
+    def Flush(self):
+        """
+        Flushes the quarantine file of the rejections, if any.
+
+        :return: Nothing
+        """
+        if self.rejections is not None:
+            self.rejections.Flush()
+
+    def DetachFiles(self):
+        """
+        Drops the quarantine file of the rejections, if any, without writing to it, in a forked copy of the aggregator
+        that pickles it for a checkpoint (see checkpoint.Checkpointer): the parent shares the offset of the file and
+        goes on writing to it, so the size of the file at the last Flush is pickled instead.
+
+        :return: Nothing
+        """
+        if self.rejections is not None:
+            self.rejections.fid_quarantine = None
+
+    def Close(self):
+        """
+        Closes the quarantine file of the rejections, if any.
+
+        :return: Nothing
+        """
+        if self.rejections is not None:
+            self.rejections.Close()
+
+    def TrackDateChanges(self):
+        """
+        Starts recording the keys of dat_date that get contributions from now on, in changed_date_keys.
+
+        :return: Nothing
+        """
+        self.changed_date_keys = set()
+
+    def TrackNewGroups(self):
+        """
+        Starts recording the keys of the groups of dat_zip and dat_date that are created from now on, in new_zip_keys
+        and new_date_keys.  The caller empties the lists once it has used them.
+
+        :return: Nothing
+        """
+        self.new_zip_keys = []
+        self.new_date_keys = []
+
+    def IterateDateLines(self, date_keys=None):
+        """
+        Calculates the values for the date file and yields its lines in order of id and then by date.
+
+        If values were spilled to disk, they are merged with the values in memory and the runs are deleted once all
+        the lines have been yielded.
+
+        :param date_keys: only yield the lines of these keys of dat_date (e.g. changed_date_keys); None for all of
+                          them.  Not supported if values were spilled [iterable]
+        :return: generator of tuples of id, date as YYYYMMDD and the line for the medianvals_by_date.txt file
+                 [generator]
+        """
+        if self.date_spiller.number_runs > 0:
+            if date_keys is not None:
+                raise ValueError('The lines of some keys cannot be calculated once the values were spilled')
+            for date_line in self._IterateSpilledDateLines():
+                yield date_line
+            return
+
+        # Write in order of id and then by date: sort the packed keys by the id string and then by YYYYMMDD
+        date_list = self._SortDateKeys(self.dat_date if date_keys is None else date_keys)
+
+        # The values of the groups are collected, in order, in chunks of about DATE_CHUNK_VALUES values and the
+        # medians, totals and numbers of values of each chunk are calculated together
+        dat_date = self.dat_date
+        number_groups = len(date_list)
+        # there are only a few thousand distinct dates
+        date_strings = {}
+        chunk_start = 0
+        while chunk_start < number_groups:
+            chunk_values = array('l')
+            chunk_lengths = []
+            extend = chunk_values.extend
+            append = chunk_lengths.append
+            chunk_end = chunk_start
+            while chunk_end < number_groups and len(chunk_values) < DATE_CHUNK_VALUES:
+                values = dat_date[date_list[chunk_end][2]].GetValues()
+                extend(values)
+                append(len(values))
+                chunk_end += 1
+
+            # calculate the median, total, # values
+            trans_medians, trans_totals, trans_numbers = helpers.CalculateSegmentTransactionValues(
+                np.frombuffer(chunk_values, dtype=np.int_), chunk_lengths)
+
+            # create the output lines to write
+            for (id_write, date_key, _), trans_median, trans_total, trans_number in \
+                    izip(date_list[chunk_start:chunk_end], trans_medians.tolist(), trans_totals.tolist(),
+                         trans_numbers.tolist()):
+                date_str = date_strings.get(date_key)
+                if date_str is None:
+                    date_str = date_strings[date_key] = helpers.FormatTransactionDate(date_key)
+                yield id_write, date_key, helpers.CreateDateOutputString(id_write, date_str, trans_median,
+                                                                         trans_total, trans_number)
+            chunk_start = chunk_end
+
+    def _IterateSpilledDateLines(self):
+        """
+        Merges the runs of spilled values with the values in memory and yields the date file lines.
+
+        :return: generator of tuples of id, date as YYYYMMDD and the line for the medianvals_by_date.txt file
+                 [generator]
+        """
+        dat_date = self.dat_date
+        values_in_memory = ((id_write, date_key, value)
+                            for id_write, date_key, key in self._SortDateKeys(dat_date)
+                            for value in dat_date[key].GetValues())
+        try:
+            # the values of a recipient and date come one after the other
+            for (id_write, date_key), date_values in groupby(self.date_spiller.IterateValues(values_in_memory),
+                                                             itemgetter(0, 1)):
+                date_accumulator = self.date_accumulator_class()
+                for _, _, value in date_values:
+                    date_accumulator.ingest(value)
+                trans_median, trans_total, trans_number = date_accumulator.GetTransactionValues()
+
+                yield id_write, date_key, helpers.CreateDateOutputString(id_write,
+                                                                         helpers.FormatTransactionDate(date_key),
+                                                                         trans_median, trans_total, trans_number)
+        finally:
+            self.date_spiller.Remove()
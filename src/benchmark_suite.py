@@ -0,0 +1,275 @@
+"""
+Times the hot paths of find_political_donors_delta.py and compares the results against a saved baseline.  Unlike
+benchmark_median.py, this does not need a display or matplotlib.
+
+Benchmarks, each run on inputs of several numbers of lines:
+- parse_line: helpers.ParseLine on every line
+- parse_block: readers.ParseBlock on the whole input
+- validate_zip: helpers.CheckZipCode on every zip code
+- validate_date: helpers.CheckTransactionDate on every transaction date (the memoized dates are cleared first)
+- validate_zip_batch: helpers.CheckZipCodes on all the zip codes at once
+- validate_date_batch: helpers.ParseTransactionDates on all the transaction dates at once
+- ingest_<mode>: the running median, total and count of the zip file for every contribution, for each median mode
+  (window: the last WINDOW_SIZE contributions)
+- retract_deletable: the same for the deletable median mode, then every contribution is retracted again in input
+  order (see ContributionAggregator negative_as_retraction)
+- format_zip: helpers.CreateZipOutputString for every line
+- format_date: helpers.CreateDateOutputString for every line
+- full: find_political_donors_delta.main on the input, writing to a temporary directory
+- full_columns: the same with the input lines checked a block at a time (--validate columns)
+- build_cache: input_cache.BuildCache on the input
+- full_cached: find_political_donors_delta.main on the input with its cache (see input_cache.py), built beforehand
+
+The inputs are synthetic itcont.txt files of generate_itcont.py (with a seed), or lines drawn at random from a sample
+itcont.txt file given with --sample.
+
+How to use:
+    python benchmark_suite.py run --output results.json
+    python benchmark_suite.py compare baseline.json results.json
+compare prints the change of every benchmark and exits with status 1 if any of them is slower than the baseline by more
+than --threshold.
+
+"""
+import argparse, json, os, platform, random, shutil, sys, tempfile, time
+from itertools import izip
+
+# import my helpers
+import generate_itcont, helpers, input_cache, readers
+import find_political_donors_delta
+
+# Default numbers of input lines and number of times each benchmark is repeated (the fastest time is kept)
+SIZES = [10000, 100000]
+REPEAT = 3
+
+# Number of contributions in the window of ingest_window
+WINDOW_SIZE = 100
+
+# A benchmark is a regression if it takes more than this fraction longer than the baseline
+THRESHOLD = 0.1
+
+
+
+def CreateInput(number_lines, output_fullfilename, seed=0, sample_fullfilename=None):
+    """
+    Writes an input file, synthetic or drawn at random from the lines of a sample itcont.txt file.
+
+    :param number_lines: number of lines to write [int]
+    :param output_fullfilename: the input file to write [string]
+    :param seed: seed of the random draws [int]
+    :param sample_fullfilename: the sample file; None for a synthetic input [string]
+    :return: Nothing
+    """
+    if sample_fullfilename is None:
+        generate_itcont.GenerateFile(output_fullfilename, number_lines, seed=seed)
+        return
+    with open(sample_fullfilename, 'rb') as fid:
+        sample_lines = fid.readlines()
+    generator = random.Random(seed)
+    with open(output_fullfilename, 'wb') as fid:
+        fid.writelines(generator.choice(sample_lines) for _ in xrange(number_lines))
+
+
+def TimeFunction(function, repeat):
+    """
+    Runs a function several times.
+
+    :param function: function without arguments [function]
+    :param repeat: number of runs [int]
+    :return: the fastest run time in seconds [float]
+    """
+    run_times = []
+    for _ in xrange(repeat):
+        t_start = time.time()
+        function()
+        run_times.append(time.time() - t_start)
+    return min(run_times)
+
+
+def RunBenchmarks(input_fullfilename, repeat=REPEAT):
+    """
+    Runs every benchmark on an input file.
+
+    :param input_fullfilename: the input file [string]
+    :param repeat: number of times each benchmark is repeated [int]
+    :return: list of tuples of benchmark name and its fastest run time in seconds [list]
+    """
+    with open(input_fullfilename, 'rb') as fid:
+        block = fid.read()
+    lines = block.splitlines(True)
+    records = readers.ParseBlock(block)
+    zipcodes = [record[1][:5] for record in records]
+    dates = [record[2] for record in records]
+    amounts = [int(record[3]) for record in records if record[3].isdigit()]
+    # the groups of the running medians, by zip code
+    zip_groups = dict((zipcode, group) for group, zipcode in enumerate(set(zipcodes)))
+    groups = [zip_groups[zipcode] for zipcode, record in izip(zipcodes, records) if record[3].isdigit()]
+
+    def ValidateDates():
+        helpers.transaction_date_cache.clear()
+        for date in dates:
+            helpers.CheckTransactionDate(date)
+
+    def Ingest(median_mode):
+        def IngestMode():
+            zip_store = helpers.ZipStreamingStoreFactory(median_mode, window_size=WINDOW_SIZE)()
+            for _ in xrange(len(zip_groups)):
+                zip_store.NewGroup()
+            ingest = zip_store.ingest
+            for group, amount in izip(groups, amounts):
+                ingest(group, amount)
+        return IngestMode
+
+    def Retract():
+        zip_store = helpers.ZipStreamingStoreFactory('deletable')()
+        for _ in xrange(len(zip_groups)):
+            zip_store.NewGroup()
+        for group, amount in izip(groups, amounts):
+            zip_store.ingest(group, amount)
+        remove = zip_store.remove
+        for group, amount in izip(groups, amounts):
+            remove(group, amount)
+
+    def FormatZip():
+        for record in records:
+            helpers.CreateZipOutputString(250.5, 1000, 4, record[0], record[1][:5])
+
+    def FormatDate():
+        for record in records:
+            helpers.CreateDateOutputString(record[0], record[2], 250.5, 1000, 4)
+
+    def Full(cache_directory=None, validate_mode='records'):
+        output_folder = tempfile.mkdtemp()
+        stdout = sys.stdout
+        try:
+            # main reports its progress
+            sys.stdout = open(os.devnull, 'w')
+            find_political_donors_delta.main(input_fullfilename, os.path.join(output_folder, 'medianvals_by_zip.txt'),
+                                             os.path.join(output_folder, 'medianvals_by_date.txt'),
+                                             cache_directory=cache_directory, validate_mode=validate_mode)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+            shutil.rmtree(output_folder)
+
+    def BuildCache():
+        cache_directory = tempfile.mkdtemp()
+        try:
+            input_cache.BuildCache(input_fullfilename, cache_directory)
+        finally:
+            shutil.rmtree(cache_directory)
+
+    benchmarks = [('parse_line', lambda: [helpers.ParseLine(line) for line in lines]),
+                  ('parse_block', lambda: readers.ParseBlock(block)),
+                  ('validate_zip', lambda: [helpers.CheckZipCode(zipcode) for zipcode in zipcodes]),
+                  ('validate_date', ValidateDates),
+                  ('validate_zip_batch', lambda: helpers.CheckZipCodes(zipcodes)),
+                  ('validate_date_batch', lambda: helpers.ParseTransactionDates(dates))] + \
+                 [('ingest_' + median_mode, Ingest(median_mode)) for median_mode in
+                  ['exact', 'heap', 'approx', 'window', 'deletable']] + \
+                 [('retract_deletable', Retract),
+                  ('format_zip', FormatZip),
+                  ('format_date', FormatDate),
+                  ('full', Full),
+                  ('full_columns', lambda: Full(validate_mode='columns')),
+                  ('build_cache', BuildCache)]
+
+    results = [(name, TimeFunction(function, repeat)) for name, function in benchmarks]
+    cache_directory = tempfile.mkdtemp()
+    try:
+        input_cache.BuildCache(input_fullfilename, cache_directory)
+        results.append(('full_cached', TimeFunction(lambda: Full(cache_directory), repeat)))
+    finally:
+        shutil.rmtree(cache_directory)
+    return results
+
+
+def Run(sizes=SIZES, repeat=REPEAT, sample_fullfilename=None, seed=0):
+    """
+    Runs every benchmark on inputs of several sizes.
+
+    :param sizes: numbers of input lines [list]
+    :param repeat: number of times each benchmark is repeated [int]
+    :param sample_fullfilename: itcont.txt file the input lines are drawn from; None for synthetic inputs [string]
+    :param seed: seed of the random draws [int]
+    :return: the results, with the fastest time of each benchmark and size under 'benchmarks' [dict]
+    """
+    results = {'python': platform.python_version(), 'platform': platform.platform(),
+               'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'repeat': repeat, 'seed': seed,
+               'sample': sample_fullfilename, 'benchmarks': {}}
+    input_folder = tempfile.mkdtemp()
+    try:
+        for number_lines in sizes:
+            input_fullfilename = os.path.join(input_folder, 'itcont.txt')
+            CreateInput(number_lines, input_fullfilename, seed, sample_fullfilename)
+            for name, seconds in RunBenchmarks(input_fullfilename, repeat):
+                results['benchmarks']['{}/{}'.format(name, number_lines)] = {
+                    'seconds': seconds, 'lines': number_lines, 'lines_per_second': number_lines / seconds
+                    if seconds > 0 else None}
+                print('%-24s %10d lines %9.4f s' % (name, number_lines, seconds))
+    finally:
+        shutil.rmtree(input_folder)
+    return results
+
+
+def Compare(baseline, results, threshold=THRESHOLD):
+    """
+    Compares the times of the benchmarks that are in both the baseline and the results.
+
+    :param baseline: results of Run for the baseline [dict]
+    :param results: results of Run [dict]
+    :param threshold: fraction by which a benchmark can be slower than the baseline before it is a regression [float]
+    :return: list of tuples of benchmark name, baseline time, time, ratio of the times and whether it is a regression,
+             in order of name [list]
+    """
+    comparison = []
+    for name in sorted(set(baseline['benchmarks']) & set(results['benchmarks'])):
+        baseline_seconds = baseline['benchmarks'][name]['seconds']
+        seconds = results['benchmarks'][name]['seconds']
+        ratio = seconds / baseline_seconds if baseline_seconds > 0 else 1.0
+        comparison.append((name, baseline_seconds, seconds, ratio, ratio > 1 + threshold))
+    return comparison
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Times the hot paths of find_political_donors_delta.py.')
+    subparsers = parser.add_subparsers(dest='command')
+    parser_run = subparsers.add_parser('run', help='run the benchmarks')
+    parser_run.add_argument('--output', dest='output_fullfilename', help='write the results to this JSON file')
+    parser_run.add_argument('--sizes', default=','.join(map(str, SIZES)),
+                            help='comma separated numbers of input lines (default: %(default)s)')
+    parser_run.add_argument('--repeat', type=int, default=REPEAT,
+                            help='number of times each benchmark is repeated; the fastest time is kept '
+                                 '(default: %(default)s)')
+    parser_run.add_argument('--sample', dest='sample_fullfilename',
+                            help='itcont.txt file the input lines are drawn from (default: synthetic inputs of '
+                                 'generate_itcont.py)')
+    parser_run.add_argument('--seed', type=int, default=0, help='seed of the random draws (default: %(default)s)')
+    parser_compare = subparsers.add_parser('compare', help='compare results against a baseline')
+    parser_compare.add_argument('baseline_fullfilename', help='JSON file of the baseline')
+    parser_compare.add_argument('results_fullfilename', help='JSON file of the results')
+    parser_compare.add_argument('--threshold', type=float, default=THRESHOLD,
+                                help='fraction by which a benchmark can be slower than the baseline '
+                                     '(default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        results = Run([int(size) for size in args.sizes.split(',')], args.repeat, args.sample_fullfilename,
+                      args.seed)
+        if args.output_fullfilename is not None:
+            with open(args.output_fullfilename, 'wb') as fid:
+                json.dump(results, fid, indent=2, sort_keys=True)
+            print('Results written to: {}'.format(args.output_fullfilename))
+    else:
+        with open(args.baseline_fullfilename, 'rb') as fid:
+            baseline = json.load(fid)
+        with open(args.results_fullfilename, 'rb') as fid:
+            results = json.load(fid)
+        comparison = Compare(baseline, results, args.threshold)
+        for name, baseline_seconds, seconds, ratio, regression in comparison:
+            print('%-32s %9.4f s %9.4f s %+7.1f%% %s' % (name, baseline_seconds, seconds, (ratio - 1) * 100,
+                                                        'REGRESSION' if regression else ''))
+        number_regressions = sum(regression for _, _, _, _, regression in comparison)
+        print('{} of {} benchmarks regressed by more than {:.0%}'.format(number_regressions, len(comparison),
+                                                                        args.threshold))
+        sys.exit(1 if number_regressions else 0)
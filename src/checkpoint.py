@@ -0,0 +1,199 @@
+"""
+Checkpoints of an aggregation in progress, so that find_political_donors_delta.py can resume after a crash instead of
+processing the input again from the first line.
+
+A checkpoint holds the aggregator (with the running median states of the zip file and the accumulators of the date
+file), the byte offset of the first input line that has not been processed and the size of the zip file at that point.
+It is written to a temporary file that is then renamed over the previous checkpoint, so there is always a complete
+checkpoint on disk even if the process dies while writing one.
+
+Pickling the aggregator takes time in proportion to its size (seconds for millions of groups), so Checkpointer writes
+the checkpoints in a forked process: the child has a copy-on-write image of the aggregator at the time of the fork,
+which it pickles while the parent carries on with the input.  The parent only pays for the fork (copying its page
+tables) and, while the child is writing, for the copies of the memory pages it changes.  A new checkpoint is not due
+until the child has finished the previous one.  Without os.fork (Windows), the checkpoints are written in the process.
+
+The same kind of file holds the state at the end of a run for the incremental mode, in which a later run only processes
+the lines appended to the input since then.  It also holds a fingerprint of the input lines that were processed (see
+FingerprintPrefix) to make sure they have not changed.
+
+"""
+import cPickle, hashlib, os, time, traceback
+
+# Number of samples of the input file and number of bytes in each sample used by FingerprintPrefix
+FINGERPRINT_SAMPLES = 16
+FINGERPRINT_SAMPLE_SIZE = 1 << 16
+
+
+def SaveState(state_fullfilename, state):
+    """
+    Pickles a state to a temporary file and renames it over state_fullfilename.
+
+    :param state_fullfilename: file holding the state [string]
+    :param state: the state [dict]
+    :return: Nothing
+    """
+    temporary_fullfilename = state_fullfilename + '.tmp'
+    with open(temporary_fullfilename, 'wb') as fid:
+        cPickle.dump(state, fid, cPickle.HIGHEST_PROTOCOL)
+        fid.flush()
+        os.fsync(fid.fileno())
+    os.rename(temporary_fullfilename, state_fullfilename)
+
+
+def LoadState(state_fullfilename):
+    """
+    Reads a state saved with SaveState.
+
+    :param state_fullfilename: file holding the state [string]
+    :return: the state or None if there is no state file [dict]
+    """
+    if not os.path.exists(state_fullfilename):
+        return None
+    with open(state_fullfilename, 'rb') as fid:
+        return cPickle.load(fid)
+
+
+def FingerprintPrefix(input_fullfilename, length):
+    """
+    Hashes the length and FINGERPRINT_SAMPLES evenly spaced samples of the first length bytes of a file, the last one
+    ending at length.  This is cheap for files of any size and catches a file that was replaced or rewritten rather
+    than appended to, although not a change that falls between the samples.
+
+    :param input_fullfilename: the file [string]
+    :param length: number of bytes at the start of the file [int]
+    :return: the fingerprint, or None if the file has less than length bytes [string]
+    """
+    fingerprint = hashlib.sha1(str(length))
+    with open(input_fullfilename, 'rb') as fid:
+        if os.fstat(fid.fileno()).st_size < length:
+            return None
+        if length <= FINGERPRINT_SAMPLES * FINGERPRINT_SAMPLE_SIZE:
+            fingerprint.update(fid.read(length))
+        else:
+            spacing = (length - FINGERPRINT_SAMPLE_SIZE) // (FINGERPRINT_SAMPLES - 1)
+            for sample in xrange(FINGERPRINT_SAMPLES):
+                fid.seek(length - FINGERPRINT_SAMPLE_SIZE if sample == FINGERPRINT_SAMPLES - 1 else sample * spacing)
+                fingerprint.update(fid.read(FINGERPRINT_SAMPLE_SIZE))
+    return fingerprint.hexdigest()
+
+
+class Checkpointer(object):
+    """
+        Decides when a checkpoint is due and writes it.
+
+        How to use: call Due(line_number) after every block of input lines and Save(...) when it returns True; Load()
+        returns the last checkpoint (or None) and Remove() deletes it once the run has finished.  Wait() waits for the
+        checkpoint being written, if any.
+
+    """
+
+    def __init__(self, checkpoint_fullfilename, checkpoint_lines=None, checkpoint_seconds=None, background=True):
+        """
+        :param checkpoint_fullfilename: file holding the checkpoint [string]
+        :param checkpoint_lines: write a checkpoint once this many input lines were processed since the last one; None
+                                 for no limit [int]
+        :param checkpoint_seconds: write a checkpoint once this many seconds have passed since the last one; None for
+                                   no limit [float]
+        :param background: write the checkpoints in a forked process, if os.fork is available [bool]
+        """
+        self.checkpoint_fullfilename = checkpoint_fullfilename
+        self.checkpoint_lines = checkpoint_lines if checkpoint_lines is not None else float('inf')
+        self.checkpoint_seconds = checkpoint_seconds if checkpoint_seconds is not None else float('inf')
+        self.background = background and hasattr(os, 'fork')
+
+        self.line_number_saved = 0
+        self.time_saved = time.time()
+        # the process writing the last checkpoint, None once it has finished
+        self.writer_pid = None
+
+    def Due(self, line_number):
+        """
+        :param line_number: number of input lines processed so far [int]
+        :return: whether a checkpoint should be written; never while the last one is still being written [bool]
+        """
+        if self.writer_pid is not None and not self._Reap(wait=False):
+            return False
+        return line_number - self.line_number_saved >= self.checkpoint_lines or \
+            time.time() - self.time_saved >= self.checkpoint_seconds
+
+    def Save(self, aggregator, input_offset, zip_position):
+        """
+        Writes a checkpoint, replacing the previous one, in a forked process if background is set.  The files the
+        aggregator writes to (the quarantine file) are flushed first, so the child has nothing of them to write.
+
+        :param aggregator: the aggregator [ContributionAggregator]
+        :param input_offset: byte offset of the first input line that has not been processed [int]
+        :param zip_position: size of the zip file, with everything written up to input_offset [int]
+        :return: Nothing
+        """
+        self.Wait()
+        state = {'aggregator': aggregator, 'input_offset': input_offset, 'zip_position': zip_position}
+        if self.background:
+            aggregator.Flush()
+            pid = os.fork()
+            if pid == 0:
+                # the child must not run the cleanup of the parent, or flush its buffers, on its way out
+                status = 0
+                try:
+                    aggregator.DetachFiles()
+                    SaveState(self.checkpoint_fullfilename, state)
+                except BaseException:
+                    traceback.print_exc()
+                    status = 1
+                os._exit(status)
+            self.writer_pid = pid
+        else:
+            SaveState(self.checkpoint_fullfilename, state)
+
+        self.line_number_saved = aggregator.line_number
+        self.time_saved = time.time()
+
+    def _Reap(self, wait):
+        """
+        Checks whether the process writing the last checkpoint has finished.
+
+        :param wait: wait for it to finish [bool]
+        :return: whether it has finished [bool]
+        :raises RuntimeError: if it failed to write the checkpoint
+        """
+        pid, status = os.waitpid(self.writer_pid, 0 if wait else os.WNOHANG)
+        if pid == 0:
+            return False
+        self.writer_pid = None
+        if status != 0:
+            raise RuntimeError('Writing the checkpoint {} failed with status {}'.format(self.checkpoint_fullfilename,
+                                                                                      status))
+        return True
+
+    def Wait(self):
+        """
+        Waits for the checkpoint being written, if any.
+
+        :return: Nothing
+        :raises RuntimeError: if it failed to write the checkpoint
+        """
+        if self.writer_pid is not None:
+            self._Reap(wait=True)
+
+    def Load(self):
+        """
+        Reads the last checkpoint, once it is written.
+
+        :return: dict with the aggregator, input_offset and zip_position or None if there is no checkpoint [dict]
+        """
+        self.Wait()
+        state = LoadState(self.checkpoint_fullfilename)
+        if state is not None:
+            self.line_number_saved = state['aggregator'].line_number
+        return state
+
+    def Remove(self):
+        """
+        Deletes the checkpoint, if any, once it is written.
+
+        :return: Nothing
+        """
+        self.Wait()
+        if os.path.exists(self.checkpoint_fullfilename):
+            os.remove(self.checkpoint_fullfilename)
@@ -5,155 +5,481 @@
     This is third version of my script.
     - Uses a running median calculator that uses min heaps.
     - speeding up parsing
+    - the running median for the zip file counts the distinct contribution values instead of storing every value
+    - optional approximate median with bounded memory (--median-mode=approx)
+    - the date file values are held in compact accumulators (typed arrays by default, --date-mode)
+    - the input is memory mapped and parsed in large blocks (--reader)
+
+    - the running medians of all the recipients and zip codes are held in typed arrays (helpers.ZipStreamingStore)
+    - optional sharding of the work over several processes (--workers)
+    - optional statistics on the rejected entries and quarantine file (--rejections, --quarantine)
+    - the output lines are buffered and written in large chunks (--flush-bytes, --flush-records, --flush-seconds)
+    - optional checkpoints of the aggregation to resume after a crash (--checkpoint, --resume)
+    - optional incremental mode that only processes the lines appended to the input since the last run (--state)
+    - optional memory budget for the date file values, which are spilled to disk past it (--date-memory)
+    - optional breakdown of the time of every stage of the run (--profile)
+    - optional export of the progress to a Prometheus or JSON lines file (--metrics)
+    - reads .zip, .gz, .bz2 and .xz inputs directly, decompressing them in a thread
+    - streaming mode that reads the records from the standard input or a socket as they arrive (input '-', 'unix:PATH'
+      or 'tcp:[HOST:]PORT') and reports the latency of the zip file lines
+    - optional HTTP server answering queries over the current values by recipient, zip code and date during the run
+      and after it (--serve)
+    - optional columnar cache of the parsed and validated input, so that later runs on the same input skip the
+      parsing and the checks (--cache)
 
 """
-import sys, time
-import numpy as np
+import argparse, os, signal, time
 
 # import my helpers
-import helpers
+import checkpoint, helpers, input_cache, metrics, profiler, query_server, readers, streaming, writers
+from aggregator import ContributionAggregator
+from parallel import ShardedAggregator
 
 line_number_display = 50000000000
 
-def main(input_fullfilename, zip_fullfilename, date_fullfilename):
+# Default number of input lines between checkpoints
+CHECKPOINT_LINES = 5000000
+
+def main(input_fullfilename, zip_fullfilename, date_fullfilename, median_mode='exact', median_error=0.01,
+         date_mode=None, reader_mode='mmap', number_workers=1, rejections=False, quarantine_fullfilename=None,
+         flush_bytes=writers.FLUSH_BYTES, flush_records=None, flush_seconds=None, checkpoint_fullfilename=None,
+         checkpoint_lines=None, checkpoint_seconds=None, resume=False, state_fullfilename=None,
+         date_memory=None, spill_directory=None, profile=False, profile_interval=profiler.SAMPLE_INTERVAL,
+         profile_fullfilename=None, metrics_fullfilename=None, metrics_format='prometheus',
+         metrics_seconds=metrics.METRICS_SECONDS, serve_address=None, cache_directory=None, validate_mode='records',
+         window_size=None, window_days=None, negative_as_retraction=False):
 
     # A report in the terminal at this interval.
     DISPLAY_INTERVAL = 100000
 
-    # create data structures for storing values for the zip and date files
-    dat_zip = {}
-    dat_date = {}
-
-    # create data structures for benchmarking
-    benchmarking_line_number = []
-    benchmarking_time = []
-    benchmarking_skipped_zip = 0
-    benchmarking_skipped_date = 0
-
-    line_number = 0
+    # creates the store that calculates the running median, total and count for the zip file
+    # (over a window of the last contributions or days of each recipient and zip code for median_mode='window')
+    zip_store_factory = helpers.ZipStreamingStoreFactory(median_mode, median_error, window_size, window_days)
+    # and the class holding the contribution values for the date file; a refund is removed from the counts of the
+    # values in O(1), while the arrays and lists would search for it
+    if date_mode is None:
+        date_mode = 'frequency' if negative_as_retraction else 'array'
+    date_accumulator_class = helpers.DateAccumulatorFactory(date_mode)
+
+    # Records the reasons for rejecting entries, if requested
+    rejection_accounting = None
+    if rejections or quarantine_fullfilename is not None:
+        rejection_accounting = helpers.RejectionAccounting(quarantine_fullfilename)
+
+    # The values of the date file are spilled to disk past this number of bytes, if requested
+    date_memory_budget = None
+    if date_memory is not None:
+        if state_fullfilename is not None:
+            raise ValueError('The incremental mode is not supported with a memory budget for the date file')
+        date_memory_budget = int(date_memory * (1 << 20))
+
+    # The refunds retract earlier contributions, if requested; the values of both files must then be removable
+    if negative_as_retraction:
+        if median_mode != 'deletable' or date_mode != 'frequency':
+            raise ValueError('The retractions need the deletable median mode and the frequency date mode')
+        if date_memory_budget is not None:
+            raise ValueError('The retractions are not supported with a memory budget for the date file')
+
+    # Times the stages of the run, if requested; the report is also printed on SIGUSR1
+    stage_profiler = None
+    if profile or profile_fullfilename is not None:
+        if number_workers > 1:
+            raise ValueError('Profiling is not supported with more than one worker')
+        stage_profiler = profiler.StageProfiler(profile_interval)
+
+        def PrintProfile(signal_number, frame):
+            print(stage_profiler.GetReport())
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, PrintProfile)
+
+    # In the streaming mode, the records are read from the standard input or a socket as they arrive, and by default
+    # every line of the zip file is written out right away
+    stream = streaming.IsStream(input_fullfilename)
+    zip_flush_records = flush_records
+    if stream:
+        if number_workers > 1 or checkpoint_fullfilename is not None or state_fullfilename is not None:
+            raise ValueError('The streaming mode is not supported with workers, checkpoints or the incremental mode')
+        if flush_records is None and flush_seconds is None:
+            zip_flush_records = 1
+
+    # Checkpoints of the aggregation, if requested; the state of the workers cannot be saved
+    checkpointer = None
+    if checkpoint_fullfilename is not None:
+        if number_workers > 1:
+            raise ValueError('Checkpoints are not supported with more than one worker')
+        checkpointer = checkpoint.Checkpointer(checkpoint_fullfilename, checkpoint_lines, checkpoint_seconds)
+    state = checkpointer.Load() if checkpointer is not None and resume else None
+    if state is not None:
+        print('Resuming from line {} of the checkpoint'.format(state['aggregator'].line_number))
+
+    # Compressed inputs are decompressed as they are read
+    compression = readers.GetCompression(input_fullfilename) if not stream else None
+
+    # In the incremental mode, the state of the last run is used if the input still starts with the lines it processed
+    if state_fullfilename is not None:
+        if number_workers > 1:
+            raise ValueError('The incremental mode is not supported with more than one worker')
+        if compression is not None:
+            raise ValueError('The incremental mode is not supported with a compressed input')
+        if state is None:
+            state = checkpoint.LoadState(state_fullfilename)
+            if state is None:
+                print('No state of a previous run; processing all of the input')
+            elif checkpoint.FingerprintPrefix(input_fullfilename, state['input_offset']) != state['fingerprint']:
+                print('The input does not start with the lines processed by the last run; processing all of it')
+                state = None
+            else:
+                print('Continuing from line {} of the last run'.format(state['aggregator'].line_number))
+                state['aggregator'].TrackDateChanges()
+
+    # Only the changed lines of the date file are calculated when continuing the last run of the incremental mode
+    incremental = state is not None and state['aggregator'].changed_date_keys is not None
+
+    # The aggregator holds the values for the zip and date files and creates the output lines
+    if state is not None:
+        aggregator = state['aggregator']
+        rejection_accounting = aggregator.rejections
+        # the new groups are only tracked for the query server of this run
+        aggregator.new_zip_keys = aggregator.new_date_keys = None
+    elif number_workers > 1:
+        aggregator = ShardedAggregator(number_workers, zip_store_factory, date_accumulator_class,
+                                       rejection_accounting, date_memory_budget, spill_directory,
+                                       negative_as_retraction)
+    else:
+        aggregator = ContributionAggregator(zip_store_factory, date_accumulator_class, rejection_accounting,
+                                            date_memory_budget, spill_directory, negative_as_retraction)
+
+    # Answers queries over the current values of the aggregation during the run and after it, if requested; the
+    # values have to be in this process and in memory
+    server = None
+    if serve_address is not None:
+        if number_workers > 1 or date_memory_budget is not None:
+            raise ValueError('The query server is not supported with more than one worker or a memory budget for the '
+                             'date file')
+        server = query_server.QueryServer(serve_address, aggregator)
+        server.Start()
+        print('Serving queries on {}'.format(serve_address))
+
+    # The parsed and validated input is read from its columnar cache, which is built first if there is none; the
+    # rejections are not in the cache
+    cache = None
+    if cache_directory is not None:
+        if stream or number_workers > 1 or state_fullfilename is not None or rejection_accounting is not None or \
+                stage_profiler is not None:
+            raise ValueError('The cache is not supported with the streaming mode, workers, the incremental mode, '
+                             'rejections or profiling')
+        cache = input_cache.OpenCache(cache_directory, input_fullfilename)
+
+    # The input lines are checked a block at a time with numpy operations, if requested; the rejections are not
+    # recorded
+    if validate_mode not in ['records', 'columns']:
+        raise ValueError('Unknown validation mode: {}'.format(validate_mode))
+    validate_columns = validate_mode == 'columns' and cache is None
+    if validate_columns and (stream or number_workers > 1 or rejection_accounting is not None or
+                             stage_profiler is not None):
+        raise ValueError('The validation of columns is not supported with the streaming mode, workers, rejections or '
+                         'profiling')
+
+    # The reader hands us the parsed input lines in large blocks, starting after the checkpoint if we resume
+    input_offset = state['input_offset'] if state is not None else 0
+    if cache is not None:
+        reader = input_cache.CachedBlockReader(cache, start_offset=input_offset)
+    elif stream:
+        # an empty block when the stream is idle lets the zip file lines be written out on time
+        reader = streaming.StreamReader(input_fullfilename, idle_seconds=flush_seconds, profiler=stage_profiler)
+    else:
+        if compression is not None:
+            reader = readers.CompressedBlockReader(input_fullfilename, start_offset=input_offset,
+                                                   profiler=stage_profiler)
+        else:
+            # in the incremental mode, a last line that is still being written is left for the next run
+            reader = readers.ReaderFactory(reader_mode)(input_fullfilename, start_offset=input_offset,
+                                                        profiler=stage_profiler,
+                                                        complete_lines=state_fullfilename is not None)
+        if validate_columns:
+            reader = readers.ValidatedBlockReader(reader)
+
+    # The latency of the zip file lines in the streaming mode, from the time their input lines were read until they
+    # are written out; pending_latencies holds the read time and number of the lines that are not written out yet
+    latency_recorder = streaming.LatencyRecorder() if stream else None
+    pending_latencies = []
+
+    # When resuming or continuing the last run, the zip file continues from its size at that point
+    if state is not None:
+        fid_zip = open(zip_fullfilename, 'r+b', 0)
+        fid_zip.truncate(state['zip_position'])
+        fid_zip.seek(state['zip_position'])
+    else:
+        fid_zip = open(zip_fullfilename, 'wb', 0)
+
+    # Exports the progress for schedulers and dashboards, if requested
+    metrics_exporter = None
+    if metrics_fullfilename is not None:
+        # the size of a compressed input or a stream is not known until the end (unless it is in the cache), so
+        # there is no estimated time remaining
+        if cache is not None:
+            total_bytes = cache.input_bytes
+        elif compression is None and not stream:
+            total_bytes = os.path.getsize(input_fullfilename)
+        else:
+            total_bytes = None
+        metrics_exporter = metrics.MetricsExporter(metrics_fullfilename, metrics_format, metrics_seconds, total_bytes,
+                                                   input_offset, aggregator.line_number)
+
+    # the line number and time of the last progress report
+    report_line_number = aggregator.line_number
     t_start = time.time()
+    report_time = t_start
 
     # This this structure to prevent lingering opened files if something should fail
     # at the wrong/right spot
-    with open(input_fullfilename, 'rb') as fid:
-
-        # Open once to save time
-        with open(zip_fullfilename, 'wb') as fid_zip:
-
-            # Iterate over input lines ("stream the data in")
-            for lineIn in fid:
-
-                # Display progress report
-                if line_number % DISPLAY_INTERVAL == 0:
-                    report_index = line_number / DISPLAY_INTERVAL
-                    benchmarking_line_number.append(line_number)
-                    benchmarking_time.append(time.time())
-
-                    if report_index > 0:
-                        t_diff = benchmarking_time[report_index] - benchmarking_time[report_index-1]
-                        print('Line %d, time elapsed: %3.3f, time since last report: %3.3f, rate: %3.3f Hz' %(line_number, \
-                                benchmarking_time[report_index] - t_start, t_diff, DISPLAY_INTERVAL/t_diff))
-
-                # Parse the input line to id, zip code, date, amount and other id
-                id,zipcode,dt,amt,other_id = helpers.ParseLine(lineIn)
-
-                # we don't need the full zip code
-                zipcode = zipcode[:5]
-
-                # Considerations #1 and 5
-                # - We could this split this so that we can acquire some statistics on entry rejections
-                if (other_id != '') or (id == '') or (amt == ''):
-                    line_number += 1
-                    benchmarking_skipped_zip += 1
-                    benchmarking_skipped_date += 1
-                    continue
-                else:
-                    # see if the zip code is valid, and if the date valid
-                    process_mask = [helpers.CheckZipCode(zipcode), helpers.CheckTransactionDate(dt)]
-
-                # Check if we can process for zip file
-                if process_mask[0]:
-                    # see if we are encountering this id for the first time
-                    if id not in dat_zip:
-                        dat_zip[id] = {}
-
-                    # Determine if this is the first time we are encountering this zip code for this id. If so, then
-                    # create the ZipStreaming instance which will track the transaction values and give
-                    # us the values we need to write to file.
-                    if zipcode not in dat_zip[id]:
-                        dat_zip[id][zipcode] = helpers.ZipStreaming()
-
-                    # Now we are ready to the transaction amount to the list
-                    trans_median, trans_total, trans_number = dat_zip[id][zipcode].ingest(int(amt))
-
-                    # Create the line to write to file
-                    lineOut = helpers.CreateZipOutputString(trans_median, trans_total, trans_number, id, zipcode)
-                    # write to file
-                    fid_zip.write(lineOut)
-                else:
-                    benchmarking_skipped_zip += 1
-
-
-                # Check to see if we can process for the date file
-                if process_mask[1]:
-                    # Determine if we are encountering this id for the first time
-                    if id not in dat_date:
-                        dat_date[id] = {}
-
-                    # See if this is the first time we are encountering this date, for this id
-                    if dt not in dat_date[id]:
-                        dat_date[id][dt] = []
-
-                    # Now we are ready to the transaction amount to the list
-                    dat_date[id][dt].append(int(amt))
-                else:
-                    benchmarking_skipped_date += 1
-
-                line_number += 1
+    # Open once to save time
+    # The files are unbuffered since the writers collect the lines and write them in large chunks
+    with fid_zip, \
+            writers.BufferedLineWriter(fid_zip, flush_bytes, zip_flush_records, flush_seconds) as zip_writer:
+
+        # Iterate over blocks of input lines ("stream the data in")
+        # the query server holds its lock while a block is aggregated
+        blocks = server.LockBlocks(reader) if server is not None else reader
+        if cache is not None:
+            zip_line_blocks = aggregator.ProcessColumnBlocks(blocks, cache.id_keys, cache.zip_keys)
+        elif validate_columns:
+            zip_line_blocks = aggregator.ProcessColumnBlocks(blocks, reader.id_keys, reader.zip_keys)
+        else:
+            zip_line_blocks = aggregator.ProcessBlocks(blocks, stage_profiler)
+        for zip_lines in zip_line_blocks:
+
+            # write to file
+            if stage_profiler is not None:
+                t_write = time.time()
+                flushed = zip_writer.writelines(zip_lines)
+                stage_profiler.Add('format_write', time.time() - t_write)
+            else:
+                flushed = zip_writer.writelines(zip_lines)
+
+            if latency_recorder is not None:
+                if zip_lines:
+                    pending_latencies.append((reader.block_time, len(zip_lines)))
+                if flushed:
+                    t_flushed = time.time()
+                    for block_time, number_lines in pending_latencies:
+                        latency_recorder.Add(t_flushed - block_time, number_lines)
+                    del pending_latencies[:]
+
+            # Save a checkpoint once the zip file has everything up to the end of the block
+            if checkpointer is not None and checkpointer.Due(aggregator.line_number):
+                zip_writer.flush()
+                checkpointer.Save(aggregator, reader.offset, fid_zip.tell())
+
+            # Display progress report
+            line_number = aggregator.line_number
+            if line_number - report_line_number >= DISPLAY_INTERVAL:
+                t_now = time.time()
+                t_diff = t_now - report_time
+                print('Line %d, time elapsed: %3.3f, time since last report: %3.3f, rate: %3.3f Hz' %(line_number, \
+                        t_now - t_start, t_diff, (line_number - report_line_number)/t_diff))
+                report_line_number = line_number
+                report_time = t_now
+
+            if metrics_exporter is not None and metrics_exporter.Due():
+                metrics_exporter.Export(aggregator, reader.offset)
+
+    aggregator.Close()
+    if metrics_exporter is not None:
+        metrics_exporter.Export(aggregator, reader.offset)
+    if latency_recorder is not None:
+        # the lines written out when the zip file was closed
+        t_flushed = time.time()
+        for block_time, number_lines in pending_latencies:
+            latency_recorder.Add(t_flushed - block_time, number_lines)
+        print('Latency of the zip file lines: {}'.format(latency_recorder.GetReport()))
 
     # print summary fo number of entries skipped
-    print('zip file - number of entries skipped: {}'.format(benchmarking_skipped_zip))
-    print('date file - number of entries skipped: {}'.format(benchmarking_skipped_date))
+    print('zip file - number of entries skipped: {}'.format(aggregator.skipped_zip))
+    print('date file - number of entries skipped: {}'.format(aggregator.skipped_date))
+    if aggregator.negative_as_retraction:
+        print('zip file - number of contributions retracted: {}'.format(aggregator.retracted_zip))
+        print('date file - number of contributions retracted: {}'.format(aggregator.retracted_date))
+    if rejection_accounting is not None:
+        print('Rejected entries by reason:')
+        print(rejection_accounting.GetReport())
 
     # Now process the date file
     print('Writing: {}'.format(date_fullfilename))
-    with open(date_fullfilename, 'wb') as fid_dt:
-
-        # Write in order of id and then by date so that we get the list of ids and sort them
-        id_list = dat_date.keys()
-        id_list.sort()
-
-        for id_write_index, id_write in enumerate(id_list):
-
-            # get all the dates for a particular id and sort them
-            date_list = dat_date[id_write].keys()
-
-            # Convert to epoch times and get the array of indices for sorting it.
-            epoch_list = [helpers.ConvertTransactionDateToEpochGM(dtt) for dtt in date_list]
-            date_list_arg_sort  = np.argsort(epoch_list)
-
-            # iterate in descending time order for a particular id
-            for index_ordered in date_list_arg_sort:
-
-                date_str = date_list[index_ordered]
-                # calculate the median, total, # values
-                trans_median, trans_total, trans_number = \
-                    helpers.CalculateTransactionValues(dat_date[id_write][date_str])
-
-                # create the output line to write
-                lineOut = helpers.CreateDateOutputString(id_write, date_str, trans_median, trans_total, trans_number)
-
-                # write to file
-                fid_dt.write(lineOut)
+    t_date = time.time()
+    if incremental:
+        # merge the changed lines into the date file of the last run, writing to a temporary file
+        print('Number of changed date file lines: {}'.format(len(aggregator.changed_date_keys)))
+        fid_date_last = open(date_fullfilename, 'rb')
+        date_lines = helpers.MergeDateLines(fid_date_last, aggregator.IterateDateLines(aggregator.changed_date_keys))
+        date_output_fullfilename = date_fullfilename + '.tmp'
+    else:
+        date_lines = (lineOut for _, _, lineOut in aggregator.IterateDateLines())
+        date_output_fullfilename = date_fullfilename
+    with open(date_output_fullfilename, 'wb', 0) as fid_dt, \
+            writers.BufferedLineWriter(fid_dt, flush_bytes, flush_records, flush_seconds) as date_writer:
+
+        # The lines come in order of id and then by date
+        number_date_lines = 0
+        for number_date_lines, lineOut in enumerate(date_lines, 1):
+
+            # write to file
+            date_writer.write(lineOut)
+
+            if metrics_exporter is not None and not number_date_lines % metrics.DATE_LINES_CHECK and \
+                    metrics_exporter.Due():
+                metrics_exporter.Export(aggregator, reader.offset, date_lines=number_date_lines)
+    if incremental:
+        fid_date_last.close()
+        os.rename(date_output_fullfilename, date_fullfilename)
+
+    if stage_profiler is not None:
+        stage_profiler.Add('date_write', time.time() - t_date)
+
+    # Save the state for the next run of the incremental mode, with a fingerprint of the lines processed so far
+    if state_fullfilename is not None:
+        aggregator.changed_date_keys = None
+        checkpoint.SaveState(state_fullfilename,
+                             {'aggregator': aggregator, 'input_offset': reader.offset,
+                              'zip_position': os.path.getsize(zip_fullfilename),
+                              'fingerprint': checkpoint.FingerprintPrefix(input_fullfilename, reader.offset)})
+
+    # The run is complete so there is nothing to resume from
+    if checkpointer is not None:
+        checkpointer.Remove()
+
+    if metrics_exporter is not None:
+        metrics_exporter.Export(aggregator, reader.offset, done=True, date_lines=number_date_lines)
+
+    if stage_profiler is not None:
+        stage_profiler.Stop()
+        print('Time by stage:')
+        print(stage_profiler.GetReport())
+        if profile_fullfilename is not None:
+            stage_profiler.WriteResults(profile_fullfilename)
     print('All done.')
 
-if __name__ == '__main__':
+    if server is not None:
+        server.done = True
+        print('Serving queries on {} until interrupted'.format(serve_address))
+        server.Wait()
 
-    if len(sys.argv) != 4:
-        print('Missing arguments.')
-        exit
-    input_fullfilename = sys.argv[1]
-    zip_fullfilename = sys.argv[2]
-    date_fullfilename = sys.argv[3]
+if __name__ == '__main__':
 
-    main(input_fullfilename, zip_fullfilename, date_fullfilename)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Creates the medianvals_by_zip.txt and medianvals_by_date.txt files.')
+    parser.add_argument('input_fullfilename',
+                        help='the itcont.txt input file; .zip, .gz, .bz2 and .xz files are decompressed as they are '
+                             'read (.xz needs the lzma module). In the streaming mode, - for the standard input or '
+                             'unix:PATH or tcp:[HOST:]PORT to listen on a socket for a connection; the lines of the '
+                             'zip file are then written out one by one unless --flush-records or --flush-seconds '
+                             'is given')
+    parser.add_argument('zip_fullfilename', help='the medianvals_by_zip.txt output file')
+    parser.add_argument('date_fullfilename', help='the medianvals_by_date.txt output file')
+    parser.add_argument('--median-mode', choices=['exact', 'heap', 'approx', 'window', 'deletable'], default='exact',
+                        help='how the running median of the zip file is calculated; approx uses a fixed-size sketch '
+                             'per recipient and zip code whose median is within --median-error of the exact value; '
+                             'window gives the median, total and number of the contributions in a sliding window of '
+                             '--window-contributions or --window-days of each recipient and zip code; deletable '
+                             'keeps the contributions in a skiplist that they can be removed from (for '
+                             '--negative-as-retraction)')
+    parser.add_argument('--median-error', type=float, default=0.01,
+                        help='relative error of the median for --median-mode=approx (default: 0.01)')
+    parser.add_argument('--window-contributions', dest='window_size', type=int,
+                        help='for --median-mode=window, the number of last contributions in the window')
+    parser.add_argument('--window-days', type=int,
+                        help='for --median-mode=window, the number of days in the window, up to the latest '
+                             'TRANSACTION_DT of the recipient and zip code; the contributions without a valid date are '
+                             'then not used for the zip file')
+    parser.add_argument('--negative-as-retraction', action='store_true',
+                        help='an entry with a negative TRANSACTION_AMT is a refund that retracts a contribution of the '
+                             'same amount of its recipient and zip code and of its recipient and date; a refund '
+                             'without a matching contribution is skipped. Needs --median-mode=deletable and '
+                             '--date-mode=frequency (the default then); not supported with --date-memory')
+    parser.add_argument('--date-mode', choices=['array', 'frequency', 'list'],
+                        help='how the contribution values of the date file are held until the end: typed arrays, '
+                             'counts of distinct values or python lists (default: array, or frequency with '
+                             '--negative-as-retraction, which needs it)')
+    parser.add_argument('--reader', choices=['mmap', 'lines'], default='mmap',
+                        help='memory map the input and parse it in blocks, or read it line by line (default: mmap); '
+                             'not used for compressed inputs')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes; the input lines are sharded by CMTE_ID (default: 1)')
+    parser.add_argument('--rejections', action='store_true',
+                        help='count the rejected entries by reason and print a summary')
+    parser.add_argument('--quarantine', dest='quarantine_fullfilename',
+                        help='also write the rejected entries with their reasons to this file (implies --rejections); '
+                             'with --workers, each worker writes its own file with the worker index appended')
+    parser.add_argument('--flush-bytes', type=int, default=writers.FLUSH_BYTES,
+                        help='write the output lines to the files once this many bytes are buffered '
+                             '(default: {}); 0 for no limit'.format(writers.FLUSH_BYTES))
+    parser.add_argument('--flush-records', type=int,
+                        help='also write the output lines to the files once this many lines are buffered')
+    parser.add_argument('--flush-seconds', type=float,
+                        help='also write the output lines to the files once this many seconds passed since the last '
+                             'write; in the streaming mode, a small value bounds the latency of the zip file lines '
+                             'while still writing them in batches')
+    parser.add_argument('--checkpoint', dest='checkpoint_fullfilename',
+                        help='save the state of the aggregation to this file every --checkpoint-lines input lines '
+                             'and/or --checkpoint-seconds seconds; not supported with --workers')
+    parser.add_argument('--checkpoint-lines', type=int,
+                        help='input lines between checkpoints (default: {} if --checkpoint-seconds is not '
+                             'given)'.format(CHECKPOINT_LINES))
+    parser.add_argument('--checkpoint-seconds', type=float, help='seconds between checkpoints')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue from the --checkpoint file, if it exists, instead of the first input line')
+    parser.add_argument('--state', dest='state_fullfilename',
+                        help='incremental mode: continue from the state saved in this file by the last run, if the '
+                             'input still starts with the lines it processed, appending to the zip file and only '
+                             'recalculating the changed date file lines; the state is saved at the end of the run. '
+                             'The options of the first run are kept; not supported with --workers')
+    parser.add_argument('--date-memory', type=float,
+                        help='memory budget in MB for the contribution values of the date file; past it they are '
+                             'spilled to sorted runs on disk which are merged at the end (not supported with --state)')
+    parser.add_argument('--spill-dir', dest='spill_directory',
+                        help='directory for the runs of --date-memory (default: the temporary directory)')
+    parser.add_argument('--profile', action='store_true',
+                        help='time every stage of the run and print a breakdown at the end, or when the process gets '
+                             'SIGUSR1; not supported with --workers')
+    parser.add_argument('--profile-interval', type=int, default=profiler.SAMPLE_INTERVAL,
+                        help='with --profile, one input line in this many is timed stage by stage '
+                             '(default: %(default)s)')
+    parser.add_argument('--profile-output', dest='profile_fullfilename',
+                        help='also write the breakdown to this JSON file (implies --profile)')
+    parser.add_argument('--metrics', dest='metrics_fullfilename',
+                        help='export the progress (lines and bytes per second, accepted and rejected entries, groups '
+                             'in memory, resident memory, estimated time remaining) to this file')
+    parser.add_argument('--metrics-format', choices=['prometheus', 'jsonl'], default='prometheus',
+                        help='rewrite the file with the latest snapshot in the Prometheus text format, or append '
+                             'every snapshot to it as a line of JSON (default: %(default)s)')
+    parser.add_argument('--metrics-seconds', type=float, default=metrics.METRICS_SECONDS,
+                        help='seconds between snapshots of --metrics (default: %(default)s)')
+    parser.add_argument('--serve', dest='serve_address',
+                        help='answer HTTP queries over the current values (/zip?id=&zip=, /zips?id=, '
+                             '/dates?id=&start=&end=, /status) on tcp:[HOST:]PORT or unix:PATH during the run and '
+                             'after it, until interrupted; not supported with --workers or --date-memory')
+    parser.add_argument('--cache', dest='cache_directory',
+                        help='read the parsed and validated input from its columnar cache in this directory, building '
+                             'it first if the input has none (see input_cache.py); not supported with --workers, '
+                             '--state, --rejections, --quarantine or --profile')
+    parser.add_argument('--validate', choices=['records', 'columns'], default='records',
+                        help='check the input lines one record at a time, or a block at a time with numpy operations '
+                             '(see readers.ValidatedBlockReader; not supported with the streaming mode, --workers, '
+                             '--rejections, --quarantine or --profile) (default: %(default)s)')
+    args = parser.parse_args()
+    if args.checkpoint_lines is None and args.checkpoint_seconds is None:
+        args.checkpoint_lines = CHECKPOINT_LINES
+
+    main(args.input_fullfilename, args.zip_fullfilename, args.date_fullfilename,
+         median_mode=args.median_mode, median_error=args.median_error, date_mode=args.date_mode,
+         reader_mode=args.reader, number_workers=args.workers, rejections=args.rejections,
+         quarantine_fullfilename=args.quarantine_fullfilename, flush_bytes=args.flush_bytes or None,
+         flush_records=args.flush_records, flush_seconds=args.flush_seconds,
+         checkpoint_fullfilename=args.checkpoint_fullfilename, checkpoint_lines=args.checkpoint_lines,
+         checkpoint_seconds=args.checkpoint_seconds, resume=args.resume,
+         state_fullfilename=args.state_fullfilename, date_memory=args.date_memory,
+         spill_directory=args.spill_directory, profile=args.profile, profile_interval=args.profile_interval,
+         profile_fullfilename=args.profile_fullfilename, metrics_fullfilename=args.metrics_fullfilename,
+         metrics_format=args.metrics_format, metrics_seconds=args.metrics_seconds,
+         serve_address=args.serve_address, cache_directory=args.cache_directory, validate_mode=args.validate,
+         window_size=args.window_size, window_days=args.window_days,
+         negative_as_retraction=args.negative_as_retraction)
\ No newline at end of file
@@ -0,0 +1,231 @@
+"""
+Writes synthetic itcont.txt files (pipe-delimited, 21 columns) of any size for scale testing, with distributions
+modeled on what was seen in the real file:
+- the popularity of the recipients (CMTE_ID) is heavy-tailed (Zipf-like): a few committees get most contributions
+- zip codes have 5 or 9 digits and a small share is malformed (too short, non-numeric or empty)
+- the contribution amounts have few distinct values, with spikes at round amounts ($250 is ~10% of them), and a long
+  tail of other amounts
+- the transaction dates are MMDDYYYY dates of a two year election cycle and a small share is invalid
+- a configurable share of the lines has OTHER_ID set (and is skipped by find_political_donors_delta.py)
+- a few lines have an empty CMTE_ID or TRANSACTION_AMT
+
+The columns that find_political_donors_delta.py does not use are drawn from small pools of made up values.
+
+Each chunk of lines is drawn with numpy and the columns are joined as numpy object arrays, so the lines are never built
+one at a time in python.  The same seed and chunk size give the same file.
+
+How to use:
+    python generate_itcont.py itcont.txt --lines 1000000 --seed 1
+    python generate_itcont.py itcont.txt --bytes 10000000000
+
+"""
+import argparse, sys
+
+import numpy as np
+
+# Number of lines drawn at a time
+CHUNK_LINES = 1 << 18
+
+# Number of distinct recipients and the exponent of their Zipf-like popularity (the weight of the recipient of rank r
+# is 1 / r ** exponent)
+NUMBER_RECIPIENTS = 5000
+RECIPIENT_EXPONENT = 1.1
+
+# Number of distinct 5-digit zip codes, the share of zip codes with 9 digits and the share of malformed zip codes
+NUMBER_ZIP_CODES = 20000
+ZIP_9_DIGIT_SHARE = 0.6
+MALFORMED_ZIP_SHARE = 0.01
+
+# Spikes of the contribution amounts and their shares; the rest of the amounts are drawn from a log-normal distribution
+# of median AMOUNT_TAIL_MEDIAN dollars
+AMOUNT_SPIKES = {250: 0.10, 100: 0.08, 500: 0.07, 1000: 0.06, 50: 0.06, 25: 0.05, 2700: 0.04, 10: 0.03, 200: 0.03,
+                 5000: 0.02, 20: 0.02, 5: 0.02, 2500: 0.02, 15: 0.01}
+AMOUNT_TAIL_MEDIAN = 150
+AMOUNT_TAIL_SIGMA = 1.2
+AMOUNT_MAX = 10000
+
+# Years of the election cycle and the share of invalid transaction dates
+CYCLE_YEARS = (2015, 2016)
+INVALID_DATE_SHARE = 0.005
+
+# Share of the lines with OTHER_ID set and with an empty CMTE_ID or TRANSACTION_AMT
+OTHER_ID_SHARE = 0.02
+EMPTY_SHARE = 0.001
+
+# Number of made up values of each of the columns that are not used
+NUMBER_FILLERS = 1000
+
+STATES = ['CA', 'NY', 'TX', 'FL', 'IL', 'PA', 'OH', 'GA', 'NC', 'MI', 'NJ', 'VA', 'WA', 'MA', 'AZ', 'DC']
+OCCUPATIONS = ['RETIRED', 'ATTORNEY', 'PHYSICIAN', 'CEO', 'PRESIDENT', 'CONSULTANT', 'ENGINEER', 'TEACHER',
+               'NOT EMPLOYED', 'OWNER', 'SALES', 'MANAGER', 'INFORMATION REQUESTED']
+INVALID_DATES = ['', '13012016', '02302016', '00102015', '2016', '0101199', '12311969', 'N/A']
+MALFORMED_ZIP_CODES = ['', '123', '9021', 'ABCDE', '90O17', 'K1A0B1']
+
+
+class ItcontGenerator(object):
+    """
+        Draws lines of a synthetic itcont.txt file.
+
+        How to use: GenerateChunk(number_lines) returns the next number_lines lines as a single string.
+
+    """
+
+    def __init__(self, seed=None, other_id_share=OTHER_ID_SHARE, number_recipients=NUMBER_RECIPIENTS,
+                 number_zip_codes=NUMBER_ZIP_CODES, cycle_years=CYCLE_YEARS):
+        """
+        :param seed: seed of the random draws; None for a random seed [int]
+        :param other_id_share: share of the lines with OTHER_ID set [float]
+        :param number_recipients: number of distinct recipients [int]
+        :param number_zip_codes: number of distinct 5-digit zip codes [int]
+        :param cycle_years: years of the transaction dates [tuple]
+        """
+        self.random_state = np.random.RandomState(seed)
+        self.other_id_share = other_id_share
+        random_state = self.random_state
+
+        # recipients, by popularity (distinct codes out of twice as many draws; choice without replacement would
+        # shuffle all the 10 ** 8 codes)
+        codes = np.unique(random_state.randint(0, 10 ** 8, 2 * number_recipients))
+        random_state.shuffle(codes)
+        self.recipients = np.array(['C%08d' % code for code in codes[:number_recipients]], dtype=object)
+        weights = 1.0 / np.arange(1, number_recipients + 1) ** RECIPIENT_EXPONENT
+        self.recipient_cumulative = np.cumsum(weights / weights.sum())
+
+        # zip codes and the extra 4 digits of the 9-digit ones
+        self.zip_codes = np.array(['%05d' % code for code in random_state.randint(501, 100000, number_zip_codes)],
+                                  dtype=object)
+        self.zip_extensions = np.array(['%04d' % code for code in xrange(10000)], dtype=object)
+        self.malformed_zip_codes = np.array(MALFORMED_ZIP_CODES, dtype=object)
+
+        # amounts: the spikes, then the tail; the strings of the amounts come with the pipes around them
+        self.amount_spikes = np.array(sorted(AMOUNT_SPIKES), dtype=np.int64)
+        self.amount_spike_cumulative = np.cumsum([AMOUNT_SPIKES[amount] for amount in sorted(AMOUNT_SPIKES)])
+        self.amount_strings = np.array(['|%d|' % amount for amount in xrange(AMOUNT_MAX + 1)], dtype=object)
+
+        # every date of the cycle as MMDDYYYY
+        days = np.arange(np.datetime64('{}-01-01'.format(cycle_years[0])),
+                         np.datetime64('{}-01-01'.format(cycle_years[-1] + 1)))
+        self.dates = np.array([day[5:7] + day[8:10] + day[0:4] for day in days.astype(str)], dtype=object)
+        self.invalid_dates = np.array(INVALID_DATES, dtype=object)
+
+        # made up values of the columns that are not used: 1-9 (up to the state), 11-12 and 16-20, with the pipes
+        # around them so that there are fewer strings to join
+        def Fillers(create_filler):
+            return np.array([create_filler(i) for i in xrange(NUMBER_FILLERS)], dtype=object)
+        self.fillers_name = Fillers(lambda i: '|N|%s|P|2017%014d|%s|IND|DONOR%d, NAME %d|CITY %d|%s|' % (
+            random_state.choice(['A', 'M2', 'M3', 'Q1', 'YE']), random_state.randint(10 ** 13),
+            random_state.choice(['15', '15E', '15C', '22Y']), i, i % 97, i % 211, random_state.choice(STATES)))
+        self.fillers_employer = Fillers(lambda i: '|EMPLOYER %d|%s|' % (i % 389, random_state.choice(OCCUPATIONS)))
+        self.fillers_tail = Fillers(lambda i: 'SA%011d|%d||%s|%019d' % (
+            random_state.randint(10 ** 11), 1100000 + i, random_state.choice(['', '', 'EARMARKED']),
+            random_state.randint(10 ** 18)))
+        self.other_ids = Fillers(lambda i: '%s%08d|' % (random_state.choice(['H', 'S', 'P', 'C']), i))
+
+    def GenerateChunk(self, number_lines):
+        """
+        Draws lines.
+
+        :param number_lines: number of lines [int]
+        :return: the lines [string]
+        """
+        random_state = self.random_state
+        uniform = random_state.random_sample
+
+        # CMTE_ID
+        recipients = self.recipients[np.minimum(np.searchsorted(self.recipient_cumulative, uniform(number_lines)),
+                                                len(self.recipients) - 1)]
+
+        # ZIP_CODE
+        zip_codes = self.zip_codes[random_state.randint(0, len(self.zip_codes), number_lines)]
+        nine_digits = uniform(number_lines) < ZIP_9_DIGIT_SHARE
+        zip_codes[nine_digits] += self.zip_extensions[random_state.randint(0, 10000, nine_digits.sum())]
+        malformed = uniform(number_lines) < MALFORMED_ZIP_SHARE
+        zip_codes[malformed] = self.malformed_zip_codes[random_state.randint(0, len(self.malformed_zip_codes),
+                                                                             malformed.sum())]
+
+        # TRANSACTION_DT
+        dates = self.dates[random_state.randint(0, len(self.dates), number_lines)]
+        invalid = uniform(number_lines) < INVALID_DATE_SHARE
+        dates[invalid] = self.invalid_dates[random_state.randint(0, len(self.invalid_dates), invalid.sum())]
+
+        # TRANSACTION_AMT: a spike or the tail
+        spike_index = np.searchsorted(self.amount_spike_cumulative, uniform(number_lines))
+        amounts = np.where(spike_index < len(self.amount_spikes),
+                           self.amount_spikes[np.minimum(spike_index, len(self.amount_spikes) - 1)],
+                           np.clip(np.round(random_state.lognormal(np.log(AMOUNT_TAIL_MEDIAN), AMOUNT_TAIL_SIGMA,
+                                                                   number_lines)), 1, AMOUNT_MAX).astype(np.int64))
+        amounts = self.amount_strings[amounts]
+
+        # OTHER_ID
+        other_ids = np.full(number_lines, '|', dtype=object)
+        other_id_set = uniform(number_lines) < self.other_id_share
+        other_ids[other_id_set] = self.other_ids[random_state.randint(0, len(self.other_ids), other_id_set.sum())]
+
+        # a few empty CMTE_ID and TRANSACTION_AMT
+        recipients[uniform(number_lines) < EMPTY_SHARE] = ''
+        amounts[uniform(number_lines) < EMPTY_SHARE] = '||'
+
+        def Fillers(fillers):
+            return fillers[random_state.randint(0, len(fillers), number_lines)]
+
+        lines = recipients + Fillers(self.fillers_name) + zip_codes + Fillers(self.fillers_employer) + dates + \
+            amounts + other_ids + Fillers(self.fillers_tail)
+        return '\n'.join(lines) + '\n'
+
+
+def GenerateFile(output_fullfilename, number_lines=None, number_bytes=None, seed=None,
+                 other_id_share=OTHER_ID_SHARE, chunk_lines=CHUNK_LINES):
+    """
+    Writes a synthetic itcont.txt file of a number of lines or of at least a number of bytes.
+
+    :param output_fullfilename: the file to write, '-' for the standard output [string]
+    :param number_lines: number of lines [int]
+    :param number_bytes: number of bytes, if number_lines is not given; the file ends with the line that reaches
+                         it [int]
+    :param seed: seed of the random draws; None for a random seed [int]
+    :param other_id_share: share of the lines with OTHER_ID set [float]
+    :param chunk_lines: number of lines drawn at a time [int]
+    :return: number of lines written [int]
+    """
+    if (number_lines is None) == (number_bytes is None):
+        raise ValueError('Either the number of lines or the number of bytes is needed')
+    generator = ItcontGenerator(seed, other_id_share)
+    fid = sys.stdout if output_fullfilename == '-' else open(output_fullfilename, 'wb')
+    lines_written = 0
+    bytes_written = 0
+    try:
+        while True:
+            if number_lines is not None:
+                if lines_written >= number_lines:
+                    break
+                chunk = generator.GenerateChunk(min(chunk_lines, number_lines - lines_written))
+                lines_written += min(chunk_lines, number_lines - lines_written)
+            else:
+                if bytes_written >= number_bytes:
+                    break
+                chunk = generator.GenerateChunk(chunk_lines)
+                if bytes_written + len(chunk) > number_bytes:
+                    # stop at the end of the line that reaches number_bytes
+                    chunk = chunk[:chunk.index('\n', number_bytes - bytes_written - 1) + 1]
+                lines_written += chunk.count('\n')
+            fid.write(chunk)
+            bytes_written += len(chunk)
+    finally:
+        if fid is not sys.stdout:
+            fid.close()
+    return lines_written
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Writes a synthetic itcont.txt file.')
+    parser.add_argument('output_fullfilename', help='the file to write, - for the standard output')
+    size = parser.add_mutually_exclusive_group(required=True)
+    size.add_argument('--lines', dest='number_lines', type=int, help='number of lines')
+    size.add_argument('--bytes', dest='number_bytes', type=int, help='approximate number of bytes')
+    parser.add_argument('--seed', type=int, help='seed of the random draws (default: random)')
+    parser.add_argument('--other-id-share', type=float, default=OTHER_ID_SHARE,
+                        help='share of the lines with OTHER_ID set (default: %(default)s)')
+    args = parser.parse_args()
+
+    GenerateFile(args.output_fullfilename, args.number_lines, args.number_bytes, args.seed, args.other_id_share)
@@ -7,15 +7,18 @@ subdirectories were allowed for the /src folder
 
 """
 
-import time, heapq
+import collections, datetime, functools, time, heapq, math, random
+from array import array
+from bisect import bisect_left
 from calendar import timegm
+from itertools import imap
 import numpy as np
 
 class MedianStreaming(object):
     """
         Class for calculate median of a stream of incoming values, ingested one at a time.
         Note that this is not for calculating the median of a finite window size of streaming
-        values.
+        values (see MedianStreamingWindow for that).
         How to use: ingest a value and it returns the new median value.
 
         10/27/2017, John Kwong
@@ -120,7 +123,1355 @@ class ZipStreaming(MedianStreaming):
         return(self.count)
 
 
+class MedianStreamingFrequency(object):
+    """
+        Class for calculating the median of a stream of incoming values, ingested one at a time, by keeping a count of
+        each distinct value instead of every value.  The contribution amounts have very few distinct values (~750 in the
+        first 20,000 entries, with $250 being ~10% of them) so the memory grows with the number of distinct values
+        rather than with the number of values ingested.
+
+        The distinct values are kept in a sorted list with a parallel list of counts.  A pointer to the distinct value
+        holding the lower median (and the number of values below it) is kept between calls so that each ingest only
+        has to walk the pointer by at most one position.
+        How to use: ingest a value and it returns the new median value, just like MedianStreaming.
+
+    """
+
+    def __init__(self):
+        self.values = []
+        self.counts = []
+        self.number_values = 0
+        self.median_index = 0
+        self.median_rank_start = 0
+        self.median_current = 0
+
+    def ingest(self, input):
+        """
+        This method is for taking in another value and returning a new median value.
+
+        :param input: streaming number [number]
+        :return:  the new median value [number]
+        """
+        values = self.values
+        counts = self.counts
+        median_index = self.median_index
+        median_rank_start = self.median_rank_start
+
+        index = bisect_left(values, input)
+        if index < len(values) and values[index] == input:
+            counts[index] += 1
+            if index < median_index:
+                median_rank_start += 1
+        else:
+            values.insert(index, input)
+            counts.insert(index, 1)
+            # a new distinct value in front of the median pointer shifts it by one
+            if self.number_values > 0 and index <= median_index:
+                median_index += 1
+                median_rank_start += 1
+        self.number_values += 1
+
+        # move the pointer to the distinct value holding the lower median
+        rank = (self.number_values - 1) >> 1
+        while rank >= median_rank_start + counts[median_index]:
+            median_rank_start += counts[median_index]
+            median_index += 1
+        while rank < median_rank_start:
+            median_index -= 1
+            median_rank_start -= counts[median_index]
+        self.median_index = median_index
+        self.median_rank_start = median_rank_start
+
+        if self.number_values & 1:
+            self.median_current = values[median_index]
+        elif rank + 1 < median_rank_start + counts[median_index]:
+            self.median_current = float(values[median_index])
+        else:
+            # the average
+            self.median_current = float(values[median_index] + values[median_index + 1]) / 2.0
+
+        return(self.median_current)
+
+    def reset(self):
+        """
+        This method clears all the fields so that you can reuse your instance for a new set of streaming values.
+
+        :return: Nothing
+        """
+        self.values = []
+        self.counts = []
+        self.number_values = 0
+        self.median_index = 0
+        self.median_rank_start = 0
+        self.median_current = 0
+
+
+class ZipStreamingFrequency(MedianStreamingFrequency):
+    """
+        Drop-in replacement for ZipStreaming that uses MedianStreamingFrequency to calculate the median.  The ingest
+        method returns the median, total contributions and number of contributions.
+
+    """
+    def __init__(self):
+        MedianStreamingFrequency.__init__(self)
+        self.total = 0
+        self.count = 0
+
+    def ingest(self, input):
+        """
+        The contribution values are ingested with this method and the new median, total and number of contributions are
+        returned.
+
+        :param input:  the contribution value [number]
+        :return:  tuple of current median, total contributions, number of contributions [number, number, number]
+        """
+        MedianStreamingFrequency.ingest(self, input)
+        self.total += input
+        self.count += 1
+        return self.median_current, self.total, self.count
+
+    def reset(self):
+        """
+        This method clears all the fields so that you can reuse your instance for a new set of streaming values.
+
+        :return: Nothing
+        """
+        MedianStreamingFrequency.reset(self)
+        self.total = 0
+        self.count = 0
+
+    def GetTotal(self):
+        """
+        Get the total contributions.
+
+        :return:   total contributions (sum)
+        """
+        return(self.total)
+
+    def GetCount(self):
+        """
+        Get the number of contributions
+
+        :return:   number of contributions
+        """
+        return(self.count)
+
+
+class MedianStreamingApprox(MedianStreamingFrequency):
+    """
+        Class for estimating the median of a stream of values with a fixed-size sketch.
+
+        Every value is replaced by the centre of the logarithmic bucket it falls in before it is counted by
+        MedianStreamingFrequency.  The buckets are (gamma^(k-1), gamma^k] with gamma = (1 + e) / (1 - e) where e is the
+        relative error so any value in a bucket is within a factor of e of the bucket centre.  Consequently the returned
+        median is within e (relative) of the exact median as long as the values have the same sign.  Zero is kept as
+        its own bucket and negative values are mirrored.
+
+        The number of buckets only grows with the log of the range of the values (~1040 buckets for values between 1
+        and 1e9 at e = 0.01).  If it ever exceeds max_bins, the two lowest buckets are merged so the sketch never
+        grows beyond max_bins; the error bound then no longer holds for the lowest values.
+
+    """
+
+    def __init__(self, relative_error=0.01, max_bins=2048):
+        MedianStreamingFrequency.__init__(self)
+        self.relative_error = relative_error
+        self.max_bins = max_bins
+        self.gamma = (1.0 + relative_error) / (1.0 - relative_error)
+        self.log_gamma = math.log(self.gamma)
+
+    def ingest(self, input):
+        """
+        This method is for taking in another value and returning the new estimate of the median.
+
+        :param input: streaming number [number]
+        :return:  the new estimate of the median [number]
+        """
+        MedianStreamingFrequency.ingest(self, self.BucketCentre(input))
+        if len(self.values) > self.max_bins:
+            self.CollapseLowestBins()
+        return(self.median_current)
+
+    def BucketCentre(self, input):
+        """
+        Returns the centre of the logarithmic bucket that the value falls in.
+
+        :param input: value [number]
+        :return: bucket centre [float]
+        """
+        if input > 0:
+            return 2.0 * self.gamma ** math.ceil(math.log(input) / self.log_gamma) / (self.gamma + 1.0)
+        elif input < 0:
+            return -2.0 * self.gamma ** math.ceil(math.log(-input) / self.log_gamma) / (self.gamma + 1.0)
+        return 0.0
+
+    def CollapseLowestBins(self):
+        """
+        Merges the lowest bucket into the next one, keeping the median pointer in place.
+
+        :return: Nothing
+        """
+        self.counts[1] += self.counts[0]
+        del self.values[0]
+        del self.counts[0]
+        if self.median_index <= 1:
+            self.median_index = 0
+            self.median_rank_start = 0
+        else:
+            self.median_index -= 1
+
+
+class ZipStreamingApprox(MedianStreamingApprox):
+    """
+        Approximate version of ZipStreaming with bounded memory; see MedianStreamingApprox for the error on the median.
+        The total and number of contributions are exact.
+
+    """
+    def __init__(self, relative_error=0.01, max_bins=2048):
+        MedianStreamingApprox.__init__(self, relative_error, max_bins)
+        self.total = 0
+        self.count = 0
+
+    def ingest(self, input):
+        """
+        The contribution values are ingested with this method and the new median estimate, total and number of
+        contributions are returned.
+
+        :param input:  the contribution value [number]
+        :return:  tuple of current median, total contributions, number of contributions [number, number, number]
+        """
+        MedianStreamingApprox.ingest(self, input)
+        self.total += input
+        self.count += 1
+        return self.median_current, self.total, self.count
+
+    def GetTotal(self):
+        """
+        Get the total contributions.
+
+        :return:   total contributions (sum)
+        """
+        return(self.total)
+
+    def GetCount(self):
+        """
+        Get the number of contributions
+
+        :return:   number of contributions
+        """
+        return(self.count)
+
+
+class _SkiplistNode(object):
+    __slots__ = ('value', 'next', 'width')
+
+    def __init__(self, value, next, width):
+        self.value = value
+        self.next = next
+        self.width = width
+
+
+class IndexableSkiplist(object):
+    """
+        Sorted collection of values with insert, remove and access by rank in O(log n) expected time.
+
+        Every node is linked to the next node at each of its levels, and each link holds its width: the number of
+        values it skips at the bottom level.  Searching by value goes down the levels from the top, and so does
+        searching by rank, subtracting the widths of the links it follows.  A node gets one level plus one more with
+        probability 1/4 for each further level (fewer levels to go down than with 1/2, for about as many links
+        followed), and the head grows to the highest level so far.
+
+        How to use: insert(value), remove(value) and skiplist[rank], with rank 0 the smallest value.
+
+    """
+
+    # highest number of levels of a node
+    MAX_LEVELS = 16
+
+    def __init__(self):
+        self.size = 0
+        self.tail = _SkiplistNode(float('inf'), [], [])
+        self.head = _SkiplistNode(None, [self.tail], [1])
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, rank):
+        if not 0 <= rank < self.size:
+            raise IndexError('Rank {} is out of range'.format(rank))
+        node = self.head
+        # the head is rank -1
+        rank += 1
+        for level in xrange(len(node.next) - 1, -1, -1):
+            while node.width[level] <= rank:
+                rank -= node.width[level]
+                node = node.next[level]
+        return node.value
+
+    def __iter__(self):
+        node = self.head.next[0]
+        while node is not self.tail:
+            yield node.value
+            node = node.next[0]
+
+    def insert(self, value):
+        """
+        Adds a value; equal values are kept in order of insertion.
+
+        :param value: the value [number]
+        :return: Nothing
+        """
+        head = self.head
+        # one plus the number of trailing pairs of zero bits of a random number
+        bits = random.getrandbits(2 * self.MAX_LEVELS - 2) | (1 << (2 * self.MAX_LEVELS - 2))
+        number_levels = ((bits & -bits).bit_length() + 1) >> 1
+        while len(head.next) < number_levels:
+            head.next.append(self.tail)
+            head.width.append(self.size + 1)
+
+        # the last node before the value at each level, from the top, and its rank (the head is rank 0)
+        chain = []
+        ranks = []
+        node = head
+        rank = 0
+        for level in xrange(len(head.next) - 1, -1, -1):
+            next_node = node.next[level]
+            while next_node.value <= value:
+                rank += node.width[level]
+                node = next_node
+                next_node = node.next[level]
+            chain.append(node)
+            ranks.append(rank)
+        chain.reverse()
+        ranks.reverse()
+
+        # the rank of the new node
+        rank += 1
+        new_node = _SkiplistNode(value, [None] * number_levels, [None] * number_levels)
+        for level in xrange(number_levels):
+            previous = chain[level]
+            new_node.next[level] = previous.next[level]
+            previous.next[level] = new_node
+            new_node.width[level] = ranks[level] + previous.width[level] + 1 - rank
+            previous.width[level] = rank - ranks[level]
+        for level in xrange(number_levels, len(chain)):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, value):
+        """
+        Removes one occurrence of a value.
+
+        :param value: the value [number]
+        :return: Nothing
+        :raises KeyError: if the value is not in the skiplist
+        """
+        head = self.head
+        levels = len(head.next)
+        chain = [None] * levels
+        node = head
+        for level in xrange(levels - 1, -1, -1):
+            while node.next[level].value < value:
+                node = node.next[level]
+            chain[level] = node
+        found = chain[0].next[0]
+        if found is self.tail or found.value != value:
+            raise KeyError(value)
+
+        for level in xrange(len(found.next)):
+            previous = chain[level]
+            previous.width[level] += found.width[level] - 1
+            previous.next[level] = found.next[level]
+        for level in xrange(len(found.next), levels):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def GetMedian(self):
+        """
+        :return: the median of the values, 0 if there are none [number]
+        """
+        size = self.size
+        if size == 0:
+            return 0
+        # the node of the lower median, and the next one for an even number of values
+        node = self.head
+        rank = ((size - 1) >> 1) + 1
+        for level in xrange(len(node.next) - 1, -1, -1):
+            while node.width[level] <= rank:
+                rank -= node.width[level]
+                node = node.next[level]
+        if size & 1:
+            return node.value
+        # the average
+        return float(node.value + node.next[0].value) / 2.0
+
+    def __getstate__(self):
+        # the nodes are linked to each other, which pickle would follow one level of recursion per node
+        return list(self)
+
+    def __setstate__(self, values):
+        self.__init__()
+        for value in values:
+            self.insert(value)
+
+
+def TransactionDateOrdinal(date_key):
+    """
+    :param date_key: valid date as YYYYMMDD [int]
+    :return: the number of the day, counting from 01/01/0001 [int]
+    """
+    return datetime.date(date_key // 10000, date_key // 100 % 100, date_key % 100).toordinal()
+
+
+class MedianStreamingWindow(object):
+    """
+        Class for calculating the median of the values of a sliding window over a stream of values: either the last
+        window_size values ingested, or the values whose date is in the last window_days days up to the latest date
+        ingested so far (the dates can arrive out of order; a value older than the window is not added).
+
+        The values of the window are kept sorted in an IndexableSkiplist, so adding a value, evicting one and finding
+        the median each take O(log n).  The values leave the window in order of arrival (a deque) or of date (a heap).
+        How to use: ingest a value, with its date as YYYYMMDD for a window of days, and it returns the new median
+        value.
+
+    """
+
+    def __init__(self, window_size=None, window_days=None):
+        """
+        :param window_size: number of values in the window [int]
+        :param window_days: number of days in the window, instead of window_size [int]
+        """
+        if (window_size is None) == (window_days is None):
+            raise ValueError('Give either the number of values or the number of days of the window')
+        if (window_size if window_size is not None else window_days) < 1:
+            raise ValueError('The window must have at least one value or day')
+        self.window_size = window_size
+        self.window_days = window_days
+        self.skiplist = IndexableSkiplist()
+        # the values in order of arrival, or a heap of (day, arrival, value)
+        self.window = collections.deque() if window_size is not None else []
+        self.latest_day = None
+        self.number_ingested = 0
+        self.median_current = 0
+
+    def ingest(self, input, date_key=-1):
+        """
+        This method is for taking in another value and returning the median value of the window.
+
+        :param input: streaming number [number]
+        :param date_key: date of the value as YYYYMMDD; only used for a window of days, which needs a valid date
+                         [int]
+        :return:  the new median value [number]
+        """
+        if self.window_size is not None:
+            self._Add(input)
+            self.window.append(input)
+            if len(self.window) > self.window_size:
+                self._Evict(self.window.popleft())
+        else:
+            day = TransactionDateOrdinal(date_key)
+            if self.latest_day is None or day > self.latest_day:
+                self.latest_day = day
+            first_day = self.latest_day - self.window_days + 1
+            if day >= first_day:
+                self._Add(input)
+                heapq.heappush(self.window, (day, self.number_ingested, input))
+            window = self.window
+            while window and window[0][0] < first_day:
+                self._Evict(heapq.heappop(window)[2])
+        self.number_ingested += 1
+        self.median_current = self.skiplist.GetMedian()
+        return(self.median_current)
+
+    def _Add(self, input):
+        self.skiplist.insert(input)
+
+    def _Evict(self, input):
+        self.skiplist.remove(input)
+
+
+class ZipStreamingWindow(MedianStreamingWindow):
+    """
+        Same as ZipStreaming over a sliding window (see MedianStreamingWindow): the median, total and number of the
+        contributions in the window.
+
+    """
+    def __init__(self, window_size=None, window_days=None):
+        MedianStreamingWindow.__init__(self, window_size, window_days)
+        self.total = 0
+
+    def ingest(self, input, date_key=-1):
+        """
+        The contribution values are ingested with this method and the new median, total and number of contributions
+        of the window are returned.
+
+        :param input:  the contribution value [number]
+        :param date_key: date of the contribution as YYYYMMDD (see MedianStreamingWindow.ingest) [int]
+        :return:  tuple of current median, total contributions, number of contributions [number, number, number]
+        """
+        MedianStreamingWindow.ingest(self, input, date_key)
+        return self.median_current, self.total, len(self.skiplist)
+
+    def _Add(self, input):
+        self.skiplist.insert(input)
+        self.total += input
+
+    def _Evict(self, input):
+        self.skiplist.remove(input)
+        self.total -= input
+
+    def GetTotal(self):
+        """
+        Get the total contributions of the window.
+
+        :return:   total contributions (sum)
+        """
+        return(self.total)
+
+    def GetCount(self):
+        """
+        Get the number of contributions of the window.
+
+        :return:   number of contributions
+        """
+        return(len(self.skiplist))
+
+
+class MedianStreamingDeletable(object):
+    """
+        Class for calculating the median of a stream of values from which values that were ingested earlier can be
+        removed again (e.g. refunds).  The values are kept sorted in an IndexableSkiplist, so ingesting a value,
+        removing one and finding the median each take O(log n).
+        How to use: ingest a value, or remove one, and it returns the new median value.
+
+    """
+
+    def __init__(self):
+        self.skiplist = IndexableSkiplist()
+        self.median_current = 0
+
+    def ingest(self, input):
+        """
+        This method is for taking in another value and returning a new median value.
+
+        :param input: streaming number [number]
+        :return:  the new median value [number]
+        """
+        self.skiplist.insert(input)
+        self.median_current = self.skiplist.GetMedian()
+        return(self.median_current)
+
+    def remove(self, input):
+        """
+        This method is for removing a value that was ingested and returning the new median value (0 once there are no
+        values left).
+
+        :param input: a value that was ingested [number]
+        :return:  the new median value [number]
+        :raises KeyError: if the value was not ingested or was already removed
+        """
+        self.skiplist.remove(input)
+        self.median_current = self.skiplist.GetMedian()
+        return(self.median_current)
+
+    def reset(self):
+        """
+        This method clears all the fields so that you can reuse your instance for a new set of streaming values.
+
+        :return: Nothing
+        """
+        MedianStreamingDeletable.__init__(self)
+
+
+class ZipStreamingDeletable(MedianStreamingDeletable):
+    """
+        Same as ZipStreaming with contributions that can be removed again (see MedianStreamingDeletable).
+
+    """
+    def __init__(self):
+        MedianStreamingDeletable.__init__(self)
+        self.total = 0
+
+    def ingest(self, input):
+        """
+        The contribution values are ingested with this method and the new median, total and number of contributions
+        are returned.
+
+        :param input:  the contribution value [number]
+        :return:  tuple of current median, total contributions, number of contributions [number, number, number]
+        """
+        MedianStreamingDeletable.ingest(self, input)
+        self.total += input
+        return self.median_current, self.total, len(self.skiplist)
+
+    def remove(self, input):
+        """
+        Removes a contribution value that was ingested and returns the new median, total and number of contributions.
+
+        :param input:  the contribution value [number]
+        :return:  tuple of current median, total contributions, number of contributions [number, number, number]
+        :raises KeyError: if the value was not ingested or was already removed
+        """
+        MedianStreamingDeletable.remove(self, input)
+        self.total -= input
+        return self.median_current, self.total, len(self.skiplist)
+
+    def reset(self):
+        ZipStreamingDeletable.__init__(self)
+
+    def GetTotal(self):
+        """
+        Get the total contributions.
+
+        :return:   total contributions (sum)
+        """
+        return(self.total)
+
+    def GetCount(self):
+        """
+        Get the number of contributions
+
+        :return:   number of contributions
+        """
+        return(len(self.skiplist))
+
+
+def ZipStreamingFactory(median_mode='exact', relative_error=0.01, window_size=None, window_days=None):
+    """
+    Returns a function that creates a new instance of the class used to calculate the running median, total and
+    number of contributions for a recipient and zip code.
+
+    :param median_mode: 'exact' (ZipStreamingFrequency), 'heap' (ZipStreaming), 'approx' (ZipStreamingApprox),
+                        'window' (ZipStreamingWindow) or 'deletable' (ZipStreamingDeletable) [string]
+    :param relative_error: relative error of the median for the 'approx' mode [float]
+    :param window_size: number of contributions in the window of the 'window' mode [int]
+    :param window_days: number of days in the window of the 'window' mode, instead of window_size [int]
+    :return: function without arguments that returns a new instance [function]
+    """
+    if median_mode == 'exact':
+        return ZipStreamingFrequency
+    elif median_mode == 'heap':
+        return ZipStreaming
+    elif median_mode == 'approx':
+        return functools.partial(ZipStreamingApprox, relative_error)
+    elif median_mode == 'window':
+        # check the window right away
+        ZipStreamingWindow(window_size, window_days)
+        return functools.partial(ZipStreamingWindow, window_size, window_days)
+    elif median_mode == 'deletable':
+        return ZipStreamingDeletable
+    raise ValueError('Unknown median mode: {}'.format(median_mode))
+
+
+class ZipStreamingStore(object):
+    """
+        Struct-of-arrays store of the running median, total and number of contributions of every recipient and zip
+        code ("group"), using the same algorithm as ZipStreamingFrequency.
+
+        Instead of one ZipStreamingFrequency instance (with its __dict__ and two lists) per group, the state of all the
+        groups is held in typed arrays indexed by the group number, and the sorted distinct values of each group and
+        their counts are held in a slab of two arrays shared by all the groups (the pool).  A slab starts with room for
+        one distinct value and moves to a slab twice as large when it is full; the old slab is reused by the next group
+        needing a slab of that size.  Most groups only ever hold a handful of contributions so this is a few dozen
+        bytes per group.
+
+        How to use: group = NewGroup() once per group and then ingest(group, value) returns the new median, total and
+        number of contributions of the group, just like ZipStreaming.ingest.
+
+    """
+
+    # the contributions do not need a valid date (see ZipStreamingWindowStore)
+    needs_dates = False
+
+    def __init__(self):
+        # state of the groups, indexed by the group number
+        self.total = array('l')
+        self.count = array('l')
+        self.median = array('d')
+        self.slab_start = array('l')
+        self.slab_capacity = array('l')
+        self.slab_size = array('l')
+        self.median_index = array('l')
+        self.median_rank_start = array('l')
+
+        # the pool of slabs holding the sorted distinct values of the groups and their counts
+        self.values = array('l')
+        self.counts = array('l')
+        # starts of the slabs that are free, by capacity
+        self.free_slabs = {}
+
+    def __len__(self):
+        return len(self.count)
+
+    def NewGroup(self):
+        """
+        Adds a new group without any contributions.
+
+        :return: the group number [int]
+        """
+        group = len(self.count)
+        self.total.append(0)
+        self.count.append(0)
+        self.median.append(0)
+        self.slab_start.append(self._AllocateSlab(1))
+        self.slab_capacity.append(1)
+        self.slab_size.append(0)
+        self.median_index.append(0)
+        self.median_rank_start.append(0)
+        return group
+
+    def _AllocateSlab(self, capacity):
+        """
+        Returns the start of a free slab of the given capacity, growing the pool if there is none.
+
+        :param capacity: number of distinct values the slab holds [int]
+        :return: start of the slab in the pool [int]
+        """
+        free_slabs = self.free_slabs.get(capacity)
+        if free_slabs:
+            return free_slabs.pop()
+        start = len(self.values)
+        self.values.extend(array('l', [0]) * capacity)
+        self.counts.extend(array('l', [0]) * capacity)
+        return start
+
+    def _GrowSlab(self, group):
+        """
+        Moves the values of a group to a slab twice as large.
+
+        :param group: the group number [int]
+        :return: start of the new slab [int]
+        """
+        start = self.slab_start[group]
+        capacity = self.slab_capacity[group]
+        size = self.slab_size[group]
+
+        new_start = self._AllocateSlab(2 * capacity)
+        self.values[new_start:new_start + size] = self.values[start:start + size]
+        self.counts[new_start:new_start + size] = self.counts[start:start + size]
+        self.free_slabs.setdefault(capacity, []).append(start)
+
+        self.slab_start[group] = new_start
+        self.slab_capacity[group] = 2 * capacity
+        return new_start
+
+    def ingest(self, group, input, date_key=-1):
+        """
+        The contribution values of a group are ingested with this method and the new median, total and number of
+        contributions of the group are returned.
+
+        :param group: the group number [int]
+        :param input:  the contribution value [int]
+        :param date_key: date of the contribution as YYYYMMDD; not used [int]
+        :return:  tuple of current median, total contributions, number of contributions [number, number, number]
+        """
+        values = self.values
+        counts = self.counts
+        start = self.slab_start[group]
+        size = self.slab_size[group]
+        median_index = self.median_index[group]
+        median_rank_start = self.median_rank_start[group]
+        count = self.count[group]
+
+        index = bisect_left(values, input, start, start + size)
+        if index < start + size and values[index] == input:
+            counts[index] += 1
+            if index - start < median_index:
+                median_rank_start += 1
+        else:
+            if size == self.slab_capacity[group]:
+                new_start = self._GrowSlab(group)
+                index += new_start - start
+                start = new_start
+            # make room for the new distinct value
+            end = start + size
+            values[index + 1:end + 1] = values[index:end]
+            counts[index + 1:end + 1] = counts[index:end]
+            values[index] = input
+            counts[index] = 1
+            self.slab_size[group] = size + 1
+            # a new distinct value in front of the median pointer shifts it by one
+            if count > 0 and index - start <= median_index:
+                median_index += 1
+                median_rank_start += 1
+        count += 1
+
+        # move the pointer to the distinct value holding the lower median
+        rank = (count - 1) >> 1
+        while rank >= median_rank_start + counts[start + median_index]:
+            median_rank_start += counts[start + median_index]
+            median_index += 1
+        while rank < median_rank_start:
+            median_index -= 1
+            median_rank_start -= counts[start + median_index]
+        self.median_index[group] = median_index
+        self.median_rank_start[group] = median_rank_start
+
+        if count & 1:
+            median_current = values[start + median_index]
+        elif rank + 1 < median_rank_start + counts[start + median_index]:
+            median_current = float(values[start + median_index])
+        else:
+            # the average
+            median_current = float(values[start + median_index] + values[start + median_index + 1]) / 2.0
+
+        total = self.total[group] + input
+        self.total[group] = total
+        self.count[group] = count
+        self.median[group] = median_current
+        return median_current, total, count
+
+    def GetMedian(self, group):
+        """
+        Get the median of the contributions of a group.
+
+        :param group: the group number [int]
+        :return:   median of the contributions
+        """
+        return(self.median[group])
+
+    def GetTotal(self, group):
+        """
+        Get the total contributions of a group.
+
+        :param group: the group number [int]
+        :return:   total contributions (sum)
+        """
+        return(self.total[group])
+
+    def GetCount(self, group):
+        """
+        Get the number of contributions of a group.
+
+        :param group: the group number [int]
+        :return:   number of contributions
+        """
+        return(self.count[group])
+
+
+class ZipStreamingObjectStore(object):
+    """
+        Same interface as ZipStreamingStore but every group is an instance created by zip_streaming_factory (see
+        ZipStreamingFactory), e.g. ZipStreaming or ZipStreamingApprox.
+
+    """
+
+    # the contributions do not need a valid date (see ZipStreamingWindowStore)
+    needs_dates = False
+
+    def __init__(self, zip_streaming_factory):
+        self.zip_streaming_factory = zip_streaming_factory
+        self.instances = []
+
+    def __len__(self):
+        return len(self.instances)
+
+    def NewGroup(self):
+        """
+        Adds a new group without any contributions.
+
+        :return: the group number [int]
+        """
+        self.instances.append(self.zip_streaming_factory())
+        return len(self.instances) - 1
+
+    def ingest(self, group, input, date_key=-1):
+        """
+        The contribution values of a group are ingested with this method and the new median, total and number of
+        contributions of the group are returned.
+
+        :param group: the group number [int]
+        :param input:  the contribution value [number]
+        :param date_key: date of the contribution as YYYYMMDD; not used [int]
+        :return:  tuple of current median, total contributions, number of contributions [number, number, number]
+        """
+        return self.instances[group].ingest(input)
+
+    def GetMedian(self, group):
+        """
+        Get the median of the contributions of a group.
+
+        :param group: the group number [int]
+        :return:   median of the contributions
+        """
+        return(self.instances[group].median_current)
+
+    def GetTotal(self, group):
+        """
+        Get the total contributions of a group.
+
+        :param group: the group number [int]
+        :return:   total contributions (sum)
+        """
+        return(self.instances[group].GetTotal())
+
+    def GetCount(self, group):
+        """
+        Get the number of contributions of a group.
+
+        :param group: the group number [int]
+        :return:   number of contributions
+        """
+        return(self.instances[group].GetCount())
+
+
+class ZipStreamingWindowStore(ZipStreamingObjectStore):
+    """
+        Same as ZipStreamingObjectStore with a ZipStreamingWindow instance per group, whose dates are passed on for a
+        window of days.  The contributions then need a valid date: those without one are not used for the zip file.
+
+    """
+
+    def __init__(self, window_size=None, window_days=None):
+        """
+        :param window_size: number of contributions in the window [int]
+        :param window_days: number of days in the window, instead of window_size [int]
+        """
+        ZipStreamingObjectStore.__init__(self, ZipStreamingFactory('window', window_size=window_size,
+                                                                   window_days=window_days))
+        self.needs_dates = window_days is not None
+
+    def ingest(self, group, input, date_key=-1):
+        """
+        The contribution values of a group are ingested with this method and the new median, total and number of
+        contributions of the window of the group are returned.
+
+        :param group: the group number [int]
+        :param input:  the contribution value [number]
+        :param date_key: date of the contribution as YYYYMMDD; must be valid for a window of days [int]
+        :return:  tuple of current median, total contributions, number of contributions [number, number, number]
+        """
+        return self.instances[group].ingest(input, date_key)
+
+
+class ZipStreamingDeletableStore(ZipStreamingObjectStore):
+    """
+        Same as ZipStreamingObjectStore with a ZipStreamingDeletable instance per group, whose contributions can be
+        removed again.
+
+    """
+
+    def __init__(self):
+        ZipStreamingObjectStore.__init__(self, ZipStreamingDeletable)
+
+    def remove(self, group, input):
+        """
+        Removes a contribution value of a group that was ingested and returns the new median, total and number of
+        contributions of the group.
+
+        :param group: the group number [int]
+        :param input:  the contribution value [number]
+        :return:  tuple of current median, total contributions, number of contributions, or None if the group has no
+                  such contribution [tuple]
+        """
+        try:
+            return self.instances[group].remove(input)
+        except KeyError:
+            return None
+
+
+def ZipStreamingStoreFactory(median_mode='exact', relative_error=0.01, window_size=None, window_days=None):
+    """
+    Returns a function that creates the store of the running median, total and number of contributions of all the
+    recipients and zip codes.
+
+    :param median_mode: 'exact' (ZipStreamingStore), 'heap' (ZipStreaming instances), 'approx' (ZipStreamingApprox
+                        instances), 'window' (ZipStreamingWindowStore) or 'deletable' (ZipStreamingDeletableStore)
+                        [string]
+    :param relative_error: relative error of the median for the 'approx' mode [float]
+    :param window_size: number of contributions in the window of the 'window' mode [int]
+    :param window_days: number of days in the window of the 'window' mode, instead of window_size [int]
+    :return: function without arguments that returns a new store [function]
+    """
+    if median_mode == 'exact':
+        return ZipStreamingStore
+    elif median_mode == 'window':
+        ZipStreamingFactory(median_mode, window_size=window_size, window_days=window_days)
+        return functools.partial(ZipStreamingWindowStore, window_size, window_days)
+    elif median_mode == 'deletable':
+        return ZipStreamingDeletableStore
+    return functools.partial(ZipStreamingObjectStore, ZipStreamingFactory(median_mode, relative_error))
+
+
+class DateAccumulatorList(list):
+    """
+        Holds the contribution values of a recipient and date in a list (the original storage for the date file).
+
+        The date accumulators all have the same small interface: ingest(value) adds a contribution value and
+        GetTransactionValues() returns the median, total and number of contributions.  They subclass the container
+        that holds the values (without a __dict__) so that ingest is the container's own append and each instance is
+        no bigger than the container.  GetValues() returns the contribution values, in no particular order, and
+        remove(value) removes one of them again, returning whether it was there; it takes O(n) for the list and the
+        array and O(1) for the frequencies, so only the latter have FAST_REMOVE and can be used for the retractions
+        (see ContributionAggregator negative_as_retraction).
+
+        GROUP_BYTES and VALUE_BYTES are the approximate memory taken by an instance (with its entry in the dict of
+        the aggregator) and by each value, for the memory budget of the date file (see
+        ContributionAggregator.CheckDateMemory).
+
+    """
+    __slots__ = ()
+    GROUP_BYTES = 150
+    # pointer plus int object
+    VALUE_BYTES = 32
+    FAST_REMOVE = False
+
+    ingest = list.append
+
+    def GetValues(self):
+        return self
+
+    def remove(self, input):
+        try:
+            list.remove(self, input)
+        except ValueError:
+            return False
+        return True
+
+    def GetTransactionValues(self):
+        """
+        Calculates the median, total and number of contributions.
+
+        :return:  tuple of median, total contributions, number of contributions [number, number, number]
+        """
+        return CalculateTransactionValues(self)
+
+
+class DateAccumulatorArray(array):
+    """
+        Holds the contribution values of a recipient and date in a typed array('l') which takes 8 bytes per value
+        instead of the ~32 bytes (pointer plus int object) of a list.  See DateAccumulatorList for the interface.
+
+    """
+    __slots__ = ()
+    GROUP_BYTES = 160
+    VALUE_BYTES = 8
+    FAST_REMOVE = False
+
+    def __new__(cls):
+        return array.__new__(cls, 'l')
+
+    def __reduce__(self):
+        # pickle the raw values (see checkpoint.py)
+        return self.__class__, (), self.tostring()
+
+    def __setstate__(self, state):
+        self.fromstring(state)
+
+    ingest = array.append
 
+    def GetValues(self):
+        return self
+
+    def remove(self, input):
+        try:
+            array.remove(self, input)
+        except ValueError:
+            return False
+        return True
+
+    def GetTransactionValues(self):
+        """
+        Calculates the median, total and number of contributions.
+
+        :return:  tuple of median, total contributions, number of contributions [number, number, number]
+        """
+        if not self:
+            # every contribution was retracted
+            return 0, 0, 0
+        return np.median(np.frombuffer(self, dtype=np.int_)), sum(self), len(self)
+
+
+class DateAccumulatorFrequency(dict):
+    """
+        Holds the number of times each distinct contribution value was seen for a recipient and date, so the memory
+        grows with the number of distinct values.  See DateAccumulatorList for the interface.
+
+    """
+    __slots__ = ()
+    GROUP_BYTES = 350
+    # a guess, since only the distinct values take memory
+    VALUE_BYTES = 16
+    FAST_REMOVE = True
+
+    def GetValues(self):
+        return [value for value, count in self.iteritems() for _ in xrange(count)]
+
+    def ingest(self, input):
+        """
+        Adds a contribution value.
+
+        :param input:  the contribution value [number]
+        :return: Nothing
+        """
+        self[input] = self.get(input, 0) + 1
+
+    def remove(self, input):
+        count = self.get(input, 0)
+        if count == 0:
+            return False
+        if count == 1:
+            del self[input]
+        else:
+            self[input] = count - 1
+        return True
+
+    def GetTransactionValues(self):
+        """
+        Calculates the median, total and number of contributions.
+
+        :return:  tuple of median, total contributions, number of contributions [number, number, number]
+        """
+        if not self:
+            # every contribution was retracted
+            return 0, 0, 0
+        values = sorted(self)
+        count = sum(self.itervalues())
+        total = sum(value * self[value] for value in values)
+
+        # find the values at the two middle ranks
+        rank_lower = (count - 1) >> 1
+        rank_upper = count >> 1
+        median_lower = None
+        rank_start = 0
+        for value in values:
+            rank_start += self[value]
+            if median_lower is None and rank_lower < rank_start:
+                median_lower = value
+            if rank_upper < rank_start:
+                return float(median_lower + value) / 2.0, total, count
+
+
+def DateAccumulatorFactory(date_mode='array'):
+    """
+    Returns the class used to hold the contribution values of a recipient and date.
+
+    :param date_mode: 'array' (DateAccumulatorArray), 'frequency' (DateAccumulatorFrequency) or 'list'
+                      (DateAccumulatorList) [string]
+    :return: date accumulator class [class]
+    """
+    if date_mode == 'array':
+        return DateAccumulatorArray
+    elif date_mode == 'frequency':
+        return DateAccumulatorFrequency
+    elif date_mode == 'list':
+        return DateAccumulatorList
+    raise ValueError('Unknown date mode: {}'.format(date_mode))
+
+
+class KeyInterner(object):
+    """
+        Maps strings (CMTE_ID, zip codes) to small integers, in order of first appearance, so that the group values can
+        be kept in a single flat dict keyed by a packed integer (see PackKey) and every string is stored once.
+
+        codes[key] is the integer of a string and keys[code] is the string of an integer.  A string can also be marked
+        as invalid with Reject, in which case codes[key] is -1; this lets the interner double as a cache of the
+        validation of the string.
+
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.keys = []
+
+    def Intern(self, key):
+        """
+        Returns the integer of a string, assigning the next integer if this is the first time the string is seen.
+
+        :param key: the string [string]
+        :return: the integer [int]
+        """
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.keys)
+            self.keys.append(key)
+        return code
+
+    def Reject(self, key):
+        """
+        Marks a string as invalid.
+
+        :param key: the string [string]
+        :return: -1
+        """
+        self.codes[key] = -1
+        return -1
+
+    def __len__(self):
+        return len(self.keys)
+
+
+# The second part of a packed key (an interned zip code or a YYYYMMDD date) must be smaller than this
+PACKED_KEY_SPACE = 1 << 32
+
+def PackKey(id_code, second_code):
+    """
+    Packs the interned id and a second integer (an interned zip code or a date as YYYYMMDD) into a single integer.
+
+    :param id_code: interned CMTE_ID [int]
+    :param second_code: interned zip code or YYYYMMDD [int]
+    :return: the packed key [int]
+    """
+    return id_code * PACKED_KEY_SPACE + second_code
+
+def UnpackKey(key):
+    """
+    Reverse of PackKey.
+
+    :param key: the packed key [int]
+    :return: tuple of the interned id and the second integer [int, int]
+    """
+    return divmod(key, PACKED_KEY_SPACE)
+
+def FormatTransactionDate(date_key):
+    """
+    Converts the YYYYMMDD integer of a valid date back to the MMDDYYYY string.
+
+    :param date_key: date as YYYYMMDD [int]
+    :return: date as MMDDYYYY [string]
+    """
+    year, month_day = divmod(date_key, 10000)
+    return '%04d%04d' % (month_day, year)
+
+
+class RejectionAccounting(object):
+    """
+        Counts the entries that are rejected for the zip and date files by reason and optionally writes them to a
+        quarantine file.  The reasons are only worked out for entries that have already been rejected, so accepted
+        entries cost nothing.
+
+        Reasons:
+        - OTHER_ID: OTHER_ID is not empty (the entry is not used for either file)
+        - CMTE_ID: CMTE_ID is empty (the entry is not used for either file)
+        - TRANSACTION_AMT: TRANSACTION_AMT is empty (the entry is not used for either file)
+        - ZIP_SHORT: the zip code has less than 5 characters (the entry is not used for the zip file)
+        - ZIP_NONNUMERIC: the zip code is not numeric (the entry is not used for the zip file)
+        - TRANSACTION_DT: the transaction date is invalid (the entry is not used for the date file)
+
+        Each line of the quarantine file is the comma separated reasons followed by the CMTE_ID, ZIP_CODE,
+        TRANSACTION_DT, TRANSACTION_AMT and OTHER_ID of the entry, pipe-delimited.  The file is only opened when the
+        first entry is written to it (so that an instance can be created before forking a worker process) and is
+        buffered.
+
+    """
+    REASONS = ('OTHER_ID', 'CMTE_ID', 'TRANSACTION_AMT', 'ZIP_SHORT', 'ZIP_NONNUMERIC', 'TRANSACTION_DT')
+
+    # size of the buffer of the quarantine file in bytes
+    QUARANTINE_BUFFER_SIZE = 1 << 20
+
+    def __init__(self, quarantine_fullfilename=None):
+        self.counts = dict.fromkeys(self.REASONS, 0)
+        self.quarantine_fullfilename = quarantine_fullfilename
+        self.fid_quarantine = None
+        # size of the quarantine file to continue from (see __setstate__), None to start a new file
+        self.quarantine_position = None
+
+    def __getstate__(self):
+        # flush the quarantine file and remember its size instead of pickling the open file (see checkpoint.py)
+        state = self.__dict__.copy()
+        if self.fid_quarantine is not None:
+            self.fid_quarantine.flush()
+            state['quarantine_position'] = self.fid_quarantine.tell()
+        state['fid_quarantine'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def RejectEntry(self, record):
+        """
+        Records an entry that is not used for either file because of OTHER_ID, CMTE_ID or TRANSACTION_AMT.
+
+        :param record: tuple of 'CMTE_ID', 'ZIP_CODE', 'TRANSACTION_DT', 'TRANSACTION_AMT', 'OTHER_ID' [tuple]
+        :return: Nothing
+        """
+        if record[4] != '':
+            reason = 'OTHER_ID'
+        elif record[0] == '':
+            reason = 'CMTE_ID'
+        else:
+            reason = 'TRANSACTION_AMT'
+        self.counts[reason] += 1
+        if self.quarantine_fullfilename is not None:
+            self.Quarantine(reason, record)
+
+    def RejectFields(self, record, zip_rejected, date_rejected):
+        """
+        Records an entry that is not used for the zip file, the date file or both.
+
+        :param record: tuple of 'CMTE_ID', 'ZIP_CODE', 'TRANSACTION_DT', 'TRANSACTION_AMT', 'OTHER_ID' [tuple]
+        :param zip_rejected: whether the zip code was rejected [bool]
+        :param date_rejected: whether the transaction date was rejected [bool]
+        :return: Nothing
+        """
+        reasons = []
+        if zip_rejected:
+            reasons.append('ZIP_SHORT' if len(record[1]) < 5 else 'ZIP_NONNUMERIC')
+        if date_rejected:
+            reasons.append('TRANSACTION_DT')
+        for reason in reasons:
+            self.counts[reason] += 1
+        if self.quarantine_fullfilename is not None:
+            self.Quarantine(','.join(reasons), record)
+
+    def Quarantine(self, reasons, record):
+        """
+        Writes a rejected entry to the quarantine file.
+
+        :param reasons: comma separated reasons [string]
+        :param record: tuple of 'CMTE_ID', 'ZIP_CODE', 'TRANSACTION_DT', 'TRANSACTION_AMT', 'OTHER_ID' [tuple]
+        :return: Nothing
+        """
+        if self.fid_quarantine is None:
+            if self.quarantine_position is None:
+                self.fid_quarantine = open(self.quarantine_fullfilename, 'wb', self.QUARANTINE_BUFFER_SIZE)
+            else:
+                # continue the file of a checkpoint, dropping what was written after it
+                self.fid_quarantine = open(self.quarantine_fullfilename, 'r+b', self.QUARANTINE_BUFFER_SIZE)
+                self.fid_quarantine.truncate(self.quarantine_position)
+                self.fid_quarantine.seek(self.quarantine_position)
+        self.fid_quarantine.write('%s|%s\n' % (reasons, '|'.join(record)))
+
+    def Merge(self, counts):
+        """
+        Adds the counts of another instance (for example from a worker process).
+
+        :param counts: number of entries for each reason [dict]
+        :return: Nothing
+        """
+        for reason in self.REASONS:
+            self.counts[reason] += counts[reason]
+
+    def Flush(self):
+        """
+        Writes out the buffered lines of the quarantine file and remembers its size, which is pickled instead once the
+        file is detached (see checkpoint.Checkpointer).
+
+        :return: Nothing
+        """
+        if self.fid_quarantine is not None:
+            self.fid_quarantine.flush()
+            self.quarantine_position = self.fid_quarantine.tell()
+
+    def Close(self):
+        """
+        Flushes and closes the quarantine file, remembering its size in case it is continued (see __setstate__).
+
+        :return: Nothing
+        """
+        if self.fid_quarantine is not None:
+            self.fid_quarantine.flush()
+            self.quarantine_position = self.fid_quarantine.tell()
+            self.fid_quarantine.close()
+            self.fid_quarantine = None
+
+    def GetReport(self):
+        """
+        Creates a table of the number of rejected entries for each reason.
+
+        :return: the table [string]
+        """
+        return '\n'.join('%-16s %d' % (reason, self.counts[reason]) for reason in self.REASONS)
 
 
 def CheckZipCode(zipcode):
@@ -145,12 +1496,168 @@ def CheckZipCode(zipcode):
 def CheckTransactionDate(trans_dt):
     """
     Returns a boolean indicating whether the MMDDYYYY string is a valid date.
-    It uses ConvertTransactionDateToEpochGM to check if can convert to epoch time (GM).
+    It uses ParseTransactionDate, which gives the same answer as checking if ConvertTransactionDateToEpochGM can
+    convert it to a positive epoch time (GM) but without time.strptime, except for the dates with less than 8
+    characters (see ParseTransactionDate).
 
     :param trans_dt:  transaction date [string]
     :return:  transaction date valid [bool]
     """
-    return ConvertTransactionDateToEpochGM(trans_dt) > 0
+    return ParseTransactionDate(trans_dt) > 0
+
+
+# Number of days in each month of a non-leap year (index 0 is unused)
+DAYS_IN_MONTH = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+# There are only a few thousand distinct dates per election cycle so the results of ParseTransactionDate are
+# memoized.  The cache is emptied when it reaches this size so that garbage dates cannot grow it without bound.
+TRANSACTION_DATE_CACHE_SIZE = 100000
+transaction_date_cache = {}
+
+def ParseTransactionDate(date_input):
+    """
+    Converts the MMDDYYYY string to the integer YYYYMMDD, which sorts chronologically.
+    The string must have exactly 8 digits and be a date after 01/01/1970 (the dates ConvertTransactionDateToEpochGM
+    converts to a positive epoch), otherwise -1 is returned.  Leap years are taken into account so '02292017' is
+    invalid while '02292016' is valid.
+    Unlike time.strptime, a month or day without its leading zero is invalid: strptime accepts '1122017' (as
+    11/02/2017, although it could be 01/12/2017) and '112017', while the FEC data dictionary gives TRANSACTION_DT as
+    MMDDYYYY.
+    Only integer arithmetic is used and the results are memoized.
+
+    :param date_input:  transaction date [string]
+    :return:  the date as YYYYMMDD; returns -1 if the transaction date is invalid [int]
+    """
+    sort_key = transaction_date_cache.get(date_input)
+    if sort_key is None:
+        sort_key = -1
+        if len(date_input) == 8 and date_input.isdigit():
+            month = int(date_input[:2])
+            day = int(date_input[2:4])
+            year = int(date_input[4:])
+            if 1 <= month <= 12 and day >= 1:
+                days_in_month = DAYS_IN_MONTH[month]
+                if month == 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
+                    days_in_month = 29
+                if day <= days_in_month:
+                    sort_key = year * 10000 + month * 100 + day
+                    # the epoch of 01/01/1970 is 0, which is not positive
+                    if sort_key <= 19700101:
+                        sort_key = -1
+
+        if len(transaction_date_cache) >= TRANSACTION_DATE_CACHE_SIZE:
+            transaction_date_cache.clear()
+        transaction_date_cache[date_input] = sort_key
+    return sort_key
+
+# The bytes that int() skips before and after the digits (isspace of the C locale)
+WHITESPACE_BYTES = np.array([9, 10, 11, 12, 13, 32], dtype=np.uint8)
+
+def _StringBytes(strings, width):
+    """
+    Lays out strings as the rows of a matrix of bytes, padded with zeros.
+
+    :param strings: the strings [list]
+    :param width: number of bytes of each row; longer strings are cut [int]
+    :return: tuple of the matrix [numpy array of uint8] and the lengths of the whole strings, which can be more than
+             width [numpy array of int]
+    """
+    lengths = np.fromiter(imap(len, strings), dtype=np.int_, count=len(strings))
+    matrix = np.zeros((len(strings), width), dtype=np.uint8)
+    if len(strings):
+        packed = np.array(strings, dtype='S{}'.format(width))
+        matrix[:, :packed.itemsize] = packed.view(np.uint8).reshape(len(strings), packed.itemsize)
+    return matrix, lengths
+
+def CheckZipCodes(zipcodes, width=None):
+    """
+    Same as CheckZipCode for many zip codes at once, with numpy operations on their bytes instead of a call per zip
+    code: a zip code is valid if it has at least 5 characters and int() accepts it, i.e. it is digits with an
+    optional sign in front, between optional whitespace (which can also come between the sign and the digits).
+
+    :param zipcodes: the zip codes [list of strings]
+    :param width: only check the first width characters of each zip code, as for zipcode[:width]; None for all of
+                  them [int]
+    :return: zip code valid for each zip code [numpy array of bool]
+    """
+    if width is None:
+        width = max(imap(len, zipcodes)) if len(zipcodes) else 1
+    codes, lengths = _StringBytes(zipcodes, max(width, 1))
+    # the lengths of zipcode[:width]
+    np.minimum(lengths, width, out=lengths)
+    positions = np.arange(codes.shape[1])
+    inside = positions < lengths[:, None]
+    # a zero byte (inside the string) is neither a digit, a sign nor whitespace
+    space = np.in1d(codes, WHITESPACE_BYTES).reshape(codes.shape) & inside
+    digit = (codes >= ord('0')) & (codes <= ord('9'))
+    sign = (codes == ord('+')) | (codes == ord('-'))
+
+    # skip the leading whitespace, a sign after it and the whitespace after the sign; the rest up to the trailing
+    # whitespace must be digits
+    first = np.argmax(inside & ~np.logical_and.accumulate(space, axis=1), axis=1)
+    leading = np.logical_and.accumulate(space | (sign & (positions == first[:, None])), axis=1)
+    trailing = np.logical_and.accumulate((space | ~inside)[:, ::-1], axis=1)[:, ::-1]
+    core = inside & ~leading & ~trailing
+    return (lengths >= 5) & np.all(digit | ~core, axis=1) & np.any(core, axis=1)
+
+def ParseTransactionDates(dates):
+    """
+    Same as ParseTransactionDate for many dates at once, with numpy operations on their bytes instead of a call per
+    date (and without the memoized results).  Only the first 8 bytes of a date are laid out, but a longer date is
+    invalid, as it is for ParseTransactionDate.
+
+    :param dates: transaction dates as MMDDYYYY [list of strings]
+    :return: the dates as YYYYMMDD, -1 for the invalid ones [numpy array of int]
+    """
+    codes, lengths = _StringBytes(dates, 8)
+    digits = codes.astype(np.int_) - ord('0')
+    valid = (lengths == 8) & np.all((digits >= 0) & (digits <= 9), axis=1)
+    month = digits[:, 0] * 10 + digits[:, 1]
+    day = digits[:, 2] * 10 + digits[:, 3]
+    year = digits[:, 4] * 1000 + digits[:, 5] * 100 + digits[:, 6] * 10 + digits[:, 7]
+    valid &= (month >= 1) & (month <= 12) & (day >= 1)
+    days_in_month = np.array(DAYS_IN_MONTH)[np.where(valid, month, 0)]
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    days_in_month[(month == 2) & leap] = 29
+    date_keys = year * 10000 + month * 100 + day
+    # the epoch of 01/01/1970 is 0, which is not positive
+    valid &= (day <= days_in_month) & (date_keys > 19700101)
+    return np.where(valid, date_keys, -1)
+
+def ParseAmounts(amounts):
+    """
+    Same as int() for many TRANSACTION_AMT at once: the amounts that are only digits are converted with numpy
+    operations on their bytes and the others with int().
+
+    :param amounts: the amounts, without zero bytes [numpy array of strings]
+    :return: the amounts [numpy array of int]
+    :raises ValueError: if int() does not accept an amount
+    :raises OverflowError: if an amount does not fit in a 64 bit integer
+    """
+    amounts = np.asarray(amounts)
+    if not len(amounts):
+        return np.zeros(0, dtype=np.int_)
+    codes = amounts.view(np.uint8).reshape(len(amounts), amounts.itemsize)
+    # zero bytes are the padding after the end of the string
+    inside = codes != 0
+    digits = codes.astype(np.int_) - ord('0')
+    plain = np.all(((digits >= 0) & (digits <= 9)) | ~inside, axis=1) & inside[:, 0]
+    values = np.zeros(len(amounts), dtype=np.int_)
+    if amounts.itemsize <= 18:
+        for position in xrange(amounts.itemsize):
+            values = np.where(inside[:, position], values * 10 + digits[:, position], values)
+    else:
+        plain[:] = False
+    other = np.flatnonzero(~plain)
+    if len(other):
+        values[other] = amounts[other].astype(np.int_)
+    return values
+
+# Bits of the flags of a record whose columns were checked (see readers.ValidatedBlockReader): the entry is used at all
+# (it has no OTHER_ID, and has a CMTE_ID and an amount), it is used for the zip file and it is used for the date file
+FLAG_ENTRY = 1
+FLAG_ZIP = 2
+FLAG_DATE = 4
 
 def ConvertTransactionDateToEpochGM(date_input):
     """
@@ -252,9 +1759,46 @@ def CalculateTransactionValues(values):
             total amount of the transactions
             number of transactions
     """
+    if len(values) == 0:
+        # every contribution was retracted
+        return 0, 0, 0
     return np.median(values), sum(values), len(values)
 
 
+def CalculateSegmentTransactionValues(values, lengths):
+    """
+        Calculates the median, sum and count of the transactions of many groups at once, with a single sort, instead
+        of calling CalculateTransactionValues for each group.  The values of the groups are one after the other.
+
+    :param values: transaction values of all the groups [numpy array of int]
+    :param lengths: number of values of each group; the median and total of a group without values are 0 [list]
+    :return:
+        tuple of the following, each with one entry per group
+            medians of transactions [numpy array of float]
+            total amounts of the transactions [numpy array of int]
+            numbers of transactions [numpy array of int]
+    """
+    lengths = np.asarray(lengths, dtype=np.int_)
+    if not np.all(lengths):
+        # every contribution of some of the groups was retracted
+        has_values = lengths > 0
+        medians = np.zeros(len(lengths))
+        totals = np.zeros(len(lengths), dtype=np.int_)
+        if np.any(has_values):
+            medians[has_values], totals[has_values], _ = CalculateSegmentTransactionValues(values,
+                                                                                           lengths[has_values])
+        return medians, totals, lengths
+    starts = np.cumsum(lengths) - lengths
+
+    # sort the values within each group
+    groups = np.repeat(np.arange(len(lengths)), lengths)
+    sorted_values = values[np.lexsort((values, groups))]
+
+    # the average of the two middle values, which are the same value if the number of values is odd
+    medians = (sorted_values[starts + ((lengths - 1) >> 1)] + sorted_values[starts + (lengths >> 1)]) / 2.0
+    return medians, np.add.reduceat(values, starts), lengths
+
+
 def CreateZipOutputString(trans_median, trans_total, trans_number, id, zipcode):
     """
         Takes a couple inputs to build the string to be written to the _zip.txt file.
@@ -282,3 +1826,33 @@ def CreateDateOutputString(id_write, date_str, trans_median, trans_total, trans_
 
     return( '%s|%s|%d|%d|%d\n' %(id_write, date_str, round(trans_median), trans_number, trans_total))
 
+
+def MergeDateLines(old_lines, new_date_lines):
+    """
+    Merges the lines of an existing medianvals_by_date.txt file with new lines for some of its ids and dates, keeping
+    the order by id and then by date.  A new line replaces the old line of the same id and date.
+
+    :param old_lines: lines of the existing file, in order [iterable]
+    :param new_date_lines: tuples of id, date as YYYYMMDD and line, in order (see
+                           ContributionAggregator.IterateDateLines) [iterable]
+    :return: generator of the lines of the merged file [generator]
+    """
+    new_date_lines = iter(new_date_lines)
+    new_date_line = next(new_date_lines, None)
+    for old_line in old_lines:
+        id_write, date_str, _ = old_line.split('|', 2)
+        old_key = (id_write, int(date_str[4:] + date_str[:4]))
+
+        # the new lines before this one and the one replacing it
+        while new_date_line is not None and new_date_line[:2] <= old_key:
+            yield new_date_line[2]
+            replaced = new_date_line[:2] == old_key
+            new_date_line = next(new_date_lines, None)
+            if replaced:
+                break
+        else:
+            yield old_line
+
+    while new_date_line is not None:
+        yield new_date_line[2]
+        new_date_line = next(new_date_lines, None)
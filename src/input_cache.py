@@ -0,0 +1,249 @@
+"""
+Columnar cache of the parsed and validated input of find_political_donors_delta.py (--cache), so that the runs on
+the same input with different settings do not parse and validate the text again.
+
+The first run on an input converts it: the lines are parsed and checked the same way as in
+ContributionAggregator.ProcessRecord (with readers.ValidatedBlockReader), and every record is stored as:
+- id: the number of its CMTE_ID in ids.npy, in order of first appearance (-1 if the entry is rejected)
+- zip: the number of its 5 digit zip code in zips.npy (-1 if the zip code is invalid or the entry is rejected)
+- date: its date as YYYYMMDD (-1 if the date is invalid or the entry is rejected)
+- amount: its contribution (0 if the entry is rejected)
+- flags: a bitmask of helpers.FLAG_ENTRY (the entry is used at all), FLAG_ZIP (for the zip file) and FLAG_DATE (for
+  the date file)
+Each column is a .npy file that later runs memory map.  The records are handed out in the same blocks as the reader
+that parsed the text, with the same byte offsets (block_ends.npy and block_offsets.npy), so checkpoints can be
+resumed with or without the cache.
+
+The cache of an input is a folder of the cache directory named after the input file, a hash of its path and a key
+made of its size, modification time and a fingerprint of its content (see checkpoint.FingerprintPrefix); a changed
+input gets a new cache and the caches of its older versions are removed.  A cache is written to a temporary folder
+that is renamed once complete.  The columns are written a block at a time, to raw files that are turned into .npy
+files at the end, so building the cache of an input of any size only holds one block in memory.
+
+How to use:
+    python input_cache.py itcont.txt cache_directory
+converts an input ahead of the runs, which are then given --cache cache_directory.
+
+"""
+import argparse, hashlib, json, os, shutil, time
+
+import numpy as np
+
+# import my helpers
+import checkpoint, readers
+
+# Version of the layout of the cache; caches of other versions are not used
+CACHE_VERSION = 3
+
+# The columns of the records, with their numpy type
+COLUMNS = [('id', np.intc), ('zip', np.intc), ('date', np.intc), ('amount', np.int_), ('flags', np.uint8)]
+
+# Number of bytes copied at a time from the raw files of the columns to their .npy files
+RAW_COPY_SIZE = 1 << 22
+
+
+def GetCacheKey(input_fullfilename):
+    """
+    :param input_fullfilename: the input file [string]
+    :return: tuple of the prefix of the cache folders of the input file (its name and a hash of its path) and the key
+             of its current content [tuple]
+    """
+    input_fullfilename = os.path.realpath(input_fullfilename)
+    status = os.stat(input_fullfilename)
+    prefix = '{}.{}'.format(os.path.basename(input_fullfilename),
+                            hashlib.sha1(input_fullfilename).hexdigest()[:8])
+    fingerprint = checkpoint.FingerprintPrefix(input_fullfilename, status.st_size)
+    key = hashlib.sha1('{}|{!r}|{}|{}'.format(status.st_size, status.st_mtime, fingerprint,
+                                              CACHE_VERSION)).hexdigest()[:16]
+    return prefix, key
+
+
+def GetCacheFolder(cache_directory, input_fullfilename):
+    """
+    :param cache_directory: the directory of the caches [string]
+    :param input_fullfilename: the input file [string]
+    :return: the folder of the cache of the current content of the input file [string]
+    """
+    prefix, key = GetCacheKey(input_fullfilename)
+    return os.path.join(cache_directory, '{}.{}'.format(prefix, key))
+
+
+def _RawToNpy(raw_fullfilename, npy_fullfilename, dtype, length):
+    """
+    Turns a raw file of the values of a column into a .npy file, copying it after the header a chunk at a time, and
+    removes the raw file.
+
+    :param raw_fullfilename: the raw file [string]
+    :param npy_fullfilename: the .npy file to write [string]
+    :param dtype: the numpy type of the values [numpy dtype]
+    :param length: the number of values [int]
+    :return: Nothing
+    """
+    with open(raw_fullfilename, 'rb') as fid_raw, open(npy_fullfilename, 'wb') as fid:
+        np.lib.format.write_array_header_1_0(fid, {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                                                   'fortran_order': False, 'shape': (length,)})
+        shutil.copyfileobj(fid_raw, fid, RAW_COPY_SIZE)
+    os.remove(raw_fullfilename)
+
+
+def BuildCache(input_fullfilename, cache_directory, block_size=readers.BLOCK_SIZE):
+    """
+    Parses and validates the input and writes its cache, removing the caches of older versions of the input.
+
+    :param input_fullfilename: the input file; compressed files are decompressed (see readers.py) [string]
+    :param cache_directory: the directory of the caches; it is created if needed [string]
+    :param block_size: number of bytes in a block of the text (see readers.py) [int]
+    :return: the cache [InputCache]
+    """
+    prefix, key = GetCacheKey(input_fullfilename)
+    folder = os.path.join(cache_directory, '{}.{}'.format(prefix, key))
+    if readers.GetCompression(input_fullfilename) is not None:
+        reader = readers.CompressedBlockReader(input_fullfilename, block_size)
+    else:
+        reader = readers.MappedBlockReader(input_fullfilename, block_size)
+    reader = readers.ValidatedBlockReader(reader)
+
+    # write everything to a temporary folder that is renamed once complete
+    temporary_folder = folder + '.tmp'
+    if os.path.exists(temporary_folder):
+        shutil.rmtree(temporary_folder)
+    os.makedirs(temporary_folder)
+
+    # the columns are appended to raw files a block at a time
+    raw_fullfilenames = [os.path.join(temporary_folder, name + '.raw') for name, _ in COLUMNS]
+    raw_fids = [open(raw_fullfilename, 'wb') for raw_fullfilename in raw_fullfilenames]
+    try:
+        block_ends = []
+        block_offsets = []
+        number_records = 0
+        for block in reader:
+            for fid, column, (_, dtype) in zip(raw_fids, block, COLUMNS):
+                fid.write(np.ascontiguousarray(column, dtype=dtype).tobytes())
+            number_records += len(block[-1])
+            block_ends.append(number_records)
+            block_offsets.append(reader.offset)
+    finally:
+        for fid in raw_fids:
+            fid.close()
+    for raw_fullfilename, (name, dtype) in zip(raw_fullfilenames, COLUMNS):
+        _RawToNpy(raw_fullfilename, os.path.join(temporary_folder, name + '.npy'), dtype, number_records)
+    np.save(os.path.join(temporary_folder, 'block_ends.npy'), np.array(block_ends, dtype=np.int64))
+    np.save(os.path.join(temporary_folder, 'block_offsets.npy'), np.array(block_offsets, dtype=np.int64))
+    for name, keys in [('ids', reader.id_keys), ('zips', reader.zip_keys)]:
+        np.save(os.path.join(temporary_folder, name + '.npy'),
+                np.array(keys, dtype=str) if keys else np.array([], dtype='S1'))
+    with open(os.path.join(temporary_folder, 'meta.json'), 'wb') as fid:
+        json.dump({'version': CACHE_VERSION, 'input_fullfilename': os.path.realpath(input_fullfilename),
+                   'number_records': number_records, 'input_bytes': reader.offset}, fid, sort_keys=True)
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.rename(temporary_folder, folder)
+
+    # the caches of the older versions of the input
+    for name in os.listdir(cache_directory):
+        if name.startswith(prefix + '.') and name != os.path.basename(folder) and not name.endswith('.tmp'):
+            shutil.rmtree(os.path.join(cache_directory, name), ignore_errors=True)
+    return InputCache(folder)
+
+
+def LoadCache(cache_directory, input_fullfilename):
+    """
+    :param cache_directory: the directory of the caches [string]
+    :param input_fullfilename: the input file [string]
+    :return: the cache of the current content of the input file, or None if there is none [InputCache]
+    """
+    folder = GetCacheFolder(cache_directory, input_fullfilename)
+    if not os.path.exists(os.path.join(folder, 'meta.json')):
+        return None
+    return InputCache(folder)
+
+
+def OpenCache(cache_directory, input_fullfilename):
+    """
+    Loads the cache of the input, building it first if there is none.
+
+    :param cache_directory: the directory of the caches [string]
+    :param input_fullfilename: the input file [string]
+    :return: the cache [InputCache]
+    """
+    cache = LoadCache(cache_directory, input_fullfilename)
+    if cache is None:
+        print('Building the cache of the input in {}'.format(cache_directory))
+        t_start = time.time()
+        cache = BuildCache(input_fullfilename, cache_directory)
+        print('Cache of {} records built in {:.3f} s'.format(cache.number_records, time.time() - t_start))
+    return cache
+
+
+class InputCache(object):
+    """
+        The columns of a cache, memory mapped, with its tables of ids and zip codes.
+
+    """
+
+    def __init__(self, folder):
+        """
+        :param folder: the folder of the cache [string]
+        """
+        self.folder = folder
+        with open(os.path.join(folder, 'meta.json'), 'rb') as fid:
+            meta = json.load(fid)
+        if meta['version'] != CACHE_VERSION:
+            raise ValueError('The cache {} has version {}, not {}'.format(folder, meta['version'], CACHE_VERSION))
+        self.number_records = meta['number_records']
+        self.input_bytes = meta['input_bytes']
+        self.columns = [np.load(os.path.join(folder, name + '.npy'), mmap_mode='r') for name, _ in COLUMNS]
+        self.block_ends = np.load(os.path.join(folder, 'block_ends.npy'))
+        self.block_offsets = np.load(os.path.join(folder, 'block_offsets.npy'))
+        self.id_keys = np.load(os.path.join(folder, 'ids.npy')).tolist()
+        self.zip_keys = np.load(os.path.join(folder, 'zips.npy')).tolist()
+
+
+class CachedBlockReader(object):
+    """
+        Hands out the records of a cache in the blocks the text was parsed in.  Each block is a tuple of the columns
+        id, zip, date, amount and flags of its records (see ContributionAggregator.ProcessColumnBlocks); offset and
+        line_number are those of the text (see readers.py).
+
+    """
+
+    def __init__(self, cache, start_offset=0):
+        """
+        :param cache: the cache of the input [InputCache]
+        :param start_offset: byte offset of the first line to hand out; must be the end of a block, as in a
+                             checkpoint [int]
+        """
+        self.cache = cache
+        self.offset = start_offset
+        self.line_number = 0
+
+    def __iter__(self):
+        cache = self.cache
+        block_ends = cache.block_ends.tolist()
+        block_offsets = cache.block_offsets.tolist()
+        block_index = 0
+        if self.offset > 0:
+            block_index = np.searchsorted(cache.block_offsets, self.offset)
+            if block_index == len(block_offsets) or block_offsets[block_index] != self.offset:
+                raise ValueError('The offset {} is not the end of a block of the cache'.format(self.offset))
+            block_index += 1
+        start = block_ends[block_index - 1] if block_index > 0 else 0
+        for end, offset in zip(block_ends[block_index:], block_offsets[block_index:]):
+            block = tuple(np.asarray(column[start:end]) for column in cache.columns)
+            self.offset = offset
+            self.line_number += end - start
+            start = end
+            yield block
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Converts an itcont.txt file to the columnar cache of '
+                                                 'find_political_donors_delta.py --cache.')
+    parser.add_argument('input_fullfilename', help='the itcont.txt input file')
+    parser.add_argument('cache_directory', help='the directory of the caches')
+    args = parser.parse_args()
+    cache = LoadCache(args.cache_directory, args.input_fullfilename)
+    if cache is None:
+        cache = BuildCache(args.input_fullfilename, args.cache_directory)
+    print('{} records in {}'.format(cache.number_records, cache.folder))
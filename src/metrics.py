@@ -0,0 +1,205 @@
+"""
+Exports the progress of find_political_donors_delta.py to a file that schedulers and dashboards can watch (--metrics),
+instead of scraping the progress report printed to the terminal.
+
+Every metrics_seconds (checked after every block of input lines) and at the end of the run, a snapshot is taken of:
+- the number of input lines and bytes processed, and the rates since the last snapshot and since the start
+- the number of entries accepted and rejected for the zip and date files
+- the number of groups (recipient and zip code, recipient and date) held in memory
+- the resident memory of the process
+- the estimated time remaining, from the bytes left in the input and the rate since the last snapshot
+- once the input is processed, the number of date file lines written so far
+
+No input lines are read while the date file is written, so the snapshots taken then (every metrics_seconds, checked
+every DATE_LINES_CHECK lines) and at the end keep the rates of the last snapshot for which input lines were processed.
+
+In the 'prometheus' format, the file is rewritten with the latest snapshot in the Prometheus text format (for the
+textfile collector of the node exporter, for instance); it is written to a temporary file that is renamed over it, so
+a reader always sees a complete snapshot.  In the 'jsonl' format, every snapshot is appended to the file as a line of
+JSON in a single write, so the file keeps the history of the run and can be followed with tail -f.
+
+"""
+import json, os, resource, time
+
+# Default number of seconds between snapshots
+METRICS_SECONDS = 5.0
+
+# Number of date file lines written between checks of whether a snapshot is due
+DATE_LINES_CHECK = 1 << 14
+
+# Prefix of the names of the Prometheus metrics
+METRIC_PREFIX = 'political_donors_'
+
+# Name, type and help of each metric of the Prometheus format, with the key of its value in the snapshot; metrics
+# whose value is None are left out
+PROMETHEUS_METRICS = [
+    ('lines_total', 'counter', 'Input lines processed.', 'lines'),
+    ('bytes_total', 'counter', 'Input bytes processed.', 'bytes'),
+    ('lines_per_second', 'gauge', 'Input lines per second since the last snapshot.', 'lines_per_second'),
+    ('bytes_per_second', 'gauge', 'Input bytes per second since the last snapshot.', 'bytes_per_second'),
+    ('average_lines_per_second', 'gauge', 'Input lines per second since the start.', 'average_lines_per_second'),
+    ('accepted_total{file="zip"}', 'counter', 'Entries used for the output file.', 'accepted_zip'),
+    ('accepted_total{file="date"}', None, None, 'accepted_date'),
+    ('rejected_total{file="zip"}', 'counter', 'Entries skipped for the output file.', 'rejected_zip'),
+    ('rejected_total{file="date"}', None, None, 'rejected_date'),
+    ('groups{file="zip"}', 'gauge', 'Groups held in memory.', 'groups_zip'),
+    ('groups{file="date"}', None, None, 'groups_date'),
+    ('resident_memory_bytes', 'gauge', 'Resident memory of the process.', 'resident_memory_bytes'),
+    ('eta_seconds', 'gauge', 'Estimated seconds until the input is processed.', 'eta_seconds'),
+    ('date_lines_total', 'counter', 'Date file lines written.', 'date_lines'),
+    ('elapsed_seconds', 'gauge', 'Seconds since the start of the run.', 'elapsed_seconds'),
+    ('done', 'gauge', 'Whether the run is complete.', 'done'),
+]
+
+
+def GetResidentMemory():
+    """
+    Returns the resident memory of the process, from /proc/self/statm (Linux) or else the peak resident memory.
+
+    :return: bytes [int]
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as fid:
+            return int(fid.read().split()[1]) * resource.getpagesize()
+    except (IOError, IndexError, ValueError):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on OS X
+        return max_rss if os.uname()[0] == 'Darwin' else max_rss * 1024
+
+
+def FormatPrometheus(snapshot):
+    """
+    Creates the Prometheus text format of a snapshot.
+
+    :param snapshot: the snapshot (see MetricsExporter.TakeSnapshot) [dict]
+    :return: the text [string]
+    """
+    lines = []
+    for name, metric_type, help_text, key in PROMETHEUS_METRICS:
+        if metric_type is not None:
+            base_name = METRIC_PREFIX + name.split('{')[0]
+            lines.append('# HELP {} {}'.format(base_name, help_text))
+            lines.append('# TYPE {} {}'.format(base_name, metric_type))
+        if snapshot[key] is not None:
+            lines.append('{}{} {}'.format(METRIC_PREFIX, name, repr(float(snapshot[key]))
+                                          if isinstance(snapshot[key], float) else int(snapshot[key])))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter(object):
+    """
+        Takes snapshots of the progress of a run and writes them to a file.
+
+        How to use: after every block, Export(aggregator, reader.offset) if Due(); while the date file is written,
+        Export(aggregator, reader.offset, date_lines=...) if Due(); at the end, Export(aggregator, reader.offset,
+        done=True, date_lines=...).
+
+    """
+
+    def __init__(self, metrics_fullfilename, metrics_format='prometheus', metrics_seconds=METRICS_SECONDS,
+                 total_bytes=None, start_offset=0, start_line_number=0):
+        """
+        :param metrics_fullfilename: the file to write [string]
+        :param metrics_format: 'prometheus' or 'jsonl' [string]
+        :param metrics_seconds: seconds between snapshots [float]
+        :param total_bytes: size of the input, for the estimated time remaining; None if unknown [int]
+        :param start_offset: byte offset of the first input line of the run [int]
+        :param start_line_number: number of input lines processed before the run, when it continues a checkpoint or
+                                  the last run [int]
+        """
+        if metrics_format not in ('prometheus', 'jsonl'):
+            raise ValueError('Unknown metrics format: {}'.format(metrics_format))
+        self.metrics_fullfilename = metrics_fullfilename
+        self.metrics_format = metrics_format
+        self.metrics_seconds = metrics_seconds
+        self.total_bytes = total_bytes
+        self.start_line_number = start_line_number
+
+        self.time_started = time.time()
+        # the last snapshot: time, number of input lines and input offset
+        self.time_exported = self.time_started
+        self.line_number_exported = start_line_number
+        self.offset_exported = start_offset
+        # the rates of the last snapshot taken while input lines were processed: lines and bytes per second
+        self.rates = (None, None)
+
+        # the JSON lines of a run start with an empty file
+        if metrics_format == 'jsonl':
+            open(metrics_fullfilename, 'wb').close()
+
+    def Due(self):
+        """
+        :return: whether it is time for a snapshot [bool]
+        """
+        return time.time() - self.time_exported >= self.metrics_seconds
+
+    def TakeSnapshot(self, aggregator, input_offset, done=False, date_lines=None):
+        """
+        Takes a snapshot of the progress and makes it the last snapshot.
+
+        :param aggregator: the aggregator of the run [ContributionAggregator or ShardedAggregator]
+        :param input_offset: byte offset of the first input line that has not been processed [int]
+        :param done: whether the run is complete [bool]
+        :param date_lines: number of date file lines written so far, once the input is processed; None while it is
+                           [int]
+        :return: the snapshot [dict]
+        """
+        now = time.time()
+        line_number = aggregator.line_number
+        seconds = now - self.time_exported
+        elapsed_seconds = now - self.time_started
+        eta_seconds = None
+        if done or date_lines is not None:
+            # no input is read any more
+            lines_per_second, bytes_per_second = self.rates
+            eta_seconds = 0.0
+        else:
+            lines_per_second = (line_number - self.line_number_exported) / seconds if seconds > 0 else None
+            bytes_per_second = (input_offset - self.offset_exported) / seconds if seconds > 0 else None
+            if seconds > 0 and line_number > self.line_number_exported:
+                self.rates = (lines_per_second, bytes_per_second)
+            if self.total_bytes is not None and bytes_per_second:
+                eta_seconds = max(self.total_bytes - input_offset, 0) / bytes_per_second
+        number_zip_groups, number_date_groups = aggregator.NumberGroups()
+
+        snapshot = {'time': now, 'elapsed_seconds': elapsed_seconds, 'done': int(done),
+                    'lines': line_number, 'bytes': input_offset,
+                    'lines_per_second': lines_per_second, 'bytes_per_second': bytes_per_second,
+                    'average_lines_per_second': (line_number - self.start_line_number) / elapsed_seconds
+                    if elapsed_seconds > 0 else None,
+                    'accepted_zip': line_number - aggregator.skipped_zip, 'rejected_zip': aggregator.skipped_zip,
+                    'accepted_date': line_number - aggregator.skipped_date, 'rejected_date': aggregator.skipped_date,
+                    'groups_zip': number_zip_groups, 'groups_date': number_date_groups,
+                    'resident_memory_bytes': GetResidentMemory(), 'eta_seconds': eta_seconds,
+                    'date_lines': date_lines}
+
+        self.time_exported = now
+        self.line_number_exported = line_number
+        self.offset_exported = input_offset
+        return snapshot
+
+    def Export(self, aggregator, input_offset, done=False, date_lines=None):
+        """
+        Takes a snapshot of the progress and writes it to the file.
+
+        :param aggregator: the aggregator of the run [ContributionAggregator or ShardedAggregator]
+        :param input_offset: byte offset of the first input line that has not been processed [int]
+        :param done: whether the run is complete [bool]
+        :param date_lines: number of date file lines written so far, once the input is processed; None while it is
+                           [int]
+        :return: the snapshot [dict]
+        """
+        snapshot = self.TakeSnapshot(aggregator, input_offset, done, date_lines)
+        if self.metrics_format == 'prometheus':
+            temporary_fullfilename = self.metrics_fullfilename + '.tmp'
+            with open(temporary_fullfilename, 'wb') as fid:
+                fid.write(FormatPrometheus(snapshot))
+            os.rename(temporary_fullfilename, self.metrics_fullfilename)
+        else:
+            # a single write of the whole line, so that readers never see part of it
+            fd = os.open(self.metrics_fullfilename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, json.dumps(snapshot, sort_keys=True) + '\n')
+            finally:
+                os.close(fd)
+        return snapshot
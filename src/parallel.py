@@ -0,0 +1,309 @@
+"""
+Runs the aggregation of find_political_donors_delta.py on several processes.
+
+The input lines are sharded by a hash of CMTE_ID.  The main process reads and parses the input once and hands every
+worker process the records of its shard, block by block, so each worker owns all the zip and date values of its ids.
+The records of a shard go through its queue as a single string of their fields (see _SplitBlock), which costs next
+to nothing to pickle and unpickle, unlike a tuple per record.  For every block, the workers send back the zip file
+lines of their shard together with the index of the record that produced them; the main process, which kept the
+position of every record within the block, puts them back in input order.  The main process reads up to QUEUE_SIZE
+blocks ahead of the results, so that it parses the next blocks while the workers aggregate the previous ones.  At the
+end, the date file lines of every worker (already sorted by id and date) are merged.
+
+If the rejections are recorded, every worker writes its own quarantine file, named after the quarantine file with the
+index of the shard appended (e.g. quarantine.txt.0), and the counts of the workers are added up.
+
+If there is a memory budget for the values of the date file, every worker gets an equal share of it and spills its own
+values to disk.
+
+The refunds (see ContributionAggregator negative_as_retraction) are retracted by the workers: a refund has the CMTE_ID
+of the contribution it retracts, so both are in the same shard.
+
+This relies on the workers being forked (the default on Linux and OS X) so that the aggregators and the classes they
+use do not need to be pickled.
+
+"""
+import collections, heapq, multiprocessing, operator, Queue, traceback
+from itertools import chain, imap, izip
+
+import numpy as np
+
+import helpers
+from aggregator import ContributionAggregator
+
+# Maximum number of blocks the main process can hand out to the workers ahead of their results
+QUEUE_SIZE = 4
+
+# Seconds to wait for a result of a worker before checking that it is still alive
+WORKER_POLL_SECONDS = 1.0
+
+
+def _SplitBlock(records, number_shards):
+    """
+    Splits the records of a block among the shards by a hash of CMTE_ID.  The records of a shard are handed out as a
+    single string of all their fields joined with pipes (which no field holds, see readers.ParseBlock); the worker
+    splits it and takes the fields five at a time (see _JoinedRecords).
+
+    :param records: records of the block (see readers.py) [list]
+    :param number_shards: number of shards [int]
+    :return: list of tuples, for every shard, of its joined records and of their positions within the block [list]
+    """
+    shard_indices = np.fromiter(imap(hash, imap(operator.itemgetter(0), records)), np.int64, len(records)) % \
+        number_shards
+    order = np.argsort(shard_indices, kind='mergesort').tolist()
+    shards = []
+    start = 0
+    for end in np.cumsum(np.bincount(shard_indices, minlength=number_shards)).tolist():
+        positions = order[start:end]
+        start = end
+        shards.append(('|'.join(chain.from_iterable(imap(records.__getitem__, positions))), positions))
+    return shards
+
+
+def _JoinedRecords(joined):
+    """
+    Returns the records joined by _SplitBlock.
+
+    :param joined: fields of the records joined with pipes [string]
+    :return: list of the records [list]
+    """
+    fields = iter(joined.split('|'))
+    # an empty string has a single field and so no record
+    return zip(*[fields] * 5)
+
+
+def _ShardWorker(aggregator, blocks, queue):
+    """
+    Runs in a worker process.  Processes the records of one shard, as the main process hands them out on blocks, and
+    puts the results on queue:
+    - for every block, a tuple of the indices of the records that produced a zip file line, those zip file lines and a
+      tuple of the progress of the worker: the numbers of skipped entries for the zip and date files and the numbers of
+      groups (see ContributionAggregator.NumberGroups)
+    - once blocks gives None, a tuple of the number of skipped entries for the zip and date files, the number of
+      retracted contributions for the zip and date files, the list of date file tuples (see
+      ContributionAggregator.IterateDateLines) and the counts of the rejections (or None)
+    If anything fails, the traceback is put on the queue instead.
+
+    :param aggregator: empty aggregator [ContributionAggregator]
+    :param blocks: queue of the joined records of the shard (see _SplitBlock), one per block of input lines, then
+                   None [multiprocessing.Queue]
+    :param queue: queue for the results [multiprocessing.Queue]
+    :return: Nothing
+    """
+    try:
+        process_record = aggregator.ProcessRecord
+        while True:
+            joined = blocks.get()
+            if joined is None:
+                break
+            records = _JoinedRecords(joined)
+            indices = []
+            zip_lines = []
+            for index, record in enumerate(records):
+                lineOut = process_record(record)
+                if lineOut is not None:
+                    indices.append(index)
+                    zip_lines.append(lineOut)
+            # the worker's line_number counts the input lines of its shard
+            aggregator.line_number += len(records)
+            aggregator.CheckDateMemory()
+            queue.put((indices, zip_lines,
+                       (aggregator.skipped_zip, aggregator.skipped_date) + aggregator.NumberGroups()))
+        aggregator.Close()
+        rejection_counts = aggregator.rejections.counts if aggregator.rejections is not None else None
+        queue.put((aggregator.skipped_zip, aggregator.skipped_date, aggregator.retracted_zip,
+                   aggregator.retracted_date, list(aggregator.IterateDateLines()), rejection_counts))
+    except Exception:
+        queue.put(traceback.format_exc())
+
+
+class ShardedAggregator(object):
+    """
+        Same interface as ContributionAggregator (ProcessBlocks, IterateDateLines, NumberGroups, Close, line_number,
+        skipped_zip, skipped_date, retracted_zip, retracted_date and rejections) but the work is spread over
+        number_workers processes.  The offset of the reader handed to ProcessBlocks is that of the blocks read so far,
+        which can be up to QUEUE_SIZE blocks ahead of the zip file lines handed out.
+
+    """
+
+    def __init__(self, number_workers, zip_store_factory, date_accumulator_class, rejections=None,
+                 date_memory_budget=None, spill_directory=None, negative_as_retraction=False):
+        self.number_workers = number_workers
+        self.zip_store_factory = zip_store_factory
+        self.date_accumulator_class = date_accumulator_class
+        self.rejections = rejections
+        self.date_memory_budget = date_memory_budget
+        self.spill_directory = spill_directory
+        self.negative_as_retraction = negative_as_retraction
+
+        self.line_number = 0
+        self.skipped_zip = 0
+        self.skipped_date = 0
+        # only known once the input is exhausted
+        self.retracted_zip = 0
+        self.retracted_date = 0
+        self.number_groups = (0, 0)
+        self.date_lists = []
+
+    def _Get(self, shard_index, queue, worker):
+        """
+        Gets the next result of a worker, raising an error if the worker failed.  A worker that dies without putting
+        its traceback on the queue (killed by a signal or the OOM killer, or exited from native code) is noticed
+        within WORKER_POLL_SECONDS.
+
+        :param shard_index: index of the shard of the worker [int]
+        :param queue: queue of the worker [multiprocessing.Queue]
+        :param worker: the worker [multiprocessing.Process]
+        :return: the result
+        :raises RuntimeError: if the worker failed or died
+        """
+        while True:
+            try:
+                result = queue.get(timeout=WORKER_POLL_SECONDS)
+                break
+            except Queue.Empty:
+                if not worker.is_alive():
+                    # it may have put the result just before it exited
+                    try:
+                        result = queue.get(False)
+                        break
+                    except Queue.Empty:
+                        raise RuntimeError('The worker of shard {} died with exit code {}'.format(shard_index,
+                                                                                                  worker.exitcode))
+        if isinstance(result, str):
+            raise RuntimeError('The worker of shard {} failed:\n{}'.format(shard_index, result))
+        return result
+
+    def ProcessBlocks(self, reader, profiler=None):
+        """
+        Starts the workers, hands them the records of their shards as the reader parses them and yields, for every
+        block, the list of lines for the zip file in the same order as the input lines.
+
+        :param reader: reader of the input file, not yet iterated (see readers.py) [reader]
+        :param profiler: not supported, since the stages run in the workers; must be None
+        :return: generator of lists of lines for the medianvals_by_zip.txt file [generator]
+        """
+        if profiler is not None:
+            raise ValueError('Profiling is not supported with more than one worker')
+        number_workers = self.number_workers
+        # the results are not bounded by the queues but by the number of blocks handed out ahead of them, so a worker
+        # never waits for the main process to take its results while the main process waits for it to take a block
+        blocks = [multiprocessing.Queue() for _ in xrange(number_workers)]
+        queues = [multiprocessing.Queue() for _ in xrange(number_workers)]
+        shard_date_memory_budget = None
+        if self.date_memory_budget is not None:
+            shard_date_memory_budget = self.date_memory_budget / number_workers
+        workers = [multiprocessing.Process(target=_ShardWorker,
+                                           args=(ContributionAggregator(self.zip_store_factory,
+                                                                        self.date_accumulator_class,
+                                                                        self._ShardRejections(shard_index),
+                                                                        shard_date_memory_budget,
+                                                                        self.spill_directory,
+                                                                        self.negative_as_retraction),
+                                                 blocks[shard_index], queues[shard_index]))
+                   for shard_index in xrange(number_workers)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        try:
+            # the number of records and the positions of the records of every shard, for the blocks handed out
+            pending = collections.deque()
+            for records in reader:
+                shards = _SplitBlock(records, number_workers)
+                for shard_blocks, (shard_records, _) in izip(blocks, shards):
+                    shard_blocks.put(shard_records)
+                pending.append((len(records), [positions for _, positions in shards]))
+                if len(pending) > QUEUE_SIZE:
+                    yield self._Collect(queues, workers, *pending.popleft())
+            while pending:
+                yield self._Collect(queues, workers, *pending.popleft())
+
+            for shard_blocks in blocks:
+                shard_blocks.put(None)
+            self.skipped_zip = 0
+            self.skipped_date = 0
+            for shard_index, (queue, worker) in enumerate(izip(queues, workers)):
+                skipped_zip, skipped_date, retracted_zip, retracted_date, date_list, rejection_counts = \
+                    self._Get(shard_index, queue, worker)
+                self.skipped_zip += skipped_zip
+                self.skipped_date += skipped_date
+                self.retracted_zip += retracted_zip
+                self.retracted_date += retracted_date
+                self.date_lists.append(date_list)
+                if rejection_counts is not None:
+                    self.rejections.Merge(rejection_counts)
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+            # the blocks a dead worker did not take must not keep the main process from exiting
+            for shard_blocks in blocks:
+                shard_blocks.cancel_join_thread()
+
+    def _Collect(self, queues, workers, number_records, shard_positions):
+        """
+        Gets the results of the workers for the oldest block handed out and adds up their progress.
+
+        :param queues: queues of the workers [list]
+        :param workers: the workers [list]
+        :param number_records: number of records in the block [int]
+        :param shard_positions: for every shard, the positions within the block of the records handed to it [list]
+        :return: list of lines for the medianvals_by_zip.txt file, in the same order as the input lines [list]
+        """
+        results = [self._Get(shard_index, queue, worker)
+                   for shard_index, (queue, worker) in enumerate(izip(queues, workers))]
+
+        # put the zip file lines of the shards back in input order
+        zip_lines = [None] * number_records
+        for (indices, shard_zip_lines, _), positions in izip(results, shard_positions):
+            for index, lineOut in izip(indices, shard_zip_lines):
+                zip_lines[positions[index]] = lineOut
+        self.line_number += number_records
+
+        # add up the progress of the workers
+        self.skipped_zip, self.skipped_date, number_zip_groups, number_date_groups = \
+            [sum(column) for column in zip(*[result[2] for result in results])]
+        self.number_groups = (number_zip_groups, number_date_groups)
+        return [lineOut for lineOut in zip_lines if lineOut is not None]
+
+    def _ShardRejections(self, shard_index):
+        """
+        Creates the RejectionAccounting of a worker.
+
+        :param shard_index: index of the shard [int]
+        :return: RejectionAccounting or None if the rejections are not recorded
+        """
+        if self.rejections is None:
+            return None
+        quarantine_fullfilename = self.rejections.quarantine_fullfilename
+        if quarantine_fullfilename is not None:
+            quarantine_fullfilename = '{}.{}'.format(quarantine_fullfilename, shard_index)
+        return helpers.RejectionAccounting(quarantine_fullfilename)
+
+    def NumberGroups(self):
+        """
+        Returns the number of groups held in memory by all the workers, as of the last block.
+
+        :return: tuple of the number of groups of the zip file and of the date file [tuple]
+        """
+        return self.number_groups
+
+    def Close(self):
+        """
+        Nothing to do; the workers close their own quarantine files.
+
+        :return: Nothing
+        """
+        pass
+
+    def IterateDateLines(self):
+        """
+        Merges the date file lines of the workers; the ids of the workers are distinct so the result is sorted by id
+        and then by date.
+
+        :return: generator of tuples of id, date as YYYYMMDD and the line for the medianvals_by_date.txt file
+                 [generator]
+        """
+        return heapq.merge(*self.date_lists)
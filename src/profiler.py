@@ -0,0 +1,136 @@
+"""
+Per-stage timers and counters of find_political_donors_delta.py (--profile).
+
+The time of a run is split into these stages:
+- read: getting the bytes of the input lines (the page faults of the memory mapped file or the reads of the file)
+- parse: pulling the columns out of the lines (readers.ParseBlock or helpers.ParseLine)
+- validate: the checks of the entries, the interning of the ids and zip codes and the checks of the zip codes and dates
+- zip_ingest: the running median, total and count of the recipient and zip code
+- format_write: creating the lines of the zip file and writing them
+- date_accumulate: adding the contribution to the values of the recipient and date
+- date_write: calculating and writing the lines of the date file at the end
+
+Reading, parsing, aggregating and writing are timed around each block of input lines, which costs nothing next to the
+work on the thousands of lines of a block.  The aggregation is only split into its stages for one record in every
+sample_interval: ContributionAggregator.ProcessRecord is given record_seconds for those records and times itself
+between its stages, and the time of the aggregation of the blocks is shared out between the stages in the proportions
+measured on those records.  When profiling is disabled, the profiler is None, which is checked once per block, and
+record_seconds is None, which ProcessRecord checks at the end of each stage.
+
+"""
+import json, time
+
+# The stages, in the order of the report
+STAGES = ('read', 'parse', 'validate', 'zip_ingest', 'format_write', 'date_accumulate', 'date_write')
+
+# The stages of the aggregation of each record, measured on the sampled records
+RECORD_STAGES = ('validate', 'zip_ingest', 'format_write', 'date_accumulate')
+
+# One record in this many is timed stage by stage
+SAMPLE_INTERVAL = 64
+
+
+class StageProfiler(object):
+    """
+        Cumulative time of each stage and counters of a run.
+
+        How to use: the readers and the aggregator time their stages with Add (see readers.py and aggregator.py) and
+        count what they handle in counts; GetResults and GetReport can be called at any time, and Stop freezes the
+        wall time at the end of the run.
+
+    """
+
+    def __init__(self, sample_interval=SAMPLE_INTERVAL):
+        """
+        :param sample_interval: one record in this many is timed stage by stage [int]
+        """
+        self.sample_interval = sample_interval
+        # seconds of the stages timed around the blocks, and of the aggregation of the blocks as a whole
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.aggregate_seconds = 0.0
+        # seconds of the aggregation stages of the sampled records only
+        self.record_seconds = dict.fromkeys(RECORD_STAGES, 0.0)
+        self.counts = {'blocks': 0, 'records': 0, 'sampled_records': 0, 'input_bytes': 0, 'zip_lines': 0}
+        self.time_started = time.time()
+        self.time_stopped = None
+
+    def Add(self, stage, seconds):
+        """
+        Adds time to a stage; 'aggregate' is the time of the aggregation of the records of a block.
+
+        :param stage: one of STAGES or 'aggregate' [string]
+        :param seconds: time spent [float]
+        :return: Nothing
+        """
+        if stage == 'aggregate':
+            self.aggregate_seconds += seconds
+        else:
+            self.seconds[stage] += seconds
+
+    def Stop(self):
+        """
+        Ends the wall time of the run.
+
+        :return: Nothing
+        """
+        self.time_stopped = time.time()
+
+    def GetStageSeconds(self):
+        """
+        Returns the time of every stage, with the time of the aggregation shared out between its stages in the
+        proportions measured on the sampled records.
+
+        :return: seconds by stage [dict]
+        """
+        stage_seconds = dict(self.seconds)
+        sampled_seconds = sum(self.record_seconds.values())
+        for stage in RECORD_STAGES:
+            if sampled_seconds > 0:
+                stage_seconds[stage] += self.aggregate_seconds * self.record_seconds[stage] / sampled_seconds
+        return stage_seconds
+
+    def GetResults(self):
+        """
+        Returns the breakdown of the run so far.
+
+        :return: wall time, sample interval, counters and, for every stage, its time and share of the wall time (the
+                 time outside of the stages is under 'other') [dict]
+        """
+        wall_seconds = (self.time_stopped or time.time()) - self.time_started
+        stage_seconds = self.GetStageSeconds()
+        stage_seconds['other'] = max(wall_seconds - sum(stage_seconds.values()), 0.0)
+        return {'wall_seconds': wall_seconds, 'sample_interval': self.sample_interval, 'counts': dict(self.counts),
+                'stages': dict((stage, {'seconds': seconds, 'share': seconds / wall_seconds if wall_seconds > 0
+                                        else 0.0})
+                               for stage, seconds in stage_seconds.iteritems())}
+
+    def GetReport(self):
+        """
+        Creates a table of the time of every stage, its share of the wall time and its time per input line.
+
+        :return: the table [string]
+        """
+        results = self.GetResults()
+        number_records = results['counts']['records']
+        wall_seconds = results['wall_seconds']
+        lines = ['%-16s %10s %7s %10s' % ('stage', 'seconds', 'share', 'us/line')]
+        for stage in STAGES + ('other',):
+            seconds = results['stages'][stage]['seconds']
+            lines.append('%-16s %10.3f %6.1f%% %10.3f' % (stage, seconds, 100 * results['stages'][stage]['share'],
+                                                          1e6 * seconds / number_records if number_records else 0.0))
+        lines.append('%-16s %10.3f' % ('total', wall_seconds))
+        lines.append('%d lines (%d sampled) in %d blocks, %.1f MB, %.0f lines/s, %.2f MB/s' % (
+            number_records, results['counts']['sampled_records'], results['counts']['blocks'],
+            results['counts']['input_bytes'] / 1e6, number_records / wall_seconds if wall_seconds > 0 else 0.0,
+            results['counts']['input_bytes'] / 1e6 / wall_seconds if wall_seconds > 0 else 0.0))
+        return '\n'.join(lines)
+
+    def WriteResults(self, results_fullfilename):
+        """
+        Writes the results of GetResults to a JSON file.
+
+        :param results_fullfilename: the JSON file [string]
+        :return: Nothing
+        """
+        with open(results_fullfilename, 'wb') as fid:
+            json.dump(self.GetResults(), fid, indent=2, sort_keys=True)
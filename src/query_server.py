@@ -0,0 +1,311 @@
+"""
+Query server of find_political_donors_delta.py (--serve): answers queries over HTTP, on a local TCP port or a Unix
+socket, with the current values of the aggregation while the input is processed and, once it is done, until the
+process is interrupted.  This replaces searching the zip file, whose lines are the running values at the time of each
+contribution.
+
+The queries (GET, JSON responses; the medians are rounded as in the output files):
+- /zip?id=CMTE_ID&zip=ZIP_CODE: the median, number and total of the contributions of a recipient and zip code
+- /zips?id=CMTE_ID: the same for all the zip codes of a recipient, ordered by zip code
+- /dates?id=CMTE_ID[&start=MMDDYYYY][&end=MMDDYYYY]: the same for the dates of a recipient, ordered by date, from
+  start to end included
+- /status: the number of input lines and groups processed so far, and whether the run is done
+
+A recipient and zip code or date is looked up directly in dat_zip or dat_date with its packed key (see
+helpers.PackKey).  AggregateIndex keeps, for every recipient, its zip codes and its sorted dates, so the zip codes of
+a recipient are listed and a range of dates is found by bisection without scanning the groups; the index is brought
+up to date with the groups created by each block (see ContributionAggregator.TrackNewGroups).
+
+The queries are answered by threads of the server while the main thread processes the input.  The main thread holds
+a lock while it aggregates a block (see QueryServer.LockBlocks) and the queries take it too, so a query sees the
+values of whole blocks and waits at most for the aggregation of one block; reading the input is not locked.
+
+"""
+import bisect, json, os, signal, socket, threading, urlparse
+import BaseHTTPServer, SocketServer
+
+import helpers, streaming
+
+
+class AggregateIndex(object):
+    """
+        Indexes of the groups of a ContributionAggregator by recipient, and the queries over them.
+
+        How to use: create it before the aggregator processes the blocks to index (the groups it already holds are
+        indexed right away) and call Update after every block.
+
+    """
+
+    def __init__(self, aggregator):
+        """
+        :param aggregator: the aggregator of the run; the values of the date file must not be spilled to disk
+                           [ContributionAggregator]
+        """
+        self.aggregator = aggregator
+        # interned zip codes and sorted dates as YYYYMMDD, by interned id
+        self.zip_codes_by_id = {}
+        self.dates_by_id = {}
+
+        for key in aggregator.dat_zip:
+            id_code, zip_code = helpers.UnpackKey(key)
+            self.zip_codes_by_id.setdefault(id_code, []).append(zip_code)
+        for key in aggregator.dat_date:
+            id_code, date_key = helpers.UnpackKey(key)
+            self.dates_by_id.setdefault(id_code, []).append(date_key)
+        for dates in self.dates_by_id.itervalues():
+            dates.sort()
+        aggregator.TrackNewGroups()
+
+    def Update(self):
+        """
+        Adds the groups created since the last update.
+
+        :return: Nothing
+        """
+        aggregator = self.aggregator
+        for key in aggregator.new_zip_keys:
+            id_code, zip_code = helpers.UnpackKey(key)
+            self.zip_codes_by_id.setdefault(id_code, []).append(zip_code)
+        for key in aggregator.new_date_keys:
+            id_code, date_key = helpers.UnpackKey(key)
+            bisect.insort(self.dates_by_id.setdefault(id_code, []), date_key)
+        del aggregator.new_zip_keys[:]
+        del aggregator.new_date_keys[:]
+
+    def GetZip(self, id, zipcode):
+        """
+        :param id: CMTE_ID [string]
+        :param zipcode: ZIP_CODE; only the first 5 characters are used [string]
+        :return: the id, zip code, median, number and total of the contributions, or None if there are none [dict]
+        """
+        aggregator = self.aggregator
+        id_code = aggregator.id_codes.codes.get(id)
+        zip_code = aggregator.zip_codes.codes.get(zipcode[:5])
+        if id_code is None or zip_code is None or zip_code < 0:
+            return None
+        group = aggregator.dat_zip.get(helpers.PackKey(id_code, zip_code))
+        if group is None:
+            return None
+        return self._ZipResult(id, zipcode[:5], group)
+
+    def GetZips(self, id):
+        """
+        :param id: CMTE_ID [string]
+        :return: the values of every zip code of the recipient (see GetZip) ordered by zip code, or None if the
+                 recipient has none [list]
+        """
+        aggregator = self.aggregator
+        id_code = aggregator.id_codes.codes.get(id)
+        zip_codes = self.zip_codes_by_id.get(id_code)
+        if zip_codes is None:
+            return None
+        zip_keys = aggregator.zip_codes.keys
+        return [self._ZipResult(id, zip_keys[zip_code], aggregator.dat_zip[helpers.PackKey(id_code, zip_code)])
+                for zip_code in sorted(zip_codes, key=zip_keys.__getitem__)]
+
+    def _ZipResult(self, id, zipcode, group):
+        zip_store = self.aggregator.zip_store
+        return {'id': id, 'zip': zipcode, 'median': int(round(zip_store.GetMedian(group))),
+                'count': int(zip_store.GetCount(group)), 'total': int(zip_store.GetTotal(group))}
+
+    def GetDates(self, id, start_date=None, end_date=None):
+        """
+        :param id: CMTE_ID [string]
+        :param start_date: first date as YYYYMMDD; None for the first date of the recipient [int]
+        :param end_date: last date as YYYYMMDD; None for the last date of the recipient [int]
+        :return: the id, date as MMDDYYYY, median, number and total of the contributions of every date of the
+                 recipient in the range, ordered by date, or None if the recipient has no dates [list]
+        """
+        aggregator = self.aggregator
+        id_code = aggregator.id_codes.codes.get(id)
+        dates = self.dates_by_id.get(id_code)
+        if dates is None:
+            return None
+        start = bisect.bisect_left(dates, start_date) if start_date is not None else 0
+        end = bisect.bisect_right(dates, end_date) if end_date is not None else len(dates)
+        results = []
+        for date_key in dates[start:end]:
+            trans_median, trans_total, trans_number = \
+                aggregator.dat_date[helpers.PackKey(id_code, date_key)].GetTransactionValues()
+            results.append({'id': id, 'date': helpers.FormatTransactionDate(date_key),
+                            'median': int(round(trans_median)), 'count': int(trans_number),
+                            'total': int(trans_total)})
+        return results
+
+    def GetStatus(self):
+        """
+        :return: the number of input lines processed and the number of groups of the zip and date files [dict]
+        """
+        number_zip_groups, number_date_groups = self.aggregator.NumberGroups()
+        return {'lines': self.aggregator.line_number, 'groups_zip': number_zip_groups,
+                'groups_date': number_date_groups}
+
+
+class _QueryHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+        Answers the GET queries (see the top of the module) with the index of the server.
+
+    """
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        parameters = dict((name, values[-1]) for name, values in urlparse.parse_qs(url.query).iteritems())
+        query_server = self.server.query_server
+        try:
+            with query_server.lock:
+                result = query_server.Query(url.path, parameters)
+        except KeyError as error:
+            return self.SendJSON(400, {'error': 'Missing parameter: {}'.format(error.args[0])})
+        except ValueError as error:
+            return self.SendJSON(400, {'error': str(error)})
+        if result is None:
+            return self.SendJSON(404, {'error': 'Not found'})
+        self.SendJSON(200, result)
+
+    def SendJSON(self, status, result):
+        """
+        Sends a response with a JSON body.
+
+        :param status: HTTP status code [int]
+        :param result: the body [dict]
+        :return: Nothing
+        """
+        body = json.dumps(result, sort_keys=True) + '\n'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # the terminal is for the progress of the run
+        pass
+
+
+class _TCPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+def ParseQueryDate(date_input):
+    """
+    :param date_input: date as MMDDYYYY [string]
+    :return: the date as YYYYMMDD [int]
+    """
+    date_key = helpers.ParseTransactionDate(date_input)
+    if date_key < 0:
+        raise ValueError('Invalid date: {}'.format(date_input))
+    return date_key
+
+
+class QueryServer(object):
+    """
+        Serves the queries over the aggregation of a run in a thread.
+
+        How to use: Start(); process the blocks of the reader returned by LockBlocks; set done once the run is over
+        and Wait() to serve until the process is interrupted or terminated (or Shutdown()).
+
+    """
+
+    def __init__(self, address, aggregator):
+        """
+        :param address: 'tcp:[HOST:]PORT' or 'unix:PATH' (see streaming.ParseSocketAddress) [string]
+        :param aggregator: the aggregator of the run [ContributionAggregator]
+        """
+        family, self.address = streaming.ParseSocketAddress(address)
+        self.lock = threading.Lock()
+        self.index = AggregateIndex(aggregator)
+        self.done = False
+        if family == socket.AF_UNIX:
+            if os.path.exists(self.address):
+                os.remove(self.address)
+            self.server = _UnixServer(self.address, _QueryHandler)
+        else:
+            self.server = _TCPServer(self.address, _QueryHandler)
+            # the port, if any was picked
+            self.address = self.server.server_address
+        self.server.query_server = self
+        self.thread = None
+
+    def Start(self):
+        """
+        Starts answering queries in a thread.
+
+        :return: Nothing
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def LockBlocks(self, reader):
+        """
+        Hands out the blocks of a reader and holds the lock from the time a block is handed out until the next one
+        is requested, so that the queries do not see the aggregation of a block half done.  The index is updated with
+        the groups created by the block before the lock is released.
+
+        :param reader: iterable of lists of parsed input lines (see readers.py) [iterable]
+        :return: generator of the lists of parsed input lines [generator]
+        """
+        for records in reader:
+            with self.lock:
+                yield records
+                self.index.Update()
+
+    def Query(self, path, parameters):
+        """
+        Answers a query; the caller holds the lock.
+
+        :param path: /zip, /zips, /dates or /status [string]
+        :param parameters: the parameters of the query [dict]
+        :return: the result, or None if there is nothing for the query [dict]
+        """
+        index = self.index
+        if path == '/zip':
+            return index.GetZip(parameters['id'], parameters['zip'])
+        elif path == '/zips':
+            zips = index.GetZips(parameters['id'])
+            return {'id': parameters['id'], 'zips': zips} if zips is not None else None
+        elif path == '/dates':
+            dates = index.GetDates(parameters['id'],
+                                   ParseQueryDate(parameters['start']) if 'start' in parameters else None,
+                                   ParseQueryDate(parameters['end']) if 'end' in parameters else None)
+            return {'id': parameters['id'], 'dates': dates} if dates is not None else None
+        elif path == '/status':
+            status = index.GetStatus()
+            status['done'] = self.done
+            return status
+        return None
+
+    def Wait(self):
+        """
+        Serves the queries until the process is interrupted (Ctrl-C) or terminated (SIGTERM), then shuts down.
+
+        :return: Nothing
+        """
+        def Terminate(signal_number, frame):
+            raise KeyboardInterrupt
+        signal.signal(signal.SIGTERM, Terminate)
+        try:
+            while self.thread.is_alive():
+                self.thread.join(1.0)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.Shutdown()
+
+    def Shutdown(self):
+        """
+        Stops answering queries and removes the Unix socket, if any.
+
+        :return: Nothing
+        """
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread.join()
+            self.thread = None
+        self.server.server_close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
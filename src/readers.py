@@ -0,0 +1,523 @@
+"""
+Readers that hand the records of an itcont.txt file to find_political_donors_delta.py in large blocks.
+
+Each block is a list of records and each record is the same tuple that helpers.ParseLine returns:
+'CMTE_ID', 'ZIP_CODE', 'TRANSACTION_DT', 'TRANSACTION_AMT', 'OTHER_ID'
+
+After a block has been handed out, the reader's offset is the byte offset of the first line that has not been handed
+out yet and line_number is the number of records handed out so far.
+
+With complete_lines, MappedBlockReader and LineBlockReader stop at the last new line of the file: a last line without
+one may still be being written, so it is left (and the offset stays before it) for a later run of the incremental mode.
+
+If a profiler.StageProfiler is given, the readers add the time spent reading and parsing every block to it.
+
+Compressed inputs (.zip, .gz, .bz2 and .xz, see COMPRESSIONS) are read by CompressedBlockReader, which decompresses
+them in a thread while the lines are parsed and aggregated; its offsets are in bytes of the decompressed input.
+
+ValidatedBlockReader wraps a reader and also does the checks of ContributionAggregator.ProcessRecord, a whole block
+at a time with numpy operations, handing out columns instead of records (see ContributionAggregator.ProcessColumnBlocks).
+
+"""
+import bz2, mmap, os, Queue, re, threading, time, traceback, zipfile, zlib
+from itertools import imap, repeat
+
+# .xz needs the lzma module (Python 3.3+, or the backports.lzma package)
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+import numpy as np
+
+import helpers
+
+# Default number of bytes in a block; a block is extended to the end of the line it stops in.
+BLOCK_SIZE = 1 << 22
+
+# Compression of the input files, by extension
+COMPRESSIONS = {'.zip': 'zip', '.gz': 'gz', '.bz2': 'bz2', '.xz': 'xz'}
+
+# Number of bytes of the compressed input read at a time, and number of decompressed chunks the decompression thread
+# can get ahead of the parsing
+COMPRESSED_CHUNK_SIZE = 1 << 20
+DECOMPRESSED_CHUNKS = 16
+
+# Pulls out columns 0, 10, 13, 14 and 15 of every line of a block in a single pass, without making a string of the line
+# or of the columns that are not needed.  No column can hold a new line, so a match never runs over into the next line:
+# a line with less than 16 columns has no match and the next line is matched from its start.
+RECORD_PATTERN = re.compile(r'([^|\n]*)\|' + r'[^|\n]*\|' * 9 + r'([^|\n]*)\|' + r'[^|\n]*\|' * 2 +
+                            r'([^|\n]*)\|([^|\n]*)\|([^|\n]*)[^\n]*\n')
+
+# Version of RECORD_PATTERN that is anchored to the start of each line; it is used for blocks whose last line has no new
+# line.
+RECORD_PATTERN_ANCHORED = re.compile(r'^([^|\n]*)\|' + r'[^|\n]*\|' * 9 + r'([^|\n]*)\|' + r'[^|\n]*\|' * 2 +
+                                     r'([^|\n]*)\|([^|\n]*)\|([^|\n]*)', re.M)
+
+
+def ParseBlock(block):
+    """
+    Parses a block of complete lines from the itcont.txt file and returns a list of tuples containing the following
+    columns: 'CMTE_ID', 'ZIP_CODE', 'TRANSACTION_DT', 'TRANSACTION_AMT', 'OTHER_ID'
+
+    Lines with less than 16 columns are skipped (helpers.ParseLine would raise an IndexError for them).
+
+    :param block: one or more lines from the contributions file [string]
+    :return: list of tuples containing 'CMTE_ID', 'ZIP_CODE', 'TRANSACTION_DT', 'TRANSACTION_AMT', 'OTHER_ID' [list]
+    """
+    # the fast pattern needs the new line at the end of every line
+    if block.endswith('\n'):
+        return RECORD_PATTERN.findall(block)
+    return RECORD_PATTERN_ANCHORED.findall(block)
+
+
+class MappedBlockReader(object):
+    """
+        Memory maps the input file and hands out the records in blocks of about block_size bytes.  The columns are
+        pulled out of each block with ParseBlock so there is no string per line and no split of the whole line.
+
+    """
+
+    def __init__(self, input_fullfilename, block_size=BLOCK_SIZE, start_offset=0, profiler=None,
+                 complete_lines=False):
+        self.input_fullfilename = input_fullfilename
+        self.block_size = block_size
+        self.offset = start_offset
+        self.line_number = 0
+        self.profiler = profiler
+        self.complete_lines = complete_lines
+
+    def __iter__(self):
+        with open(self.input_fullfilename, 'rb') as fid:
+            file_size = os.fstat(fid.fileno()).st_size
+            if file_size <= self.offset:
+                return
+            mapped = mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ)
+            profiler = self.profiler
+            try:
+                if self.complete_lines:
+                    # leave a last line without a new line
+                    file_size = mapped.rfind('\n', self.offset, file_size) + 1
+                while self.offset < file_size:
+                    if profiler is not None:
+                        t_start = time.time()
+
+                    # extend the block to the end of the line
+                    block_end = mapped.find('\n', min(self.offset + self.block_size, file_size) - 1)
+                    block_end = file_size if block_end < 0 else block_end + 1
+                    block = mapped[self.offset:block_end]
+
+                    if profiler is not None:
+                        t_read = time.time()
+                        records = ParseBlock(block)
+                        profiler.Add('read', t_read - t_start)
+                        profiler.Add('parse', time.time() - t_read)
+                        profiler.counts['input_bytes'] += len(block)
+                    else:
+                        records = ParseBlock(block)
+                    self.offset = block_end
+                    self.line_number += len(records)
+                    yield records
+            finally:
+                mapped.close()
+
+
+class LineBlockReader(object):
+    """
+        Reads the input file line by line with helpers.ParseLine, handing out the records in blocks of about block_size
+        bytes.  This is the original way of reading the file.
+
+    """
+
+    def __init__(self, input_fullfilename, block_size=BLOCK_SIZE, start_offset=0, profiler=None,
+                 complete_lines=False):
+        self.input_fullfilename = input_fullfilename
+        self.block_size = block_size
+        self.offset = start_offset
+        self.line_number = 0
+        self.profiler = profiler
+        self.complete_lines = complete_lines
+
+    def __iter__(self):
+        with open(self.input_fullfilename, 'rb') as fid:
+            fid.seek(self.offset)
+            profiler = self.profiler
+            while True:
+                if profiler is not None:
+                    t_start = time.time()
+                lines = fid.readlines(self.block_size)
+                if lines and self.complete_lines and not lines[-1].endswith('\n'):
+                    # leave a last line without a new line
+                    lines.pop()
+                if not lines:
+                    return
+                if profiler is not None:
+                    t_read = time.time()
+                    records = [helpers.ParseLine(line) for line in lines]
+                    profiler.Add('read', t_read - t_start)
+                    profiler.Add('parse', time.time() - t_read)
+                    profiler.counts['input_bytes'] += sum(len(line) for line in lines)
+                else:
+                    records = [helpers.ParseLine(line) for line in lines]
+                self.offset += sum(len(line) for line in lines)
+                self.line_number += len(records)
+                yield records
+
+
+def GetCompression(input_fullfilename):
+    """
+    Returns the compression of the input file, from its extension.
+
+    :param input_fullfilename: the input file [string]
+    :return: one of the values of COMPRESSIONS, or None if the file is not compressed [string]
+    """
+    return COMPRESSIONS.get(os.path.splitext(input_fullfilename)[1].lower())
+
+
+def _GetArchiveMember(archive):
+    """
+    Returns the member of a zip archive that holds the input: its only file, or else itcont.txt.
+
+    :param archive: the archive [zipfile.ZipFile]
+    :return: name of the member [string]
+    """
+    names = [name for name in archive.namelist() if not name.endswith('/')]
+    if len(names) == 1:
+        return names[0]
+    for name in names:
+        if os.path.basename(name) == 'itcont.txt':
+            return name
+    raise ValueError('The zip archive should hold a single file or itcont.txt, not: {}'.format(', '.join(names)))
+
+
+def _StreamEnded(decompressor):
+    """
+    Returns whether a decompressor reached the end of its stream.  The decompressors of Python 2 cannot tell (they
+    have no eof attribute), so one more byte is decompressed to find out: after the end of a stream, zlib puts it in
+    unused_data and bz2 raises an EOFError.  The decompressor should not be used afterwards.
+
+    :param decompressor: zlib, bz2 or lzma decompressor
+    :return: whether the stream ended [bool]
+    """
+    eof = getattr(decompressor, 'eof', None)
+    if eof is not None:
+        return eof
+    try:
+        decompressor.decompress('\0')
+    except EOFError:
+        return True
+    except (IOError, zlib.error):
+        return False
+    return decompressor.unused_data == '\0'
+
+
+def IterateDecompressed(input_fullfilename, chunk_size=COMPRESSED_CHUNK_SIZE):
+    """
+    Decompresses an input file.  gzip, bzip2 and xz files made of several concatenated streams (such as those of pigz
+    or pbzip2) are read through, and an IOError is raised if the last stream is cut short.
+
+    :param input_fullfilename: the compressed input file [string]
+    :param chunk_size: number of bytes of the compressed file read at a time [int]
+    :return: generator of chunks of the decompressed input [generator]
+    """
+    compression = GetCompression(input_fullfilename)
+    if compression == 'zip':
+        with zipfile.ZipFile(input_fullfilename) as archive:
+            with archive.open(_GetArchiveMember(archive)) as fid:
+                while True:
+                    chunk = fid.read(chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+
+    if compression == 'gz':
+        CreateDecompressor = lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif compression == 'bz2':
+        CreateDecompressor = bz2.BZ2Decompressor
+    elif compression == 'xz':
+        if lzma is None:
+            raise ImportError('Reading .xz files needs the lzma module (pip install backports.lzma)')
+        CreateDecompressor = lzma.LZMADecompressor
+    else:
+        raise ValueError('Unknown compression: {}'.format(input_fullfilename))
+
+    with open(input_fullfilename, 'rb') as fid:
+        decompressor = CreateDecompressor()
+        while True:
+            data = fid.read(chunk_size)
+            if not data:
+                if not _StreamEnded(decompressor):
+                    raise IOError('{} is truncated'.format(input_fullfilename))
+                return
+            while data:
+                try:
+                    chunk = decompressor.decompress(data)
+                except EOFError:
+                    # the stream of bz2 and lzma ended right at the end of the previous data
+                    decompressor = CreateDecompressor()
+                    continue
+                if chunk:
+                    yield chunk
+                # the bytes after the end of a stream are the start of the next one
+                data = decompressor.unused_data
+                if data:
+                    decompressor = CreateDecompressor()
+
+
+def _DecompressWorker(input_fullfilename, chunks, stop):
+    """
+    Runs in the decompression thread of CompressedBlockReader.  Puts the chunks of the decompressed input on the queue,
+    then an empty string; if anything fails, a tuple with the traceback is put on the queue instead.
+
+    :param input_fullfilename: the compressed input file [string]
+    :param chunks: queue of the chunks [Queue.Queue]
+    :param stop: set when the reader is done with the chunks [threading.Event]
+    :return: Nothing
+    """
+    def Put(item):
+        # give up if the reader stopped taking the chunks
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    try:
+        for chunk in IterateDecompressed(input_fullfilename):
+            if not Put(chunk):
+                return
+        Put('')
+    except Exception:
+        Put((traceback.format_exc(),))
+
+
+class CompressedBlockReader(object):
+    """
+        Reads a compressed input file (see COMPRESSIONS) as a stream, without decompressing it to disk, and hands out
+        the records in blocks of about block_size bytes.  The decompression runs in a thread (zlib, bz2 and lzma let
+        other threads run while they work) and hands the decompressed chunks over through a bounded queue, so that it
+        overlaps with the parsing and aggregation of the previous blocks.
+
+        The offsets are in bytes of the decompressed input; when starting at an offset, the input is decompressed
+        from the beginning and the bytes before it are dropped.
+
+    """
+
+    def __init__(self, input_fullfilename, block_size=BLOCK_SIZE, start_offset=0, profiler=None):
+        self.input_fullfilename = input_fullfilename
+        self.block_size = block_size
+        self.offset = start_offset
+        self.line_number = 0
+        self.profiler = profiler
+
+    def __iter__(self):
+        chunks = Queue.Queue(DECOMPRESSED_CHUNKS)
+        stop = threading.Event()
+        thread = threading.Thread(target=_DecompressWorker, args=(self.input_fullfilename, chunks, stop))
+        thread.daemon = True
+        thread.start()
+        profiler = self.profiler
+
+        def Get():
+            chunk = chunks.get()
+            if isinstance(chunk, tuple):
+                raise IOError('Decompressing {} failed:\n{}'.format(self.input_fullfilename, chunk[0]))
+            return chunk
+
+        try:
+            # drop the bytes before the start offset
+            remainder = ''
+            bytes_to_skip = self.offset
+            while bytes_to_skip > 0:
+                chunk = Get()
+                if not chunk:
+                    return
+                remainder = chunk[bytes_to_skip:]
+                bytes_to_skip -= len(chunk)
+
+            end_of_input = False
+            minimum_bytes = self.block_size
+            while not end_of_input:
+                if profiler is not None:
+                    t_start = time.time()
+
+                # gather about block_size bytes and cut them at the end of the last whole line
+                pieces = [remainder]
+                number_bytes = len(remainder)
+                while number_bytes < minimum_bytes:
+                    chunk = Get()
+                    if not chunk:
+                        end_of_input = True
+                        break
+                    pieces.append(chunk)
+                    number_bytes += len(chunk)
+                data = ''.join(pieces)
+                block_end = len(data) if end_of_input else data.rfind('\n') + 1
+                if block_end == 0 and not end_of_input:
+                    # the line is longer than block_size: gather more of it
+                    remainder = data
+                    minimum_bytes = len(data) + 1
+                    continue
+                minimum_bytes = self.block_size
+                block = data[:block_end]
+                remainder = data[block_end:]
+                if not block:
+                    continue
+
+                if profiler is not None:
+                    t_read = time.time()
+                    records = ParseBlock(block)
+                    profiler.Add('read', t_read - t_start)
+                    profiler.Add('parse', time.time() - t_read)
+                    profiler.counts['input_bytes'] += len(block)
+                else:
+                    records = ParseBlock(block)
+                self.offset += len(block)
+                self.line_number += len(records)
+                yield records
+        finally:
+            stop.set()
+            thread.join()
+
+
+def _Intern(interner, values, used):
+    """
+    Interns the values that are used, in order of first appearance.
+
+    :param interner: the interner [helpers.KeyInterner]
+    :param values: the values [sequence of strings]
+    :param used: value used for each value [numpy array of bool]
+    :return: the code of each value, -1 for the values that are not used [numpy array of int]
+    """
+    codes = np.fromiter(imap(interner.codes.get, values, repeat(-1)), dtype=np.int_, count=len(values))
+    codes[~used] = -1
+    intern = interner.Intern
+    for index in np.flatnonzero((codes < 0) & used).tolist():
+        codes[index] = intern(values[index])
+    return codes
+
+
+class ValidatedBlockReader(object):
+    """
+        Hands out the blocks of a reader as tuples of the columns id, zip, date, amount and flags of their records,
+        with the checks of ContributionAggregator.ProcessRecord already done (see helpers.FLAG_ENTRY, FLAG_ZIP and
+        FLAG_DATE; id and zip are -1, date is -1 and amount is 0 where they are not used).  The zip codes and dates of
+        a block are checked together with helpers.CheckZipCodes and helpers.ParseTransactionDates and the amounts are
+        converted together, instead of a call per record.
+
+        The ids and zip codes are interned in the reader's own tables, id_keys and zip_keys, which grow as new ones
+        are found.  offset and line_number are those of the wrapped reader.
+
+    """
+
+    def __init__(self, reader):
+        """
+        :param reader: reader of the blocks of records (see the top of the module) [iterable]
+        """
+        self.reader = reader
+        self.id_codes = helpers.KeyInterner()
+        self.zip_codes = helpers.KeyInterner()
+        self.id_keys = self.id_codes.keys
+        self.zip_keys = self.zip_codes.keys
+
+    @property
+    def offset(self):
+        return self.reader.offset
+
+    @property
+    def line_number(self):
+        return self.reader.line_number
+
+    def __iter__(self):
+        for records in self.reader:
+            columns = self.CheckColumns(records)
+            if columns is None:
+                columns = self.CheckRecords(records)
+            yield columns
+
+    def CheckColumns(self, records):
+        """
+        :param records: the records of a block [list]
+        :return: tuple of the columns of the block, or None if it cannot be checked with numpy operations (a string
+                 with a zero byte, which numpy strings drop, or an amount which is not a 64 bit integer) [tuple]
+        """
+        number_records = len(records)
+        if not number_records:
+            return self.CheckRecords(records)
+        ids, zipcodes, dates, amounts, other_ids = zip(*records)
+        if '\x00' in ''.join(ids) or '\x00' in ''.join(zipcodes) or '\x00' in ''.join(amounts) or \
+                '\x00' in ''.join(other_ids):
+            return None
+
+        amounts = np.array(amounts)
+        entry = (np.array(other_ids) == '') & (np.array(ids) != '') & (amounts != '')
+        zip_valid = helpers.CheckZipCodes(zipcodes, 5) & entry
+        date_column = np.where(entry, helpers.ParseTransactionDates(dates), -1)
+
+        # the amounts of the entries used for neither file are not converted (see ContributionAggregator.ProcessRecord)
+        rows = np.flatnonzero(zip_valid | (date_column >= 0))
+        amount_column = np.zeros(number_records, dtype=np.int_)
+        try:
+            amount_column[rows] = helpers.ParseAmounts(amounts[rows])
+        except (ValueError, OverflowError):
+            return None
+
+        id_column = _Intern(self.id_codes, ids, entry)
+        zip_column = _Intern(self.zip_codes, np.array(zipcodes, dtype='S5').tolist(), zip_valid)
+
+        flags = (entry * helpers.FLAG_ENTRY | zip_valid * helpers.FLAG_ZIP |
+                 (date_column >= 0) * helpers.FLAG_DATE).astype(np.uint8)
+        return id_column, zip_column, date_column, amount_column, flags
+
+    def CheckRecords(self, records):
+        """
+        Same as CheckColumns one record at a time, as ContributionAggregator.ProcessRecord does.
+
+        :param records: the records of a block [list]
+        :return: tuple of the columns of the block [tuple]
+        """
+        id_column, zip_column, date_column, amount_column, flags = columns = [[] for _ in xrange(5)]
+        for id, zipcode, dt, amt, other_id in records:
+            if (other_id != '') or (id == '') or (amt == ''):
+                id_column.append(-1)
+                zip_column.append(-1)
+                date_column.append(-1)
+                amount_column.append(0)
+                flags.append(0)
+                continue
+
+            id_column.append(self.id_codes.Intern(id))
+            zipcode = zipcode[:5]
+            zip_code = self.zip_codes.codes.get(zipcode)
+            if zip_code is None:
+                if helpers.CheckZipCode(zipcode):
+                    zip_code = self.zip_codes.Intern(zipcode)
+                else:
+                    zip_code = self.zip_codes.Reject(zipcode)
+            zip_column.append(zip_code)
+            date_key = helpers.ParseTransactionDate(dt)
+            date_column.append(date_key)
+            amount_column.append(int(amt) if zip_code >= 0 or date_key >= 0 else 0)
+            flags.append(helpers.FLAG_ENTRY | (helpers.FLAG_ZIP if zip_code >= 0 else 0) |
+                         (helpers.FLAG_DATE if date_key >= 0 else 0))
+        return tuple(np.array(column, dtype=dtype) for column, dtype in
+                     zip(columns, [np.int_, np.int_, np.int_, np.int_, np.uint8]))
+
+
+def ReaderFactory(reader_mode='mmap'):
+    """
+    Returns the class used to read the input file.
+
+    :param reader_mode: 'mmap' (MappedBlockReader) or 'lines' (LineBlockReader) [string]
+    :return: reader class [class]
+    """
+    if reader_mode == 'mmap':
+        return MappedBlockReader
+    elif reader_mode == 'lines':
+        return LineBlockReader
+    raise ValueError('Unknown reader mode: {}'.format(reader_mode))
@@ -0,0 +1,89 @@
+"""
+Spills the contribution values of the date file to disk so that the memory does not grow with the number of
+contributions.
+
+When the values held by a ContributionAggregator for the date file pass its memory budget, they are written out as a
+sorted run: a file with a line 'CMTE_ID|YYYYMMDD|TRANSACTION_AMT' for every contribution value, in order of id and then
+by date, and the values are dropped from memory.  At the end, the runs (and the values still in memory) are merged with
+a k-way merge, which yields the values of one recipient and date after the other so that they can be aggregated
+without holding more than one group in memory.
+
+"""
+import heapq, os, shutil, tempfile
+
+# Size of the buffer of each run file in bytes
+RUN_BUFFER_SIZE = 1 << 16
+
+
+def _ReadRun(run_fullfilename):
+    """
+    Reads a run file.
+
+    :param run_fullfilename: the run file [string]
+    :return: generator of tuples of id, date as YYYYMMDD and contribution value [generator]
+    """
+    with open(run_fullfilename, 'rb', RUN_BUFFER_SIZE) as fid:
+        for line in fid:
+            id, date_key, value = line.split('|')
+            yield id, int(date_key), int(value)
+
+
+class DateSpiller(object):
+    """
+        Writes sorted runs of date file values to a temporary directory and merges them.
+
+        How to use: WriteRun(...) every time the values are spilled, then IterateValues(...) to merge the runs and
+        Remove() to delete them.  The directory is only created with the first run.
+
+    """
+
+    def __init__(self, spill_directory=None):
+        """
+        :param spill_directory: directory in which the temporary directory of the runs is created; None for the
+                                default temporary directory [string]
+        """
+        self.spill_directory = spill_directory
+        self.run_directory = None
+        self.number_runs = 0
+
+    def _RunFullfilename(self, run_index):
+        return os.path.join(self.run_directory, 'run{}.txt'.format(run_index))
+
+    def WriteRun(self, date_values):
+        """
+        Writes a run.
+
+        :param date_values: tuples of id, date as YYYYMMDD and the contribution values of the recipient and date, in
+                            order of id and then by date [iterable]
+        :return: Nothing
+        """
+        if self.run_directory is None:
+            self.run_directory = tempfile.mkdtemp(prefix='dates', dir=self.spill_directory)
+        with open(self._RunFullfilename(self.number_runs), 'wb', RUN_BUFFER_SIZE) as fid:
+            for id, date_key, values in date_values:
+                prefix = '%s|%d|' % (id, date_key)
+                fid.writelines(['%s%d\n' % (prefix, value) for value in values])
+        self.number_runs += 1
+
+    def IterateValues(self, *other_runs):
+        """
+        Merges the runs (and other sorted sequences of values, such as the values still in memory).  The values of a
+        recipient and date come one after the other, in no particular order.
+
+        :param other_runs: tuples of id, date as YYYYMMDD and contribution value, in order of id and then by date
+                           [iterable]
+        :return: generator of tuples of id, date as YYYYMMDD and contribution value [generator]
+        """
+        runs = [_ReadRun(self._RunFullfilename(run_index)) for run_index in xrange(self.number_runs)]
+        return heapq.merge(*(runs + list(other_runs)))
+
+    def Remove(self):
+        """
+        Deletes the runs.
+
+        :return: Nothing
+        """
+        if self.run_directory is not None:
+            shutil.rmtree(self.run_directory, ignore_errors=True)
+            self.run_directory = None
+            self.number_runs = 0
@@ -0,0 +1,225 @@
+"""
+Streaming mode of find_political_donors_delta.py: the records are read from the standard input or from a local Unix
+or TCP socket as they arrive, instead of from a file, and every line of the zip file is written out as soon as the
+flush policy allows (see writers.BufferedLineWriter).  The date file is written once the stream ends.
+
+The input is given as:
+- '-' for the standard input
+- 'unix:PATH' to listen on a Unix socket at PATH
+- 'tcp:PORT' or 'tcp:HOST:PORT' to listen on a TCP port (of 127.0.0.1 by default)
+For the sockets, a single connection is accepted and the stream ends when it is closed.
+
+StreamReader reads whatever bytes are available (up to read_size) as soon as there are any, so a trickle of records
+is handed out a line at a time while a fast stream is handed out in larger blocks.  LatencyRecorder keeps the
+latencies of the records, from the time their bytes were read to the time their zip file line was written out, in a
+fixed-size histogram for the percentiles reported at the end.
+
+"""
+import math, os, select, socket, sys, time
+
+import readers
+
+# Maximum number of bytes read from the stream at a time
+STREAM_READ_SIZE = 1 << 16
+
+# Prefixes of the sockets
+UNIX_PREFIX = 'unix:'
+TCP_PREFIX = 'tcp:'
+
+# Percentiles of the latency report
+LATENCY_PERCENTILES = (50, 90, 99, 99.9)
+
+
+def IsStream(input_fullfilename):
+    """
+    :param input_fullfilename: the input given to find_political_donors_delta.py [string]
+    :return: whether the input is a stream ('-', 'unix:PATH' or 'tcp:[HOST:]PORT') [bool]
+    """
+    return input_fullfilename == '-' or input_fullfilename.startswith(UNIX_PREFIX) or \
+        input_fullfilename.startswith(TCP_PREFIX)
+
+
+def ParseSocketAddress(source):
+    """
+    :param source: 'unix:PATH' or 'tcp:[HOST:]PORT' (the host is 127.0.0.1 by default) [string]
+    :return: tuple of the socket family and the address to bind [tuple]
+    """
+    if source.startswith(UNIX_PREFIX):
+        return socket.AF_UNIX, source[len(UNIX_PREFIX):]
+    if source.startswith(TCP_PREFIX):
+        host, _, port = source[len(TCP_PREFIX):].rpartition(':')
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    raise ValueError('Unknown socket address: {}'.format(source))
+
+
+def OpenStream(source):
+    """
+    Opens the standard input, or listens on a socket and accepts a connection.
+
+    :param source: '-', 'unix:PATH' or 'tcp:[HOST:]PORT' [string]
+    :return: tuple of the file descriptor to wait on, a function that reads up to a number of bytes (an empty string
+             at the end of the stream) and a function that closes the stream [tuple]
+    """
+    if source == '-':
+        fd = sys.stdin.fileno()
+        return fd, lambda number_bytes: os.read(fd, number_bytes), lambda: None
+
+    family, address = ParseSocketAddress(source)
+    listener = socket.socket(family, socket.SOCK_STREAM)
+    if family == socket.AF_UNIX:
+        if os.path.exists(address):
+            os.remove(address)
+    else:
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    try:
+        listener.bind(address)
+        listener.listen(1)
+        print('Waiting for a connection on {}'.format(source))
+        connection, _ = listener.accept()
+    finally:
+        listener.close()
+        if family == socket.AF_UNIX:
+            os.remove(address)
+
+    def Close():
+        connection.close()
+    return connection.fileno(), connection.recv, Close
+
+
+class StreamReader(object):
+    """
+        Hands out the records of a stream in blocks of the whole lines that are available, as soon as there are any.
+        Same interface as the readers of readers.py (offset and line_number); block_time is the time the bytes of the
+        last block were read.
+
+        If idle_seconds is given, an empty block is handed out whenever the stream is idle for that long, so that the
+        caller can act on time (e.g. write out buffered lines).
+
+    """
+
+    def __init__(self, source, read_size=STREAM_READ_SIZE, idle_seconds=None, profiler=None):
+        """
+        :param source: '-', 'unix:PATH' or 'tcp:[HOST:]PORT' (see OpenStream) [string]
+        :param read_size: maximum number of bytes read at a time [int]
+        :param idle_seconds: hand out an empty block after this many seconds without data; None to wait [float]
+        :param profiler: adds the time spent reading and parsing to it, if given [profiler.StageProfiler]
+        """
+        self.source = source
+        self.read_size = read_size
+        self.idle_seconds = idle_seconds
+        self.profiler = profiler
+        self.offset = 0
+        self.line_number = 0
+        self.block_time = None
+
+    def __iter__(self):
+        fd, Read, Close = OpenStream(self.source)
+        profiler = self.profiler
+        remainder = ''
+        try:
+            while True:
+                if self.idle_seconds is not None and not select.select([fd], [], [], self.idle_seconds)[0]:
+                    yield []
+                    continue
+                if profiler is not None:
+                    t_start = time.time()
+                data = Read(self.read_size)
+                self.block_time = time.time()
+                if not data:
+                    break
+
+                # hand out the whole lines
+                block_end = data.rfind('\n') + 1
+                if block_end == 0:
+                    remainder += data
+                    continue
+                block = remainder + data[:block_end]
+                remainder = data[block_end:]
+                records = readers.ParseBlock(block)
+                if profiler is not None:
+                    profiler.Add('read', self.block_time - t_start)
+                    profiler.Add('parse', time.time() - self.block_time)
+                    profiler.counts['input_bytes'] += len(block)
+                self.offset += len(block)
+                self.line_number += len(records)
+                yield records
+
+            # the last line may not end with a new line
+            if remainder:
+                records = readers.ParseBlock(remainder)
+                self.offset += len(remainder)
+                self.line_number += len(records)
+                yield records
+        finally:
+            Close()
+
+
+class LatencyRecorder(object):
+    """
+        Histogram of latencies with logarithmic buckets, so that the percentiles are within relative_error of the
+        exact ones with a fixed memory (the buckets are those of helpers.MedianStreamingApprox).
+
+        How to use: Add(latency, number) for number records of the same latency; GetPercentile and GetReport.
+
+    """
+
+    # Latencies below this are counted as this (seconds)
+    MINIMUM_LATENCY = 1e-6
+
+    def __init__(self, relative_error=0.01):
+        """
+        :param relative_error: relative error of the percentiles [float]
+        """
+        self.gamma = (1.0 + relative_error) / (1.0 - relative_error)
+        self.log_gamma = math.log(self.gamma)
+        self.counts = {}
+        self.number_latencies = 0
+        self.maximum = 0.0
+
+    def Add(self, latency, number=1):
+        """
+        Counts latencies.
+
+        :param latency: latency in seconds [float]
+        :param number: number of records with this latency [int]
+        :return: Nothing
+        """
+        if number <= 0:
+            return
+        bucket = int(math.ceil(math.log(max(latency, self.MINIMUM_LATENCY)) / self.log_gamma))
+        self.counts[bucket] = self.counts.get(bucket, 0) + number
+        self.number_latencies += number
+        self.maximum = max(self.maximum, latency)
+
+    def GetPercentile(self, percentile):
+        """
+        Returns a percentile of the latencies.
+
+        :param percentile: between 0 and 100 [float]
+        :return: the latency in seconds, or None if there are none [float]
+        """
+        if not self.number_latencies:
+            return None
+        if percentile >= 100:
+            return self.maximum
+        rank = percentile / 100.0 * self.number_latencies
+        number_below = 0
+        for bucket in sorted(self.counts):
+            number_below += self.counts[bucket]
+            if number_below >= rank:
+                # the centre of the bucket
+                return min(2.0 * self.gamma ** bucket / (self.gamma + 1.0), self.maximum)
+        return self.maximum
+
+    def GetReport(self):
+        """
+        Creates a line with the percentiles of the latencies in milliseconds.
+
+        :return: the line [string]
+        """
+        if not self.number_latencies:
+            return 'no latencies'
+        return '{} lines: '.format(self.number_latencies) + \
+            ', '.join('p{:g} {:.3f} ms'.format(percentile, 1e3 * self.GetPercentile(percentile))
+                      for percentile in LATENCY_PERCENTILES) + ', max {:.3f} ms'.format(1e3 * self.maximum)
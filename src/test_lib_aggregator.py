@@ -0,0 +1,380 @@
+#!/usr/bin/env python
+"""
+Unit tests for the aggregators of aggregator.py and parallel.py.  The unittest of the Python Standard Library is used.
+The user is expected to run run_unit_tests.sh at the base of the repository in order to run these tests.
+
+The input and expected output of the insight_testsuite test_1 are used.
+
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import aggregator, helpers, readers
+from aggregator import ContributionAggregator
+import parallel
+from parallel import ShardedAggregator
+
+test_folder = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'insight_testsuite', 'tests', 'test_1')
+input_fullfilename = os.path.join(test_folder, 'input', 'itcont.txt')
+with open(os.path.join(test_folder, 'output', 'medianvals_by_zip.txt'), 'rb') as fid:
+    expected_zip_lines = fid.read().splitlines(True)
+with open(os.path.join(test_folder, 'output', 'medianvals_by_date.txt'), 'rb') as fid:
+    expected_date_lines = fid.read().splitlines(True)
+
+
+def RunAggregator(aggregator, block_size=readers.BLOCK_SIZE):
+    """
+    Runs an aggregator over the test input and returns the lines of the zip and date files.
+
+    :param aggregator: ContributionAggregator or ShardedAggregator
+    :param block_size: block size of the reader [int]
+    :return: tuple of the list of zip file lines and the list of date file lines
+    """
+    reader = readers.MappedBlockReader(input_fullfilename, block_size=block_size)
+    zip_lines = [lineOut for block_zip_lines in aggregator.ProcessBlocks(reader) for lineOut in block_zip_lines]
+    date_lines = [lineOut for _, _, lineOut in aggregator.IterateDateLines()]
+    return zip_lines, date_lines
+
+
+class ExitingDateAccumulator(helpers.DateAccumulatorArray):
+    """
+        Date accumulator that ends its process right away, without running any cleanup or exception handler.
+
+    """
+
+    def ingest(self, value):
+        os._exit(3)
+
+
+class TestContributionAggregator(unittest.TestCase):
+    """
+        Check ContributionAggregator class.
+
+    """
+
+    def test_ContributionAggregator(self):
+        """
+        Check the zip and date file lines and the number of skipped entries.
+
+        :return:
+        """
+
+        print('Testing ContributionAggregator')
+
+        aggregator = ContributionAggregator()
+        zip_lines, date_lines = RunAggregator(aggregator)
+
+        self.assertEqual(zip_lines, expected_zip_lines, 'Wrong zip file lines')
+        self.assertEqual(date_lines, expected_date_lines, 'Wrong date file lines')
+        self.assertEqual(aggregator.line_number, 7, 'Wrong number of lines')
+        self.assertEqual((aggregator.skipped_zip, aggregator.skipped_date), (1, 1), 'Wrong number of skipped entries')
+
+    def test_ContributionAggregator_invalid_amount(self):
+        """
+        Check that an amount which is not an integer only matters for a record used for the zip or date file.
+
+        :return:
+        """
+
+        print('Testing ContributionAggregator invalid amount')
+
+        aggregator = ContributionAggregator()
+        self.assertIsNone(aggregator.ProcessRecord(('C1', 'ABCDE', 'notadate', '12.50', '')),
+                          'The record should not be used')
+        self.assertEqual((aggregator.skipped_zip, aggregator.skipped_date), (1, 1), 'Wrong number of skipped entries')
+        for record in [('C1', '02895', 'notadate', '12.50', ''), ('C1', 'ABCDE', '01122017', '12.50', '')]:
+            with self.assertRaises(ValueError):
+                aggregator.ProcessRecord(record)
+
+    def test_ContributionAggregator_date_chunks(self):
+        """
+        Check the date file lines when the medians are calculated in chunks of one value, for every date accumulator,
+        and the lines of some of the keys only.
+
+        :return:
+        """
+
+        print('Testing ContributionAggregator date chunks')
+
+        date_chunk_values = aggregator.DATE_CHUNK_VALUES
+        aggregator.DATE_CHUNK_VALUES = 1
+        try:
+            for date_mode in ['array', 'frequency', 'list']:
+                contribution_aggregator = ContributionAggregator(
+                    date_accumulator_class=helpers.DateAccumulatorFactory(date_mode))
+                zip_lines, date_lines = RunAggregator(contribution_aggregator)
+                self.assertEqual(date_lines, expected_date_lines, 'Wrong date file lines with {}'.format(date_mode))
+
+                date_keys = list(contribution_aggregator.dat_date)[::2]
+                date_lines = [lineOut for _, _, lineOut in contribution_aggregator.IterateDateLines(date_keys)]
+                self.assertEqual(date_lines, [lineOut for lineOut in expected_date_lines if lineOut in date_lines],
+                                 'Wrong date file lines of some keys')
+                self.assertEqual(len(date_lines), len(date_keys), 'Wrong number of date file lines')
+        finally:
+            aggregator.DATE_CHUNK_VALUES = date_chunk_values
+
+    def test_ContributionAggregator_spill(self):
+        """
+        Check the date file lines when the values are spilled to disk after every line, for every date accumulator,
+        and that the runs are deleted.
+
+        :return:
+        """
+
+        print('Testing ContributionAggregator spill')
+
+        for date_mode in ['array', 'frequency', 'list']:
+            aggregator = ContributionAggregator(date_accumulator_class=helpers.DateAccumulatorFactory(date_mode),
+                                                date_memory_budget=1)
+            zip_lines, date_lines = RunAggregator(aggregator, block_size=1)
+
+            self.assertEqual(zip_lines, expected_zip_lines, 'Wrong zip file lines with {}'.format(date_mode))
+            self.assertEqual(date_lines, expected_date_lines, 'Wrong date file lines with {}'.format(date_mode))
+            self.assertEqual(aggregator.date_values_spilled, 6, 'Wrong number of spilled values')
+            self.assertIsNone(aggregator.date_spiller.run_directory, 'The runs were not deleted')
+
+        # a single run, merged with the values still in memory
+        for number_blocks in xrange(1, 7):
+            aggregator = ContributionAggregator()
+            reader = readers.MappedBlockReader(input_fullfilename, block_size=1)
+            for _ in aggregator.ProcessBlocks(reader):
+                if aggregator.line_number == number_blocks:
+                    aggregator.SpillDates()
+            date_lines = [lineOut for _, _, lineOut in aggregator.IterateDateLines()]
+            self.assertEqual(date_lines, expected_date_lines, 'Wrong date file lines with a spill after {} lines'
+                             .format(number_blocks))
+
+
+    def test_ContributionAggregator_window(self):
+        """
+        Check the zip file lines of the windows of the last contributions and of the last days (01/15 is the first of
+        the 30 days up to 02/13), the latter not using the contributions without a valid date, with the records and
+        with the columns.
+
+        :return:
+        """
+
+        print('Testing ContributionAggregator window')
+
+        # with one contribution per window, the median and total are the contribution
+        aggregator = ContributionAggregator(helpers.ZipStreamingStoreFactory('window', window_size=1))
+        zip_lines, date_lines = RunAggregator(aggregator)
+        self.assertEqual([lineOut.split('|')[2:] for lineOut in zip_lines],
+                         [[amount, '1', amount + '\n'] for amount in ['384', '250', '230', '384', '333', '384']],
+                         'Wrong zip file lines of the window of contributions')
+        self.assertEqual(date_lines, expected_date_lines, 'Wrong date file lines')
+
+        records = [('C00384818', '02895', '01122017', '250', ''), ('C00384818', '02895', '01152017', '100', ''),
+                   ('C00384818', '02895', '', '50', ''), ('C00384818', '02895', '02132017', '300', '')]
+        expected_lines = ['C00384818|02895|250|1|250\n', 'C00384818|02895|175|2|350\n',
+                          'C00384818|02895|200|2|400\n']
+        store_factory = helpers.ZipStreamingStoreFactory('window', window_days=30)
+        aggregator = ContributionAggregator(store_factory)
+        self.assertEqual(list(aggregator.ProcessBlocks([records])), [expected_lines],
+                         'Wrong zip file lines of the window of days')
+        self.assertEqual((aggregator.skipped_zip, aggregator.skipped_date), (1, 1), 'Wrong number of skipped entries')
+        validated = readers.ValidatedBlockReader([records])
+        aggregator = ContributionAggregator(store_factory)
+        self.assertEqual(list(aggregator.ProcessColumnBlocks(validated, validated.id_keys, validated.zip_keys)),
+                         [expected_lines], 'Wrong zip file lines of the window of days from the columns')
+
+    def test_ContributionAggregator_retraction(self):
+        """
+        Check that the refunds retract a matching contribution from the zip and date values, that the refunds without
+        one are skipped (the refund of 01/13 only matches for the zip file and the last one only for the date file),
+        and that a group whose contributions are all retracted has all its values 0, with the records and with the
+        columns.
+
+        :return:
+        """
+
+        print('Testing ContributionAggregator retraction')
+
+        records = [('C00384818', '02895', '01122017', '250', ''), ('C00384818', '02895', '01122017', '100', ''),
+                   ('C00384818', '02895', '01122017', '-250', ''), ('C00384818', '02895', '01122017', '-300', ''),
+                   ('C00384818', '02895', '01132017', '-100', ''), ('C00384818', '02895', '01122017', '-100', '')]
+        expected_zip_lines = ['C00384818|02895|250|1|250\n', 'C00384818|02895|175|2|350\n',
+                              'C00384818|02895|100|1|100\n', 'C00384818|02895|0|0|0\n']
+        expected_date_lines = ['C00384818|01122017|0|0|0\n']
+        store_factory = helpers.ZipStreamingStoreFactory('deletable')
+        aggregator = ContributionAggregator(store_factory, helpers.DateAccumulatorFrequency,
+                                            negative_as_retraction=True)
+        aggregator.TrackDateChanges()
+        self.assertEqual(list(aggregator.ProcessBlocks([records])), [expected_zip_lines], 'Wrong zip file lines')
+        self.assertEqual([lineOut for _, _, lineOut in aggregator.IterateDateLines()], expected_date_lines,
+                         'Wrong date file lines')
+        self.assertEqual((aggregator.retracted_zip, aggregator.retracted_date, aggregator.skipped_zip,
+                          aggregator.skipped_date), (2, 2, 2, 2), 'Wrong number of retracted or skipped entries')
+        self.assertEqual(aggregator.changed_date_keys, set(aggregator.dat_date), 'Wrong changed date keys')
+
+        validated = readers.ValidatedBlockReader([records])
+        aggregator = ContributionAggregator(store_factory, helpers.DateAccumulatorFrequency,
+                                            negative_as_retraction=True)
+        aggregator.TrackDateChanges()
+        self.assertEqual(list(aggregator.ProcessColumnBlocks(validated, validated.id_keys, validated.zip_keys)),
+                         [expected_zip_lines], 'Wrong zip file lines from the columns')
+        self.assertEqual([lineOut for _, _, lineOut in aggregator.IterateDateLines(aggregator.changed_date_keys)],
+                         expected_date_lines, 'Wrong date file lines from the columns')
+        self.assertEqual((aggregator.retracted_zip, aggregator.retracted_date, aggregator.skipped_zip,
+                          aggregator.skipped_date), (2, 2, 2, 2), 'Wrong number of retracted or skipped entries')
+
+        # without the option, a negative amount is a contribution
+        aggregator = ContributionAggregator(store_factory)
+        self.assertEqual(list(aggregator.ProcessBlocks([records[:3]]))[0][-1], 'C00384818|02895|100|3|100\n',
+                         'A negative amount should be a contribution')
+        with self.assertRaises(ValueError):
+            ContributionAggregator(helpers.ZipStreamingStoreFactory('heap'), helpers.DateAccumulatorFrequency,
+                                   negative_as_retraction=True)
+        # the arrays and lists search for the value to remove
+        for date_mode in ['array', 'list']:
+            with self.assertRaises(ValueError):
+                ContributionAggregator(store_factory, helpers.DateAccumulatorFactory(date_mode),
+                                       negative_as_retraction=True)
+
+    def test_ContributionAggregator_retraction_large_group(self):
+        """
+        Retract half of the contributions of a large recipient, zip code and date, in a random order, and check the
+        zip file lines against numpy and the date file line, and that the date values stay counts of the distinct
+        values.
+
+        :return:
+        """
+
+        print('Testing ContributionAggregator retraction from a large group')
+
+        random_state = np.random.RandomState(2)
+        amounts = random_state.choice([10, 25, 50, 100, 250, 500, 1000, 2700], 20000).tolist()
+        refunds = [amounts[index] for index in random_state.permutation(len(amounts))[:len(amounts) // 2]]
+        records = [('C00384818', '02895', '01122017', str(amount), '') for amount in amounts] + \
+                  [('C00384818', '02895', '01122017', str(-amount), '') for amount in refunds]
+        aggregator = ContributionAggregator(helpers.ZipStreamingStoreFactory('deletable'),
+                                            helpers.DateAccumulatorFrequency, negative_as_retraction=True)
+        zip_lines = list(aggregator.ProcessBlocks([records]))[0]
+
+        values = list(amounts)
+        for refund, lineOut in zip(refunds, zip_lines[len(amounts):]):
+            values.remove(refund)
+            if len(values) % 1000 == 0:
+                self.assertEqual(lineOut, helpers.CreateZipOutputString(np.median(values), sum(values), len(values),
+                                                                        'C00384818', '02895'),
+                                 'Wrong zip file line after a retraction')
+        self.assertEqual((aggregator.retracted_zip, aggregator.retracted_date), (len(refunds), len(refunds)),
+                         'Wrong number of retracted contributions')
+        self.assertEqual([lineOut for _, _, lineOut in aggregator.IterateDateLines()],
+                         [helpers.CreateDateOutputString('C00384818', '01122017', np.median(values), sum(values),
+                                                         len(values))], 'Wrong date file line')
+        date_accumulator = aggregator.dat_date.values()[0]
+        self.assertTrue(len(date_accumulator) <= 8, 'The date values should be counts of the distinct values')
+
+
+class TestShardedAggregator(unittest.TestCase):
+    """
+        Check ShardedAggregator class.
+
+    """
+
+    def test_ShardedAggregator(self):
+        """
+        Check that the sharded aggregator gives the same lines as ContributionAggregator, with blocks of a few lines.
+
+        :return:
+        """
+
+        print('Testing ShardedAggregator')
+
+        single_aggregator = ContributionAggregator()
+        RunAggregator(single_aggregator)
+
+        for number_workers in [2, 3]:
+            aggregator = ShardedAggregator(number_workers, ContributionAggregator().zip_store_factory,
+                                           ContributionAggregator().date_accumulator_class)
+            zip_lines, date_lines = RunAggregator(aggregator, block_size=500)
+
+            self.assertEqual(zip_lines, expected_zip_lines, 'Wrong zip file lines')
+            self.assertEqual(date_lines, expected_date_lines, 'Wrong date file lines')
+            self.assertEqual(aggregator.line_number, 7, 'Wrong number of lines')
+            self.assertEqual((aggregator.skipped_zip, aggregator.skipped_date), (1, 1),
+                             'Wrong number of skipped entries')
+            self.assertEqual(aggregator.NumberGroups(), single_aggregator.NumberGroups(), 'Wrong number of groups')
+
+    def test_ShardedAggregator_blocks(self):
+        """
+        Check that the input is read once, by the main process, and that a zip file line is handed out for every block
+        when there are more blocks than the workers can get behind by.
+
+        :return:
+        """
+
+        print('Testing ShardedAggregator blocks')
+
+        aggregator = ShardedAggregator(3, ContributionAggregator().zip_store_factory,
+                                       ContributionAggregator().date_accumulator_class)
+        reader = readers.MappedBlockReader(input_fullfilename, block_size=1)
+        blocks = list(aggregator.ProcessBlocks(reader))
+
+        self.assertEqual(len(blocks), 7, 'Wrong number of blocks')
+        self.assertEqual([lineOut for block_zip_lines in blocks for lineOut in block_zip_lines], expected_zip_lines,
+                         'Wrong zip file lines')
+        self.assertEqual(reader.line_number, 7, 'The input was not read by the main process')
+        self.assertEqual(reader.offset, os.path.getsize(input_fullfilename), 'Wrong offset')
+
+    def test_SplitBlock(self):
+        """
+        Check that every record goes to the shard of its CMTE_ID with its position and comes back from its joined
+        fields, including empty fields and shards without records.
+
+        :return:
+        """
+
+        print('Testing SplitBlock')
+
+        records = [('C1', '02895', '01032017', '384', ''), ('C2', '', '', '', ''), ('C1', '30004', '', '250', 'H1')]
+        for number_shards in [1, 3]:
+            shards = parallel._SplitBlock(records, number_shards)
+            self.assertEqual(len(shards), number_shards, 'Wrong number of shards')
+            for shard_index, (joined, positions) in enumerate(shards):
+                self.assertEqual(positions, [position for position, record in enumerate(records)
+                                             if hash(record[0]) % number_shards == shard_index], 'Wrong positions')
+                self.assertEqual(parallel._JoinedRecords(joined), [records[position] for position in positions],
+                                 'Wrong records')
+        self.assertEqual(parallel._SplitBlock([], 2), [('', []), ('', [])], 'Wrong shards of an empty block')
+        self.assertEqual(parallel._JoinedRecords(''), [], 'An empty string should have no record')
+
+    def test_ShardedAggregator_dead_worker(self):
+        """
+        Check that a worker which dies without reporting an error, as when it is killed, raises an error naming its
+        shard instead of leaving the main process waiting for it.
+
+        :return:
+        """
+
+        print('Testing ShardedAggregator dead worker')
+
+        aggregator = ShardedAggregator(2, ContributionAggregator().zip_store_factory, ExitingDateAccumulator)
+        with self.assertRaisesRegexp(RuntimeError, r'The worker of shard \d died with exit code 3'):
+            RunAggregator(aggregator, block_size=1)
+
+    def test_ShardedAggregator_spill(self):
+        """
+        Check the date file lines when the workers spill their values to disk.
+
+        :return:
+        """
+
+        print('Testing ShardedAggregator spill')
+
+        aggregator = ShardedAggregator(2, ContributionAggregator().zip_store_factory,
+                                       ContributionAggregator().date_accumulator_class, date_memory_budget=2)
+        zip_lines, date_lines = RunAggregator(aggregator, block_size=1)
+
+        self.assertEqual(zip_lines, expected_zip_lines, 'Wrong zip file lines')
+        self.assertEqual(date_lines, expected_date_lines, 'Wrong date file lines')
+
+
+if __name__ == '__main__':
+    unittest.main()
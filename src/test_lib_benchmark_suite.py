@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+Unit tests for the benchmark suite of benchmark_suite.py.  The unittest of the Python Standard Library is used.
+The user is expected to run run_unit_tests.sh at the base of the repository in order to run these tests.
+
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import benchmark_suite
+
+
+class TestBenchmarkSuite(unittest.TestCase):
+    """
+        Check the CreateInput, Run and Compare functions.
+
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_CreateInput(self):
+        """
+        Check that the synthetic inputs and the inputs drawn from a sample have the number of lines asked for, that the
+        lines drawn are from the sample and that the same seed gives the same input.
+
+        :return:
+        """
+
+        print('Testing CreateInput')
+
+        sample_fullfilename = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'input', 'itcont.txt')
+        with open(sample_fullfilename, 'rb') as fid:
+            sample_lines = set(fid.readlines())
+
+        for sample in [None, sample_fullfilename]:
+            contents = []
+            for seed in [0, 0, 1]:
+                input_fullfilename = os.path.join(self.folder, 'itcont.txt')
+                benchmark_suite.CreateInput(50, input_fullfilename, seed, sample)
+                with open(input_fullfilename, 'rb') as fid:
+                    lines = fid.readlines()
+                self.assertEqual(len(lines), 50, 'Wrong number of lines')
+                if sample is not None:
+                    self.assertTrue(sample_lines.issuperset(lines), 'The lines are not from the sample')
+                contents.append(lines)
+            self.assertEqual(contents[0], contents[1], 'The same seed gave different inputs')
+            self.assertNotEqual(contents[0], contents[2], 'Different seeds gave the same input')
+
+    def test_Run(self):
+        """
+        Check that every benchmark is run for every size.
+
+        :return:
+        """
+
+        print('Testing Run')
+
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            results = benchmark_suite.Run([10, 20], repeat=1)
+        finally:
+            sys.stdout = stdout
+
+        names = ['parse_line', 'parse_block', 'validate_zip', 'validate_date', 'validate_zip_batch',
+                 'validate_date_batch', 'ingest_exact', 'ingest_heap', 'ingest_approx', 'ingest_window',
+                 'ingest_deletable', 'retract_deletable', 'format_zip', 'format_date', 'full', 'full_columns',
+                 'build_cache', 'full_cached']
+        self.assertEqual(sorted(results['benchmarks']),
+                         sorted('{}/{}'.format(name, size) for name in names for size in [10, 20]),
+                         'Wrong benchmarks')
+        self.assertEqual(results['benchmarks']['full/20']['lines'], 20, 'Wrong number of lines')
+
+    def test_Compare(self):
+        """
+        Check that only the benchmarks slower than the threshold are flagged and that benchmarks missing from either
+        results are left out.
+
+        :return:
+        """
+
+        print('Testing Compare')
+
+        baseline = {'benchmarks': {'parse_line/10': {'seconds': 1.0}, 'full/10': {'seconds': 2.0},
+                                   'ingest_exact/10': {'seconds': 1.0}}}
+        results = {'benchmarks': {'parse_line/10': {'seconds': 1.05}, 'full/10': {'seconds': 2.5},
+                                  'format_zip/10': {'seconds': 1.0}}}
+        self.assertEqual(benchmark_suite.Compare(baseline, results, 0.1),
+                         [('full/10', 2.0, 2.5, 1.25, True), ('parse_line/10', 1.0, 1.05, 1.05, False)],
+                         'Wrong comparison')
+        self.assertEqual([regression for _, _, _, _, regression in benchmark_suite.Compare(baseline, results, 0.3)],
+                         [False, False], 'Wrong regressions with a larger threshold')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+"""
+Unit tests for the checkpoints and the incremental state of checkpoint.py.  The unittest of the Python Standard Library is used.
+The user is expected to run run_unit_tests.sh at the base of the repository in order to run these tests.
+
+The input and expected output of the insight_testsuite test_1 are used.
+
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import checkpoint, helpers, readers
+import find_political_donors_delta
+from aggregator import ContributionAggregator
+
+test_folder = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'insight_testsuite', 'tests', 'test_1')
+input_fullfilename = os.path.join(test_folder, 'input', 'itcont.txt')
+with open(os.path.join(test_folder, 'output', 'medianvals_by_zip.txt'), 'rb') as fid:
+    expected_zip_lines = fid.read().splitlines(True)
+with open(os.path.join(test_folder, 'output', 'medianvals_by_date.txt'), 'rb') as fid:
+    expected_date_lines = fid.read().splitlines(True)
+
+
+class TestCheckpointer(unittest.TestCase):
+    """
+        Check Checkpointer class.
+
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.checkpoint_fullfilename = os.path.join(self.folder, 'checkpoint')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_Checkpointer_resume(self):
+        """
+        Save a checkpoint after every block of one input line, stop after each of them in turn and check that resuming
+        from the checkpoint gives the same zip and date file lines as an uninterrupted run, for every zip store and
+        date accumulator (the approximate median does not give the expected lines of test_1).
+
+        :return:
+        """
+
+        print('Testing Checkpointer resume')
+
+        for median_mode in ['exact', 'heap', 'approx']:
+            for date_mode in ['array', 'frequency', 'list']:
+                zip_store_factory = helpers.ZipStreamingStoreFactory(median_mode)
+                date_accumulator_class = helpers.DateAccumulatorFactory(date_mode)
+
+                # the uninterrupted run
+                aggregator = ContributionAggregator(zip_store_factory, date_accumulator_class)
+                reader = readers.MappedBlockReader(input_fullfilename)
+                uninterrupted_zip_lines = [lineOut for block_zip_lines in aggregator.ProcessBlocks(reader)
+                                           for lineOut in block_zip_lines]
+                uninterrupted_date_lines = [lineOut for _, _, lineOut in aggregator.IterateDateLines()]
+                if median_mode != 'approx':
+                    self.assertEqual(uninterrupted_zip_lines, expected_zip_lines, 'Wrong zip file lines')
+                self.assertEqual(uninterrupted_date_lines, expected_date_lines, 'Wrong date file lines')
+
+                for number_blocks in xrange(len(expected_zip_lines) + 1):
+                    checkpointer = checkpoint.Checkpointer(self.checkpoint_fullfilename, checkpoint_lines=1)
+
+                    # the first run stops after number_blocks blocks
+                    aggregator = ContributionAggregator(zip_store_factory, date_accumulator_class)
+                    reader = readers.MappedBlockReader(input_fullfilename, block_size=1)
+                    zip_lines = []
+                    for block_zip_lines in aggregator.ProcessBlocks(reader):
+                        zip_lines.extend(block_zip_lines)
+                        checkpointer.Wait()
+                        self.assertTrue(checkpointer.Due(aggregator.line_number), 'The checkpoint is not due')
+                        checkpointer.Save(aggregator, reader.offset, len(zip_lines))
+                        if aggregator.line_number == number_blocks:
+                            break
+
+                    # and the second one continues from the checkpoint
+                    state = checkpointer.Load()
+                    aggregator = state['aggregator']
+                    reader = readers.MappedBlockReader(input_fullfilename, block_size=1,
+                                                       start_offset=state['input_offset'])
+                    zip_lines = zip_lines[:state['zip_position']]
+                    for block_zip_lines in aggregator.ProcessBlocks(reader):
+                        zip_lines.extend(block_zip_lines)
+                    date_lines = [lineOut for _, _, lineOut in aggregator.IterateDateLines()]
+
+                    self.assertEqual(zip_lines, uninterrupted_zip_lines,
+                                     'Wrong zip file lines with {} and {}'.format(median_mode, date_mode))
+                    self.assertEqual(date_lines, uninterrupted_date_lines,
+                                     'Wrong date file lines with {} and {}'.format(median_mode, date_mode))
+
+    def test_Checkpointer_due(self):
+        """
+        Check when checkpoints are due, that there is no checkpoint before the first one is saved and that Remove
+        deletes it.
+
+        :return:
+        """
+
+        print('Testing Checkpointer due')
+
+        checkpointer = checkpoint.Checkpointer(self.checkpoint_fullfilename, checkpoint_lines=10)
+        self.assertIsNone(checkpointer.Load(), 'There should be no checkpoint')
+        self.assertFalse(checkpointer.Due(9), 'The checkpoint should not be due')
+        self.assertTrue(checkpointer.Due(10), 'The checkpoint should be due')
+
+        aggregator = ContributionAggregator()
+        aggregator.line_number = 10
+        checkpointer.Save(aggregator, 0, 0)
+        self.assertFalse(checkpointer.Due(19), 'The checkpoint should not be due')
+        checkpointer.Wait()
+        self.assertTrue(checkpointer.Due(20), 'The checkpoint should be due')
+        self.assertFalse(os.path.exists(self.checkpoint_fullfilename + '.tmp'), 'The temporary file was left behind')
+
+        checkpointer.Remove()
+        self.assertIsNone(checkpointer.Load(), 'The checkpoint was not removed')
+
+        # no limit on the lines but no time between checkpoints
+        checkpointer = checkpoint.Checkpointer(self.checkpoint_fullfilename, checkpoint_seconds=0.0)
+        self.assertTrue(checkpointer.Due(0), 'The checkpoint should be due')
+        checkpointer = checkpoint.Checkpointer(self.checkpoint_fullfilename)
+        self.assertFalse(checkpointer.Due(10 ** 9), 'The checkpoint should never be due')
+
+    def test_Checkpointer_background(self):
+        """
+        Check that a checkpoint written in the process is there as soon as Save returns, that one written in a forked
+        process is the same once it has finished and that its failure is reported by Wait.
+
+        :return:
+        """
+
+        print('Testing Checkpointer background')
+
+        aggregator = ContributionAggregator()
+        reader = readers.MappedBlockReader(input_fullfilename)
+        zip_lines = [lineOut for block_zip_lines in aggregator.ProcessBlocks(reader) for lineOut in block_zip_lines]
+        date_lines = [lineOut for _, _, lineOut in aggregator.IterateDateLines()]
+
+        for background in [False, True]:
+            checkpointer = checkpoint.Checkpointer(self.checkpoint_fullfilename, checkpoint_lines=1,
+                                                   background=background)
+            checkpointer.Save(aggregator, reader.offset, len(zip_lines))
+            if not background:
+                self.assertIsNone(checkpointer.writer_pid, 'The checkpoint was written in another process')
+                self.assertTrue(os.path.exists(self.checkpoint_fullfilename), 'The checkpoint was not written')
+            state = checkpointer.Load()
+            self.assertIsNone(checkpointer.writer_pid, 'Load did not wait for the checkpoint')
+            self.assertEqual(state['input_offset'], reader.offset, 'Wrong input offset')
+            self.assertEqual(state['zip_position'], len(zip_lines), 'Wrong zip position')
+            self.assertEqual([lineOut for _, _, lineOut in state['aggregator'].IterateDateLines()], date_lines,
+                             'Wrong date file lines')
+            checkpointer.Remove()
+
+        # the folder of the checkpoint does not exist
+        checkpointer = checkpoint.Checkpointer(os.path.join(self.folder, 'missing', 'checkpoint.pkl'))
+        checkpointer.Save(aggregator, reader.offset, len(zip_lines))
+        self.assertRaises(RuntimeError, checkpointer.Wait)
+
+    def test_Checkpointer_quarantine(self):
+        """
+        Check that the quarantine file continues from its size at the checkpoint.
+
+        :return:
+        """
+
+        print('Testing Checkpointer quarantine')
+
+        quarantine_fullfilename = os.path.join(self.folder, 'quarantine')
+        rejections = helpers.RejectionAccounting(quarantine_fullfilename)
+        rejections.RejectEntry(('C00629618', '90017', '01032017', '40', 'H6CA34245'))
+        checkpointer = checkpoint.Checkpointer(self.checkpoint_fullfilename)
+        aggregator = ContributionAggregator(rejections=rejections)
+        checkpointer.Save(aggregator, 0, 0)
+
+        # written after the checkpoint, so it is dropped when resuming
+        rejections.RejectEntry(('', '90017', '01032017', '40', ''))
+        rejections.Close()
+
+        rejections = checkpointer.Load()['aggregator'].rejections
+        rejections.RejectEntry(('C00629618', '90017', '01032017', '', ''))
+        rejections.Close()
+        with open(quarantine_fullfilename, 'rb') as fid:
+            self.assertEqual(fid.read(), 'OTHER_ID|C00629618|90017|01032017|40|H6CA34245\n'
+                                         'TRANSACTION_AMT|C00629618|90017|01032017||\n', 'Wrong quarantine file')
+        self.assertEqual(rejections.counts['OTHER_ID'], 1, 'Wrong count')
+        self.assertEqual(rejections.counts['CMTE_ID'], 0, 'Wrong count')
+        self.assertEqual(rejections.counts['TRANSACTION_AMT'], 1, 'Wrong count')
+
+
+class TestIncrementalState(unittest.TestCase):
+    """
+        Check FingerprintPrefix, SaveState and LoadState and the incremental mode of ContributionAggregator.
+
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_FingerprintPrefix(self):
+        """
+        Check that the fingerprint of a prefix does not change when lines are appended to a file and does when the
+        prefix changes, for small files and files that are sampled.
+
+        :return:
+        """
+
+        print('Testing FingerprintPrefix')
+
+        fullfilename = os.path.join(self.folder, 'itcont.txt')
+        for number_bytes in [100, checkpoint.FINGERPRINT_SAMPLES * checkpoint.FINGERPRINT_SAMPLE_SIZE * 3]:
+            content = ''.join(chr(ord('a') + i % 26) for i in xrange(number_bytes))
+            with open(fullfilename, 'wb') as fid:
+                fid.write(content)
+            fingerprint = checkpoint.FingerprintPrefix(fullfilename, number_bytes)
+            self.assertIsNone(checkpoint.FingerprintPrefix(fullfilename, number_bytes + 1),
+                              'The file is shorter than the prefix')
+
+            with open(fullfilename, 'ab') as fid:
+                fid.write('appended\n')
+            self.assertEqual(checkpoint.FingerprintPrefix(fullfilename, number_bytes), fingerprint,
+                             'The fingerprint changed when appending')
+            self.assertNotEqual(checkpoint.FingerprintPrefix(fullfilename, number_bytes - 1), fingerprint,
+                                'The fingerprint of a shorter prefix is the same')
+
+            # the last bytes of the prefix are always sampled
+            with open(fullfilename, 'r+b') as fid:
+                fid.seek(number_bytes - 1)
+                fid.write('!')
+            self.assertNotEqual(checkpoint.FingerprintPrefix(fullfilename, number_bytes), fingerprint,
+                                'The fingerprint did not change with the prefix')
+
+    def test_IncrementalState(self):
+        """
+        Process the test input in two parts, saving and loading the state in between, and check that merging the
+        changed date file lines into the date file lines of the first part gives the expected lines.
+
+        :return:
+        """
+
+        print('Testing incremental state')
+
+        state_fullfilename = os.path.join(self.folder, 'state')
+        self.assertIsNone(checkpoint.LoadState(state_fullfilename), 'There should be no state')
+
+        for number_blocks in xrange(len(expected_zip_lines) + 1):
+            aggregator = ContributionAggregator()
+            reader = readers.MappedBlockReader(input_fullfilename, block_size=1)
+            zip_lines = []
+            for block_zip_lines in aggregator.ProcessBlocks(reader):
+                zip_lines.extend(block_zip_lines)
+                if aggregator.line_number == number_blocks:
+                    break
+            date_lines = [lineOut for _, _, lineOut in aggregator.IterateDateLines()]
+            checkpoint.SaveState(state_fullfilename, {'aggregator': aggregator, 'input_offset': reader.offset})
+
+            state = checkpoint.LoadState(state_fullfilename)
+            aggregator = state['aggregator']
+            aggregator.TrackDateChanges()
+            reader = readers.MappedBlockReader(input_fullfilename, start_offset=state['input_offset'])
+            for block_zip_lines in aggregator.ProcessBlocks(reader):
+                zip_lines.extend(block_zip_lines)
+            date_lines = list(helpers.MergeDateLines(date_lines,
+                                                     aggregator.IterateDateLines(aggregator.changed_date_keys)))
+
+            self.assertEqual(zip_lines, expected_zip_lines, 'Wrong zip file lines')
+            self.assertEqual(date_lines, expected_date_lines, 'Wrong date file lines')
+
+    def test_main_incomplete_line(self):
+        """
+        Run find_political_donors_delta.py in the incremental mode on an input whose last line is only half written,
+        then again once the line is complete and more lines are appended, and check that the contribution of the half
+        line is not lost, with both readers.
+
+        :return:
+        """
+
+        print('Testing incremental mode with an incomplete last line')
+
+        with open(input_fullfilename, 'rb') as fid:
+            content = fid.read()
+        lines = content.splitlines(True)
+        # the input ends in the middle of the fourth line
+        split = len(''.join(lines[:3])) + len(lines[3]) // 2
+        input_copy_fullfilename = os.path.join(self.folder, 'itcont.txt')
+        zip_fullfilename = os.path.join(self.folder, 'medianvals_by_zip.txt')
+        date_fullfilename = os.path.join(self.folder, 'medianvals_by_date.txt')
+        state_fullfilename = os.path.join(self.folder, 'state')
+        stdout = sys.stdout
+        try:
+            sys.stdout = open(os.devnull, 'w')
+            for reader_mode in ['mmap', 'lines']:
+                if os.path.exists(state_fullfilename):
+                    os.remove(state_fullfilename)
+                with open(input_copy_fullfilename, 'wb') as fid:
+                    fid.write(content[:split])
+                find_political_donors_delta.main(input_copy_fullfilename, zip_fullfilename, date_fullfilename,
+                                                 reader_mode=reader_mode, state_fullfilename=state_fullfilename)
+                self.assertEqual(checkpoint.LoadState(state_fullfilename)['input_offset'], len(''.join(lines[:3])),
+                                 'The state should stop before the incomplete line')
+                with open(input_copy_fullfilename, 'ab') as fid:
+                    fid.write(content[split:])
+                find_political_donors_delta.main(input_copy_fullfilename, zip_fullfilename, date_fullfilename,
+                                                 reader_mode=reader_mode, state_fullfilename=state_fullfilename)
+                with open(zip_fullfilename, 'rb') as fid:
+                    self.assertEqual(fid.read().splitlines(True), expected_zip_lines,
+                                     'Wrong zip file with the {} reader'.format(reader_mode))
+                with open(date_fullfilename, 'rb') as fid:
+                    self.assertEqual(fid.read().splitlines(True), expected_date_lines,
+                                     'Wrong date file with the {} reader'.format(reader_mode))
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+
+if __name__ == '__main__':
+    unittest.main()
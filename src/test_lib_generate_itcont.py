@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Unit tests for the synthetic itcont.txt generator of generate_itcont.py.  The unittest of the Python Standard Library
+is used.
+The user is expected to run run_unit_tests.sh at the base of the repository in order to run these tests.
+
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from collections import Counter
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import generate_itcont, helpers
+
+
+class TestGenerateItcont(unittest.TestCase):
+    """
+        Check ItcontGenerator class and GenerateFile function.
+
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.output_fullfilename = os.path.join(self.folder, 'itcont.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_GenerateChunk(self):
+        """
+        Check that every line has the 21 columns and that the shares of the OTHER_ID set, the malformed zip codes, the
+        invalid dates and the $250 amounts are close to the configured ones.
+
+        :return:
+        """
+
+        print('Testing GenerateChunk')
+
+        NUMBER_LINES = 100000
+        lines = generate_itcont.ItcontGenerator(seed=0).GenerateChunk(NUMBER_LINES).splitlines()
+        self.assertEqual(len(lines), NUMBER_LINES, 'Wrong number of lines')
+        columns = [line.split('|') for line in lines]
+        self.assertTrue(all(len(line_columns) == 21 for line_columns in columns), 'Wrong number of columns')
+
+        def Share(condition):
+            return sum(1 for line_columns in columns if condition(line_columns)) / float(NUMBER_LINES)
+
+        self.assertAlmostEqual(Share(lambda line_columns: line_columns[15] != ''), generate_itcont.OTHER_ID_SHARE,
+                               delta=0.005, msg='Wrong share of OTHER_ID set')
+        self.assertAlmostEqual(Share(lambda line_columns: not helpers.CheckZipCode(line_columns[10][:5])),
+                               generate_itcont.MALFORMED_ZIP_SHARE, delta=0.003, msg='Wrong share of malformed zip codes')
+        self.assertAlmostEqual(Share(lambda line_columns: not helpers.CheckTransactionDate(line_columns[13])),
+                               generate_itcont.INVALID_DATE_SHARE, delta=0.002, msg='Wrong share of invalid dates')
+        self.assertAlmostEqual(Share(lambda line_columns: line_columns[14] == '250'),
+                               generate_itcont.AMOUNT_SPIKES[250], delta=0.01, msg='Wrong share of $250 amounts')
+
+        # the most popular recipient gets many more contributions than the median one
+        counts = sorted(Counter(line_columns[0] for line_columns in columns).values(), reverse=True)
+        self.assertGreater(counts[0], 10 * counts[len(counts) // 2], 'The recipients are not heavy-tailed')
+
+    def test_GenerateFile(self):
+        """
+        Check the number of lines and bytes of the files and that the same seed gives the same file.
+
+        :return:
+        """
+
+        print('Testing GenerateFile')
+
+        contents = []
+        for seed in [3, 3, 4]:
+            number_lines = generate_itcont.GenerateFile(self.output_fullfilename, number_lines=1000, seed=seed,
+                                                        chunk_lines=300)
+            with open(self.output_fullfilename, 'rb') as fid:
+                contents.append(fid.read())
+            self.assertEqual(number_lines, 1000, 'Wrong number of lines returned')
+            self.assertEqual(contents[-1].count('\n'), 1000, 'Wrong number of lines')
+        self.assertEqual(contents[0], contents[1], 'The same seed gave different files')
+        self.assertNotEqual(contents[0], contents[2], 'Different seeds gave the same file')
+
+        number_lines = generate_itcont.GenerateFile(self.output_fullfilename, number_bytes=100000, seed=3,
+                                                    chunk_lines=300)
+        with open(self.output_fullfilename, 'rb') as fid:
+            content = fid.read()
+        self.assertEqual(content.count('\n'), number_lines, 'Wrong number of lines returned')
+        self.assertTrue(content.endswith('\n'), 'The file does not end with a whole line')
+        self.assertGreaterEqual(len(content), 100000, 'The file is too small')
+        self.assertLess(len(content[:-1]) - len(content[:-1].rsplit('\n', 1)[-1]), 100000,
+                        'The file goes on past the line that reaches the number of bytes')
+
+        with self.assertRaises(ValueError):
+            generate_itcont.GenerateFile(self.output_fullfilename)
+
+
+if __name__ == '__main__':
+    unittest.main()
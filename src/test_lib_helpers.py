@@ -8,8 +8,12 @@ subdirectories were allowed for the /src folder
 
 
 """
+import datetime
 import os
+import pickle
+import shutil
 import sys
+import tempfile
 import time
 import unittest
 
@@ -138,6 +142,131 @@ class TestTransactionDateHelpers(unittest.TestCase):
 # I should write a test class for ConvertTransactionDateToEpochGM but I'm short on time! Sorry!
 
 
+class TestParseTransactionDate(unittest.TestCase):
+    """
+        Check the ParseTransactionDate function which converts a MMDDYYYY date string to YYYYMMDD without strptime.
+    """
+
+    def test_ParseTransactionDate_sort_keys(self):
+        """
+        Check the YYYYMMDD values of good dates and that they sort chronologically.
+        :return:
+        """
+        print('Testing ParseTransactionDate sort keys')
+
+        self.assertEqual([helpers.ParseTransactionDate(good_date) for good_date in good_dates_list],
+                         [20160101, 20160229, 19801212], 'Wrong YYYYMMDD values.')
+        dates = ['12312016', '01012017', '02012016', '01312016']
+        self.assertEqual(sorted(dates, key=helpers.ParseTransactionDate), ['01312016', '02012016', '12312016', '01012017'],
+                         'Dates did not sort chronologically.')
+
+    def test_ParseTransactionDate_leap_years(self):
+        """
+        Check February 29 in leap and non-leap years, including the century rules.
+        :return:
+        """
+        print('Testing ParseTransactionDate leap years')
+
+        self.assertTrue(helpers.ParseTransactionDate('02292016') > 0, 'Did not accept 02/29/2016.')
+        self.assertTrue(helpers.ParseTransactionDate('02292000') > 0, 'Did not accept 02/29/2000.')
+        self.assertEqual(helpers.ParseTransactionDate('02292017'), -1, 'Did not reject 02/29/2017.')
+        self.assertEqual(helpers.ParseTransactionDate('02292100'), -1, 'Did not reject 02/29/2100.')
+        self.assertEqual(helpers.ParseTransactionDate('04312016'), -1, 'Did not reject 04/31/2016.')
+
+    def test_ParseTransactionDate_matches_strptime(self):
+        """
+        Check that ParseTransactionDate agrees with ConvertTransactionDateToEpochGM (strptime) on the unit test dates and
+        on random 8 digit strings, including dates around 01/01/1970.
+        :return:
+        """
+        print('Testing ParseTransactionDate against ConvertTransactionDateToEpochGM')
+
+        dates = good_dates_list + [short_date, long_date, invalid_month_date, invalid_day_date, wrong_characters_date,
+                                   '01011970', '01021970', '12311969', '00102017', '01002017', '', '0101 017']
+        dates += ['%02d%02d%04d' % (month, day, year) for month, day, year in
+                  zip(np.random.randint(0, 14, 2000), np.random.randint(0, 33, 2000), np.random.randint(1960, 2101, 2000))]
+        for date in dates:
+            self.assertEqual(helpers.ParseTransactionDate(date) > 0, helpers.ConvertTransactionDateToEpochGM(date) > 0,
+                             'ParseTransactionDate and ConvertTransactionDateToEpochGM disagree on {}.'.format(date))
+
+    def test_ParseTransactionDate_short_dates(self):
+        """
+        Check that ParseTransactionDate rejects the dates without the leading zeros of the month or day, which
+        ConvertTransactionDateToEpochGM (strptime) accepts.
+        :return:
+        """
+        print('Testing ParseTransactionDate short dates')
+
+        for date in ['1012017', '112017', '0112017', '1122017']:
+            self.assertGreater(helpers.ConvertTransactionDateToEpochGM(date), 0,
+                               'strptime should accept {}.'.format(date))
+            self.assertEqual(helpers.ParseTransactionDate(date), -1, '{} should be invalid.'.format(date))
+            self.assertFalse(helpers.CheckTransactionDate(date), '{} should be invalid.'.format(date))
+
+
+class TestBatchValidation(unittest.TestCase):
+    """
+        Check the CheckZipCodes, ParseTransactionDates and ParseAmounts functions against the functions they do for
+        many values at once.
+    """
+
+    def test_CheckZipCodes(self):
+        """
+        Check that CheckZipCodes agrees with CheckZipCode on the unit test zip codes, the odd ones int() accepts or
+        not, and random strings of digits, signs, whitespace and letters, with and without cutting them to 5
+        characters.
+        :return:
+        """
+        print('Testing CheckZipCodes')
+
+        zipcodes = [good_zip, wrong_number_digits, malformed_zip, 'a8928', '', '041051935', '-1234', '+12345', ' 12345',
+                    '12345 ', '1234 ', '+ 1234', '--123', '123-4', '12 34', '\t1234\n', '     ', '00000']
+        random_state = np.random.RandomState(0)
+        characters = np.array(list('0123456789+- \ta'))
+        zipcodes += [''.join(characters[random_state.randint(0, len(characters), size)])
+                     for size in random_state.randint(0, 11, 5000)]
+        for width in [None, 5]:
+            cut = [zipcode[:width] for zipcode in zipcodes]
+            self.assertEqual(helpers.CheckZipCodes(zipcodes, width).tolist(),
+                             [helpers.CheckZipCode(zipcode) for zipcode in cut],
+                             'CheckZipCodes and CheckZipCode disagree with width {}.'.format(width))
+        self.assertEqual(helpers.CheckZipCodes([]).tolist(), [], 'No zip codes')
+
+    def test_ParseTransactionDates(self):
+        """
+        Check that ParseTransactionDates agrees with ParseTransactionDate on the unit test dates and on random dates,
+        including invalid ones.
+        :return:
+        """
+        print('Testing ParseTransactionDates')
+
+        dates = good_dates_list + [short_date, long_date, invalid_month_date, invalid_day_date, wrong_characters_date,
+                                   '01011970', '01021970', '12311969', '00102017', '01002017', '', '0101 017',
+                                   '02292016', '02292000', '02292017', '02292100', '04312016', '+1012017',
+                                   # a valid date followed by more characters
+                                   '011520179', '01152017 ', '0115201']
+        dates += ['%02d%02d%04d' % (month, day, year) for month, day, year in
+                  zip(np.random.randint(0, 14, 2000), np.random.randint(0, 33, 2000), np.random.randint(1960, 2101, 2000))]
+        self.assertEqual(helpers.ParseTransactionDates(dates).tolist(),
+                         [helpers.ParseTransactionDate(date) for date in dates],
+                         'ParseTransactionDates and ParseTransactionDate disagree.')
+
+    def test_ParseAmounts(self):
+        """
+        Check that ParseAmounts agrees with int(), and raises the same errors.
+        :return:
+        """
+        print('Testing ParseAmounts')
+
+        amounts = ['40', '384', '007', '0', '+5', ' 5', '-3', '12 ', '99999999999999999', '123456789012345678']
+        self.assertEqual(helpers.ParseAmounts(np.array(amounts)).tolist(), [int(amount) for amount in amounts],
+                         'ParseAmounts and int() disagree.')
+        with self.assertRaises(ValueError):
+            helpers.ParseAmounts(np.array(['40', '1.5']))
+        with self.assertRaises(OverflowError):
+            helpers.ParseAmounts(np.array(['40', '1' * 25]))
+
+
 class TestParseLine(unittest.TestCase):
     """
         Check ParseLine helper function.
@@ -343,5 +472,583 @@ class TestZipStreaming(unittest.TestCase):
 
 
 
+class TestMedianStreamingFrequency(unittest.TestCase):
+    """
+        Check MedianStreamingFrequency class.
+
+    """
+
+    def test_MedianStreamingFrequency_ingest(self):
+        """
+        Calculate the median values for a stream of values with few distinct values using an instance of the
+        MedianStreamingFrequency class and compare it with a brute force method using numpy
+
+        :return: Nothing
+        """
+
+        print('Testing MedianStreamingFrequency ingest method')
+
+        NUMBER_VALUES = 1000
+        # few distinct values, with some values much more frequent than others
+        random_integers_list = np.random.choice([5, 20, 25, 100, 250, 250, 250, 500, 1000, 2700], NUMBER_VALUES)
+
+        running_medians_numpy = np.zeros(NUMBER_VALUES)
+        running_medians_frequency = np.zeros(NUMBER_VALUES)
+
+        current_list_of_values = []
+        median_streaming = helpers.MedianStreamingFrequency()
+        for i in xrange(NUMBER_VALUES):
+            current_list_of_values.append(random_integers_list[i])
+            running_medians_numpy[i] = np.median(current_list_of_values)
+            running_medians_frequency[i] = median_streaming.ingest(random_integers_list[i])
+
+        self.assertTrue(np.all(running_medians_numpy == running_medians_frequency), 'The median values are not equal')
+        self.assertEqual(median_streaming.values, sorted(set(random_integers_list)), 'Distinct values are wrong')
+        self.assertEqual(sum(median_streaming.counts), NUMBER_VALUES, 'Counts do not add up to the number of values')
+
+    def test_MedianStreamingFrequency_matches_heaps(self):
+        """
+        Check that MedianStreamingFrequency returns exactly the same values as MedianStreaming, including the
+        descending and alternating streams that move the median pointer in both directions.
+
+        :return: Nothing
+        """
+
+        print('Testing MedianStreamingFrequency against MedianStreaming')
+
+        streams = [range(20, 0, -1), [1, 100] * 10 + [50] * 5, list(np.random.randint(0, 1000, 1000))]
+        for stream in streams:
+            median_heaps = helpers.MedianStreaming()
+            median_frequency = helpers.MedianStreamingFrequency()
+            for value in stream:
+                self.assertEqual(median_heaps.ingest(value), median_frequency.ingest(value),
+                                 'The median values are not equal')
+
+    def test_MedianStreamingFrequency_reset(self):
+        """
+        Test that the reset method clears the distinct values and counts.
+
+        :return: Nothing
+        """
+
+        print('Testing MedianStreamingFrequency reset method')
+
+        median_streaming = helpers.MedianStreamingFrequency()
+        for value in [3, 1, 2, 2]:
+            median_streaming.ingest(value)
+        median_streaming.reset()
+
+        self.assertTrue(median_streaming.values == [], 'Distinct values are not empty after reset.')
+        self.assertTrue(median_streaming.counts == [], 'Counts are not empty after reset.')
+        self.assertTrue(median_streaming.median_current == 0, 'Median is not zero after reset.')
+        self.assertEqual(median_streaming.ingest(7), 7, 'Wrong median after reset.')
+
+
+class TestZipStreamingFrequency(unittest.TestCase):
+    """
+        Check ZipStreamingFrequency class.
+
+    """
+
+    def test_ZipStreamingFrequency_ingest(self):
+        """
+        Check that the median, total and count values of ZipStreamingFrequency are the same as the ones of ZipStreaming.
+
+        :return: Nothing
+        """
+
+        print('Testing ZipStreamingFrequency ingest method')
+
+        NUMBER_VALUES = 1000
+        random_integers_list = np.random.choice([10, 25, 50, 100, 250, 500, 1000], NUMBER_VALUES)
+
+        zip_streaming = helpers.ZipStreaming()
+        zip_streaming_frequency = helpers.ZipStreamingFrequency()
+        for i in xrange(NUMBER_VALUES):
+            self.assertEqual(zip_streaming.ingest(random_integers_list[i]),
+                             zip_streaming_frequency.ingest(random_integers_list[i]),
+                             'The median, total or count values are not equal')
+
+        self.assertEqual(zip_streaming_frequency.GetCount(), NUMBER_VALUES, 'The GetCount() value is wrong')
+        self.assertEqual(zip_streaming_frequency.GetTotal(), np.sum(random_integers_list), 'The GetTotal() value is wrong')
+        self.assertTrue(len(zip_streaming_frequency.values) <= 7, 'More distinct values stored than ingested')
+
+
+class TestZipStreamingApprox(unittest.TestCase):
+    """
+        Check ZipStreamingApprox class.
+
+    """
+
+    def test_ZipStreamingApprox_ingest(self):
+        """
+        Check that the running median of ZipStreamingApprox is within the relative error of numpy.median and that the
+        total and count values are exact.
+
+        :return: Nothing
+        """
+
+        print('Testing ZipStreamingApprox ingest method')
+
+        NUMBER_VALUES = 1000
+        RELATIVE_ERROR = 0.01
+        random_integers_list = np.random.lognormal(5, 1.5, NUMBER_VALUES).astype(np.int64) + 1
+
+        current_list_of_values = []
+        zip_streaming = helpers.ZipStreamingApprox(RELATIVE_ERROR)
+        for i in xrange(NUMBER_VALUES):
+            current_list_of_values.append(random_integers_list[i])
+            median_approx, total, count = zip_streaming.ingest(random_integers_list[i])
+            median_exact = np.median(current_list_of_values)
+
+            self.assertTrue(abs(median_approx - median_exact) <= RELATIVE_ERROR * median_exact + 1e-9,
+                            'Median {} is not within {} of {}'.format(median_approx, RELATIVE_ERROR, median_exact))
+            self.assertEqual(total, np.sum(current_list_of_values), 'The total values are not equal')
+            self.assertEqual(count, i + 1, 'The count values are not equal')
+
+    def test_ZipStreamingApprox_max_bins(self):
+        """
+        Check that the sketch never grows beyond max_bins.
+
+        :return: Nothing
+        """
+
+        print('Testing ZipStreamingApprox max_bins')
+
+        zip_streaming = helpers.ZipStreamingApprox(0.01, max_bins=50)
+        for value in np.random.randint(-100000, 100000, 1000):
+            zip_streaming.ingest(value)
+            self.assertTrue(len(zip_streaming.values) <= 50, 'Sketch has more than max_bins buckets')
+        self.assertEqual(sum(zip_streaming.counts), 1000, 'Counts do not add up to the number of values')
+
+
+class TestIndexableSkiplist(unittest.TestCase):
+    """
+        Check IndexableSkiplist class.
+
+    """
+
+    def test_IndexableSkiplist(self):
+        """
+        Insert and remove random values with repeats and compare the values by rank and the median with a sorted
+        list, also after pickling.
+
+        :return:
+        """
+
+        print('Testing IndexableSkiplist')
+
+        random_state = np.random.RandomState(0)
+        skiplist = helpers.IndexableSkiplist()
+        sorted_values = []
+        self.assertEqual(skiplist.GetMedian(), 0, 'Wrong median without values')
+        for step in xrange(5000):
+            if sorted_values and random_state.rand() < 0.4:
+                value = sorted_values[random_state.randint(len(sorted_values))]
+                skiplist.remove(value)
+                sorted_values.remove(value)
+            else:
+                value = int(random_state.randint(-100, 500))
+                skiplist.insert(value)
+                sorted_values.append(value)
+                sorted_values.sort()
+            if step % 250 == 0:
+                self.assertEqual([skiplist[rank] for rank in xrange(len(skiplist))], sorted_values, 'Wrong ranks')
+                self.assertEqual(skiplist.GetMedian(), np.median(sorted_values), 'Wrong median')
+        self.assertEqual(list(pickle.loads(pickle.dumps(skiplist, 2))), sorted_values, 'Wrong values after pickling')
+        with self.assertRaises(KeyError):
+            skiplist.remove(1000)
+        with self.assertRaises(IndexError):
+            skiplist[len(skiplist)]
+
+
+class TestZipStreamingWindow(unittest.TestCase):
+    """
+        Check ZipStreamingWindow class.
+
+    """
+
+    def test_ZipStreamingWindow_contributions(self):
+        """
+        Compare the median, total and number of the window of the last contributions with numpy over the values of
+        the window.
+
+        :return:
+        """
+
+        print('Testing ZipStreamingWindow contributions')
+
+        random_integers_list = np.random.randint(-100, 1000, 2000).tolist()
+        for window_size in [1, 2, 7]:
+            zip_streaming = helpers.ZipStreamingWindow(window_size=window_size)
+            for index, value in enumerate(random_integers_list):
+                window = random_integers_list[max(0, index + 1 - window_size):index + 1]
+                self.assertEqual(zip_streaming.ingest(value), (np.median(window), sum(window), len(window)),
+                                 'Wrong values of the window of {} contributions'.format(window_size))
+
+    def test_ZipStreamingWindow_days(self):
+        """
+        Compare the median, total and number of the window of the last days with numpy over the values of the window,
+        for dates out of order, and check the window arguments.
+
+        :return:
+        """
+
+        print('Testing ZipStreamingWindow days')
+
+        zip_streaming = helpers.ZipStreamingWindow(window_days=20)
+        first_day = datetime.date(2016, 12, 20)
+        contributions = []
+        for index in xrange(2000):
+            day = first_day + datetime.timedelta(days=index // 10 + np.random.randint(-15, 4))
+            value = int(np.random.randint(1, 500))
+            contributions.append((day.toordinal(), value))
+            latest_day = max(ordinal for ordinal, _ in contributions)
+            window = [contribution for ordinal, contribution in contributions if ordinal > latest_day - 20]
+            self.assertEqual(zip_streaming.ingest(value, int(day.strftime('%Y%m%d'))),
+                             (np.median(window), sum(window), len(window)), 'Wrong values of the window of days')
+
+        for window_size, window_days in [(None, None), (5, 10), (0, None), (None, 0)]:
+            with self.assertRaises(ValueError):
+                helpers.ZipStreamingWindow(window_size, window_days)
+
+
+class TestZipStreamingDeletable(unittest.TestCase):
+    """
+        Check ZipStreamingDeletable and ZipStreamingDeletableStore classes.
+
+    """
+
+    def test_ZipStreamingDeletable(self):
+        """
+        Ingest and remove random contributions with repeats and compare the median, total and number with numpy over
+        the contributions left, in an instance and in a store.
+
+        :return:
+        """
+
+        print('Testing ZipStreamingDeletable')
+
+        random_state = np.random.RandomState(1)
+        zip_streaming = helpers.ZipStreamingDeletable()
+        store = helpers.ZipStreamingDeletableStore()
+        group = store.NewGroup()
+        values = []
+        for _ in xrange(3000):
+            if values and random_state.rand() < 0.45:
+                value = values.pop(random_state.randint(len(values)))
+                result = zip_streaming.remove(value)
+                self.assertEqual(store.remove(group, value), result, 'The store and instance do not agree')
+            else:
+                value = int(random_state.choice([10, 25, 50, 100, 250, 500]))
+                values.append(value)
+                result = zip_streaming.ingest(value)
+                self.assertEqual(store.ingest(group, value), result, 'The store and instance do not agree')
+            expected = (np.median(values), sum(values), len(values)) if values else (0, 0, 0)
+            self.assertEqual(result, expected, 'Wrong values after ingesting or removing a contribution')
+
+        for value in list(values):
+            zip_streaming.remove(value)
+        self.assertEqual((zip_streaming.median_current, zip_streaming.GetTotal(), zip_streaming.GetCount()),
+                         (0, 0, 0), 'Wrong values once every contribution is removed')
+        with self.assertRaises(KeyError):
+            zip_streaming.remove(10)
+        self.assertIsNone(store.remove(group, 1000), 'The group has no such contribution')
+
+
+class TestZipStreamingStore(unittest.TestCase):
+    """
+        Check ZipStreamingStore and ZipStreamingObjectStore classes.
+
+    """
+
+    def test_ZipStreamingStore_ingest(self):
+        """
+        Check that the median, total and count values of interleaved groups in a ZipStreamingStore are the same as the
+        ones of one ZipStreaming instance per group, including groups whose slabs grow and get reused.
+
+        :return: Nothing
+        """
+
+        print('Testing ZipStreamingStore ingest method')
+
+        NUMBER_VALUES = 3000
+        NUMBER_GROUPS = 20
+        random_integers_list = np.random.choice([10, 25, 50, 100, 250, 500, 1000, 2700], NUMBER_VALUES)
+        random_integers_list[:500] = np.random.randint(0, 1000, 500)
+        random_groups_list = np.random.randint(0, NUMBER_GROUPS, NUMBER_VALUES)
+
+        store = helpers.ZipStreamingStore()
+        groups = [store.NewGroup() for _ in xrange(NUMBER_GROUPS)]
+        zip_streaming_list = [helpers.ZipStreaming() for _ in xrange(NUMBER_GROUPS)]
+        for i in xrange(NUMBER_VALUES):
+            group = random_groups_list[i]
+            self.assertEqual(store.ingest(groups[group], int(random_integers_list[i])),
+                             zip_streaming_list[group].ingest(int(random_integers_list[i])),
+                             'The median, total or count values are not equal')
+
+        self.assertEqual(len(store), NUMBER_GROUPS, 'Wrong number of groups')
+        for group in xrange(NUMBER_GROUPS):
+            self.assertEqual(store.GetCount(group), zip_streaming_list[group].GetCount(), 'Wrong count')
+            self.assertEqual(store.GetTotal(group), zip_streaming_list[group].GetTotal(), 'Wrong total')
+            self.assertEqual(store.GetMedian(group), zip_streaming_list[group].median_current, 'Wrong median')
+        self.assertTrue(len(store.free_slabs) > 0, 'Slabs were not freed when growing')
+
+    def test_ZipStreamingStoreFactory(self):
+        """
+        Check that the stores of every median mode give the same results as their ZipStreaming classes.
+
+        :return: Nothing
+        """
+
+        print('Testing ZipStreamingStoreFactory')
+
+        random_integers_list = np.random.randint(1, 1000, 100)
+        for median_mode in ['exact', 'heap', 'approx', 'window', 'deletable']:
+            store = helpers.ZipStreamingStoreFactory(median_mode, window_size=10)()
+            group = store.NewGroup()
+            zip_streaming = helpers.ZipStreamingFactory(median_mode, window_size=10)()
+            for value in random_integers_list:
+                self.assertEqual(store.ingest(group, int(value)), zip_streaming.ingest(int(value)),
+                                 'The {} store and instance do not agree'.format(median_mode))
+
+
+class TestDateAccumulators(unittest.TestCase):
+    """
+        Check the DateAccumulatorList, DateAccumulatorArray and DateAccumulatorFrequency classes.
+
+    """
+
+    def test_DateAccumulators_GetTransactionValues(self):
+        """
+        Check that all the date accumulators give the same median, total and count as CalculateTransactionValues,
+        for both odd and even numbers of values.
+
+        :return: Nothing
+        """
+
+        print('Testing date accumulators')
+
+        for number_values in [1, 2, 7, 100, 1001]:
+            random_integers_list = list(np.random.choice([10, 25, 50, 100, 250, 500, 1000], number_values))
+            expected_values = helpers.CalculateTransactionValues(random_integers_list)
+
+            for date_mode in ['list', 'array', 'frequency']:
+                accumulator = helpers.DateAccumulatorFactory(date_mode)()
+                for value in random_integers_list:
+                    accumulator.ingest(int(value))
+                self.assertEqual(accumulator.GetTransactionValues(), expected_values,
+                                 'Wrong values from the {} date accumulator'.format(date_mode))
+
+    def test_DateAccumulators_GetValues(self):
+        """
+        Check that all the date accumulators give back the values they were given.
+
+        :return: Nothing
+        """
+
+        print('Testing date accumulators GetValues')
+
+        random_integers_list = [int(value) for value in np.random.choice([10, 25, 50, 100, 250, 500, 1000], 100)]
+        for date_mode in ['list', 'array', 'frequency']:
+            accumulator = helpers.DateAccumulatorFactory(date_mode)()
+            for value in random_integers_list:
+                accumulator.ingest(value)
+            self.assertEqual(sorted(accumulator.GetValues()), sorted(random_integers_list),
+                             'Wrong values from the {} date accumulator'.format(date_mode))
+
+    def test_DateAccumulators_remove(self):
+        """
+        Check that all the date accumulators remove the values they were given, once per time they were given, and
+        give the values of an empty group once every value is removed.
+
+        :return: Nothing
+        """
+
+        print('Testing date accumulators remove')
+
+        random_integers_list = [int(value) for value in np.random.choice([10, 25, 50, 100, 250, 500, 1000], 100)]
+        for date_mode in ['list', 'array', 'frequency']:
+            accumulator = helpers.DateAccumulatorFactory(date_mode)()
+            for value in random_integers_list:
+                accumulator.ingest(value)
+            for value in random_integers_list[:50]:
+                self.assertTrue(accumulator.remove(value), 'The {} date accumulator has the value'.format(date_mode))
+            self.assertFalse(accumulator.remove(7), 'The {} date accumulator was not given 7'.format(date_mode))
+            self.assertEqual(accumulator.GetTransactionValues(),
+                             helpers.CalculateTransactionValues(random_integers_list[50:]),
+                             'Wrong values from the {} date accumulator'.format(date_mode))
+            for value in random_integers_list[50:]:
+                accumulator.remove(value)
+            self.assertFalse(accumulator.remove(random_integers_list[0]),
+                             'The {} date accumulator has no values left'.format(date_mode))
+            self.assertEqual(accumulator.GetTransactionValues(), (0, 0, 0),
+                             'Wrong values from the empty {} date accumulator'.format(date_mode))
+
+    def test_CalculateSegmentTransactionValues(self):
+        """
+        Check that the medians, totals and counts of many groups at once are the same as the ones of
+        CalculateTransactionValues for each group, for both odd and even numbers of values.
+
+        :return: Nothing
+        """
+
+        print('Testing CalculateSegmentTransactionValues')
+
+        lengths = list(np.random.randint(1, 10, 1000)) + [1, 2, 1001]
+        values_list = [list(np.random.randint(-100, 3000, length)) for length in lengths]
+        medians, totals, counts = helpers.CalculateSegmentTransactionValues(
+            np.concatenate(values_list), lengths)
+        for values, median, total, count in zip(values_list, medians, totals, counts):
+            self.assertEqual((median, total, count), helpers.CalculateTransactionValues(values),
+                             'Wrong values of a group')
+
+        # the groups whose values were all retracted
+        lengths = [0, 3, 0, 0, 2, 0]
+        values_list = [[], [5, 1, 3], [], [], [8, 2], []]
+        medians, totals, counts = helpers.CalculateSegmentTransactionValues(
+            np.array([5, 1, 3, 8, 2]), lengths)
+        for values, median, total, count in zip(values_list, medians, totals, counts):
+            self.assertEqual((median, total, count), helpers.CalculateTransactionValues(values),
+                             'Wrong values of a group with or without values')
+
+    def test_DateAccumulatorFactory_unknown_mode(self):
+        """
+        Check that an unknown mode is rejected.
+
+        :return: Nothing
+        """
+        self.assertRaises(ValueError, helpers.DateAccumulatorFactory, 'tree')
+
+
+class TestKeyInterner(unittest.TestCase):
+    """
+        Check KeyInterner class and the PackKey, UnpackKey and FormatTransactionDate functions.
+
+    """
+
+    def test_KeyInterner(self):
+        """
+        Check that the strings get consecutive integers in order of first appearance and that rejected strings are -1.
+
+        :return: Nothing
+        """
+
+        print('Testing KeyInterner')
+
+        interner = helpers.KeyInterner()
+        codes = [interner.Intern(key) for key in ['C00629618', 'C00177436', 'C00629618', 'C00384818']]
+        self.assertEqual(codes, [0, 1, 0, 2], 'Wrong integers')
+        self.assertEqual(interner.keys, ['C00629618', 'C00177436', 'C00384818'], 'Wrong strings')
+        self.assertEqual(interner.Reject(malformed_zip), -1, 'Rejected string is not -1')
+        self.assertEqual(interner.codes[malformed_zip], -1, 'Rejected string is not -1')
+        self.assertEqual(len(interner), 3, 'Rejected string was counted')
+
+    def test_PackKey(self):
+        """
+        Check that packed keys unpack to the same integers and sort by id and then by date.
+
+        :return: Nothing
+        """
+
+        print('Testing PackKey and UnpackKey')
+
+        date_keys = [helpers.ParseTransactionDate(good_date) for good_date in good_dates_list]
+        packed_keys = [helpers.PackKey(id_code, date_key) for id_code in [0, 1, 12345] for date_key in date_keys]
+        self.assertEqual([helpers.UnpackKey(key) for key in packed_keys],
+                         [(id_code, date_key) for id_code in [0, 1, 12345] for date_key in date_keys],
+                         'Packed keys did not unpack to the same integers')
+        self.assertEqual([helpers.FormatTransactionDate(date_key) for date_key in date_keys], good_dates_list,
+                         'FormatTransactionDate did not give back the MMDDYYYY strings')
+
+
+class TestRejectionAccounting(unittest.TestCase):
+    """
+        Check RejectionAccounting class.
+
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_RejectionAccounting_counts(self):
+        """
+        Check the reason recorded for each kind of rejected entry and the quarantine file.
+
+        :return: Nothing
+        """
+
+        print('Testing RejectionAccounting')
+
+        quarantine_fullfilename = os.path.join(self.temp_dir, 'quarantine.txt')
+        rejections = helpers.RejectionAccounting(quarantine_fullfilename)
+        rejections.RejectEntry(expected_parsed_values[0])
+        rejections.RejectEntry(('', '90017', '01032017', '40', ''))
+        rejections.RejectEntry(('C00629618', '90017', '01032017', '', ''))
+        rejections.RejectFields(('C00629618', '343', '01032017', '40', ''), True, False)
+        rejections.RejectFields(('C00629618', '2a393', short_date, '40', ''), True, True)
+        rejections.Close()
+
+        self.assertEqual(rejections.counts, {'OTHER_ID': 1, 'CMTE_ID': 1, 'TRANSACTION_AMT': 1, 'ZIP_SHORT': 1,
+                                             'ZIP_NONNUMERIC': 1, 'TRANSACTION_DT': 1}, 'Wrong counts')
+        with open(quarantine_fullfilename, 'rb') as fid:
+            quarantine_lines = fid.read().splitlines()
+        self.assertEqual(len(quarantine_lines), 5, 'Wrong number of quarantined entries')
+        self.assertEqual(quarantine_lines[0], 'OTHER_ID|' + '|'.join(expected_parsed_values[0]), 'Wrong quarantine line')
+        self.assertEqual(quarantine_lines[4], 'ZIP_NONNUMERIC,TRANSACTION_DT|C00629618|2a393|0011|40|',
+                         'Wrong quarantine line')
+
+    def test_RejectionAccounting_no_quarantine(self):
+        """
+        Check that no file is written without a quarantine file name and that Merge adds up the counts.
+
+        :return: Nothing
+        """
+
+        print('Testing RejectionAccounting without quarantine file')
+
+        rejections = helpers.RejectionAccounting()
+        rejections.RejectEntry(expected_parsed_values[0])
+        rejections.Merge(rejections.counts.copy())
+        rejections.Close()
+
+        self.assertEqual(rejections.counts['OTHER_ID'], 2, 'Wrong merged count')
+        self.assertEqual(os.listdir(self.temp_dir), [], 'A file was written')
+
+
+class TestMergeDateLines(unittest.TestCase):
+    """
+        Check MergeDateLines function.
+
+    """
+
+    def test_MergeDateLines(self):
+        """
+        Check that new lines are inserted in order of id and date, replacing the old lines of the same id and date.
+
+        :return: Nothing
+        """
+
+        print('Testing MergeDateLines')
+
+        old_lines = ['C00177436|01312016|384|1|384\n', 'C00177436|01312017|384|1|384\n',
+                     'C00384818|01122017|250|1|250\n']
+        new_date_lines = [('C00177436', 20161231, 'C00177436|12312016|100|1|100\n'),
+                          ('C00177436', 20170131, 'C00177436|01312017|392|2|784\n'),
+                          ('C00384818', 20170112, 'C00384818|01122017|125|2|250\n'),
+                          ('C00629618', 20170104, 'C00629618|01042017|40|1|40\n')]
+        self.assertEqual(list(helpers.MergeDateLines(old_lines, new_date_lines)),
+                         ['C00177436|01312016|384|1|384\n', 'C00177436|12312016|100|1|100\n',
+                          'C00177436|01312017|392|2|784\n', 'C00384818|01122017|125|2|250\n',
+                          'C00629618|01042017|40|1|40\n'], 'Wrong merged lines')
+
+        self.assertEqual(list(helpers.MergeDateLines(old_lines, [])), old_lines, 'Wrong lines without new lines')
+        self.assertEqual(list(helpers.MergeDateLines([], new_date_lines)), [line for _, _, line in new_date_lines],
+                         'Wrong lines without old lines')
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""
+Unit tests for the columnar cache of the input of input_cache.py.  The unittest of the Python Standard Library is
+used.  The user is expected to run run_unit_tests.sh at the base of the repository in order to run these tests.
+
+The input and expected output of the insight_testsuite test_1 are used.
+
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import helpers, input_cache, readers
+import find_political_donors_delta
+from aggregator import ContributionAggregator
+
+test_folder = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'insight_testsuite', 'tests', 'test_1')
+input_fullfilename = os.path.join(test_folder, 'input', 'itcont.txt')
+with open(os.path.join(test_folder, 'output', 'medianvals_by_zip.txt'), 'rb') as fid:
+    expected_zip_lines = fid.read().splitlines(True)
+with open(os.path.join(test_folder, 'output', 'medianvals_by_date.txt'), 'rb') as fid:
+    expected_date_lines = fid.read().splitlines(True)
+
+
+class TestInputCache(unittest.TestCase):
+    """
+        Check BuildCache, LoadCache and CachedBlockReader, and ContributionAggregator.ProcessColumnBlocks.
+
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache_directory = os.path.join(self.folder, 'cache')
+        self.input_fullfilename = os.path.join(self.folder, 'itcont.txt')
+        shutil.copy(input_fullfilename, self.input_fullfilename)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_BuildCache(self):
+        """
+        Check the columns of the cache, that it is found again, and that a changed input gets a new cache which
+        replaces the old one.
+
+        :return:
+        """
+
+        print('Testing BuildCache')
+
+        self.assertIsNone(input_cache.LoadCache(self.cache_directory, self.input_fullfilename), 'There is no cache')
+        cache = input_cache.BuildCache(self.input_fullfilename, self.cache_directory)
+        self.assertEqual((cache.number_records, cache.input_bytes), (7, os.path.getsize(input_fullfilename)),
+                         'Wrong number of records or bytes')
+        self.assertEqual(cache.id_keys, ['C00177436', 'C00384818'], 'Wrong ids')
+        self.assertEqual(cache.zip_keys, ['30004', '02895', '30750', '04105'], 'Wrong zip codes')
+        id_codes, zip_codes, date_keys, amounts, flags = cache.columns
+        # the first entry has an OTHER_ID
+        self.assertEqual(flags.tolist(), [0] + [helpers.FLAG_ENTRY | helpers.FLAG_ZIP | helpers.FLAG_DATE] * 6,
+                         'Wrong flags')
+        self.assertEqual(date_keys.tolist()[:2], [-1, 20170131], 'Wrong dates')
+        self.assertEqual(amounts.tolist(), [0, 384, 250, 230, 384, 333, 384], 'Wrong amounts')
+        self.assertEqual(input_cache.LoadCache(self.cache_directory, self.input_fullfilename).folder, cache.folder,
+                         'The cache was not found')
+
+        with open(self.input_fullfilename, 'ab') as fid:
+            fid.write(open(input_fullfilename, 'rb').readlines()[1])
+        self.assertIsNone(input_cache.LoadCache(self.cache_directory, self.input_fullfilename),
+                          'The cache of the old input was used')
+        new_cache = input_cache.BuildCache(self.input_fullfilename, self.cache_directory)
+        self.assertEqual(new_cache.number_records, 8, 'Wrong number of records')
+        self.assertEqual(os.listdir(self.cache_directory), [os.path.basename(new_cache.folder)],
+                         'The cache of the old input was not removed')
+
+    def test_BuildCache_blocks(self):
+        """
+        Check that the columns written a block at a time are those of the blocks of the text, with their types, that
+        no raw file is left behind, and that an empty input gives empty columns.
+
+        :return:
+        """
+
+        print('Testing BuildCache blocks')
+
+        cache = input_cache.BuildCache(self.input_fullfilename, self.cache_directory, block_size=200)
+        blocks = list(readers.ValidatedBlockReader(readers.MappedBlockReader(self.input_fullfilename, block_size=200)))
+        self.assertGreater(len(blocks), 2, 'There should be several blocks')
+        for column_index, (column, (name, dtype)) in enumerate(zip(cache.columns, input_cache.COLUMNS)):
+            self.assertEqual(column.dtype, np.dtype(dtype), 'Wrong type of ' + name)
+            self.assertEqual(column.tolist(), [value for block in blocks for value in block[column_index].tolist()],
+                             'Wrong ' + name)
+        self.assertFalse([name for name in os.listdir(cache.folder) if name.endswith('.raw')],
+                         'A raw file was left behind')
+
+        open(self.input_fullfilename, 'wb').close()
+        cache = input_cache.BuildCache(self.input_fullfilename, self.cache_directory)
+        self.assertEqual(cache.number_records, 0, 'Wrong number of records')
+        self.assertEqual([len(column) for column in cache.columns], [0] * len(input_cache.COLUMNS),
+                         'The columns should be empty')
+
+    def test_ProcessColumnBlocks(self):
+        """
+        Check that the aggregation of the cache gives the same lines and counts as the aggregation of the text, and
+        that the blocks and offsets are those of the text, also when starting from an offset.
+
+        :return:
+        """
+
+        print('Testing ProcessColumnBlocks')
+
+        cache = input_cache.BuildCache(self.input_fullfilename, self.cache_directory, block_size=200)
+        text_reader = readers.MappedBlockReader(self.input_fullfilename, block_size=200)
+        text_offsets = [text_reader.offset for _ in text_reader]
+        self.assertGreater(len(text_offsets), 2, 'There should be several blocks')
+
+        aggregator = ContributionAggregator()
+        reader = input_cache.CachedBlockReader(cache)
+        zip_lines = []
+        offsets = []
+        for block_zip_lines in aggregator.ProcessColumnBlocks(reader, cache.id_keys, cache.zip_keys):
+            zip_lines.extend(block_zip_lines)
+            offsets.append(reader.offset)
+        self.assertEqual(zip_lines, expected_zip_lines, 'Wrong zip file lines')
+        self.assertEqual([lineOut for _, _, lineOut in aggregator.IterateDateLines()], expected_date_lines,
+                         'Wrong date file lines')
+        self.assertEqual((aggregator.line_number, aggregator.skipped_zip, aggregator.skipped_date), (7, 1, 1),
+                         'Wrong counts')
+        self.assertEqual(offsets, text_offsets, 'Wrong offsets')
+
+        # the lines after the first block, as when resuming from a checkpoint
+        results = []
+        start_offset = text_offsets[0]
+        for reader in [input_cache.CachedBlockReader(cache, start_offset=start_offset),
+                       readers.MappedBlockReader(self.input_fullfilename, block_size=200, start_offset=start_offset)]:
+            aggregator = ContributionAggregator()
+            if isinstance(reader, input_cache.CachedBlockReader):
+                zip_line_blocks = aggregator.ProcessColumnBlocks(reader, cache.id_keys, cache.zip_keys)
+            else:
+                zip_line_blocks = aggregator.ProcessBlocks(reader)
+            results.append(([lineOut for block_zip_lines in zip_line_blocks for lineOut in block_zip_lines],
+                            reader.line_number, reader.offset))
+        self.assertEqual(results[0], results[1], 'Wrong lines after the first block')
+        with self.assertRaises(ValueError):
+            list(input_cache.CachedBlockReader(cache, start_offset=start_offset + 1))
+
+    def test_main(self):
+        """
+        Check that find_political_donors_delta.py gives the expected output with the cache, when it builds it and when
+        it reads it.
+
+        :return:
+        """
+
+        print('Testing input cache main')
+
+        zip_fullfilename = os.path.join(self.folder, 'medianvals_by_zip.txt')
+        date_fullfilename = os.path.join(self.folder, 'medianvals_by_date.txt')
+        stdout = sys.stdout
+        try:
+            sys.stdout = open(os.devnull, 'w')
+            for _ in xrange(2):
+                find_political_donors_delta.main(self.input_fullfilename, zip_fullfilename, date_fullfilename,
+                                                 cache_directory=self.cache_directory)
+                with open(zip_fullfilename, 'rb') as fid:
+                    self.assertEqual(fid.read().splitlines(True), expected_zip_lines, 'Wrong zip file')
+                with open(date_fullfilename, 'rb') as fid:
+                    self.assertEqual(fid.read().splitlines(True), expected_date_lines, 'Wrong date file')
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        self.assertEqual(len(os.listdir(self.cache_directory)), 1, 'There should be one cache')
+        with self.assertRaises(ValueError):
+            find_political_donors_delta.main(self.input_fullfilename, zip_fullfilename, date_fullfilename,
+                                             rejections=True, cache_directory=self.cache_directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""
+Unit tests for the export of the progress of metrics.py.  The unittest of the Python Standard Library is used.
+The user is expected to run run_unit_tests.sh at the base of the repository in order to run these tests.
+
+The input of the insight_testsuite test_1 is used.
+
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import find_political_donors_delta, metrics, readers
+from aggregator import ContributionAggregator
+from parallel import ShardedAggregator
+
+test_folder = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'insight_testsuite', 'tests', 'test_1')
+input_fullfilename = os.path.join(test_folder, 'input', 'itcont.txt')
+
+
+class TestMetricsExporter(unittest.TestCase):
+    """
+        Check MetricsExporter class.
+
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.metrics_fullfilename = os.path.join(self.folder, 'metrics')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def RunExporter(self, aggregator, metrics_format):
+        """
+        Exports a snapshot after every block of the test input and at the end.
+
+        :param aggregator: ContributionAggregator or ShardedAggregator
+        :param metrics_format: 'prometheus' or 'jsonl' [string]
+        :return: list of the snapshots [list]
+        """
+        exporter = metrics.MetricsExporter(self.metrics_fullfilename, metrics_format, 0,
+                                           os.path.getsize(input_fullfilename))
+        reader = readers.MappedBlockReader(input_fullfilename, block_size=500)
+        snapshots = []
+        for _ in aggregator.ProcessBlocks(reader):
+            self.assertTrue(exporter.Due(), 'A snapshot should be due')
+            snapshots.append(exporter.Export(aggregator, reader.offset))
+        snapshots.append(exporter.Export(aggregator, reader.offset))
+        for number_date_lines, _ in enumerate(aggregator.IterateDateLines(), 1):
+            snapshots.append(exporter.Export(aggregator, reader.offset, date_lines=number_date_lines))
+        snapshots.append(exporter.Export(aggregator, reader.offset, done=True, date_lines=number_date_lines))
+        return snapshots
+
+    def test_MetricsExporter_prometheus(self):
+        """
+        Check that the file has the latest snapshot in the Prometheus text format and that the counts are right.
+
+        :return:
+        """
+
+        print('Testing MetricsExporter prometheus')
+
+        snapshots = self.RunExporter(ContributionAggregator(), 'prometheus')
+        self.assertEqual(os.listdir(self.folder), ['metrics'], 'The temporary file was left behind')
+        with open(self.metrics_fullfilename, 'rb') as fid:
+            values = dict(line.rsplit(' ', 1) for line in fid.read().splitlines() if not line.startswith('#'))
+        prefix = metrics.METRIC_PREFIX
+        self.assertEqual(values[prefix + 'lines_total'], '7', 'Wrong number of lines')
+        self.assertEqual(values[prefix + 'bytes_total'], str(os.path.getsize(input_fullfilename)),
+                         'Wrong number of bytes')
+        self.assertEqual(values[prefix + 'rejected_total{file="zip"}'], '1', 'Wrong number of rejected entries')
+        self.assertEqual(values[prefix + 'accepted_total{file="date"}'], '6', 'Wrong number of accepted entries')
+        self.assertEqual(values[prefix + 'done'], '1', 'The run should be done')
+        self.assertGreater(int(values[prefix + 'resident_memory_bytes']), 0, 'Wrong resident memory')
+        self.assertGreater(len(snapshots), 2, 'There should be several blocks')
+        self.assertTrue(all(snapshot['eta_seconds'] is None or snapshot['eta_seconds'] >= 0
+                            for snapshot in snapshots), 'Wrong estimated time remaining')
+
+    def test_MetricsExporter_jsonl(self):
+        """
+        Check that every snapshot is appended to the file, with the same counts for the sharded aggregator, and that
+        a new exporter starts with an empty file.
+
+        :return:
+        """
+
+        print('Testing MetricsExporter jsonl')
+
+        for aggregator in [ContributionAggregator(),
+                           ShardedAggregator(2, ContributionAggregator().zip_store_factory,
+                                             ContributionAggregator().date_accumulator_class)]:
+            snapshots = self.RunExporter(aggregator, 'jsonl')
+            with open(self.metrics_fullfilename, 'rb') as fid:
+                lines = fid.read().splitlines()
+            self.assertEqual([json.loads(line) for line in lines], snapshots, 'Wrong JSON lines')
+            self.assertEqual((snapshots[-1]['lines'], snapshots[-1]['accepted_zip'], snapshots[-1]['rejected_date']),
+                             (7, 6, 1), 'Wrong counts')
+            self.assertEqual(snapshots[-1]['bytes'], os.path.getsize(input_fullfilename), 'Wrong number of bytes')
+
+    def test_MetricsExporter_date_file(self):
+        """
+        Check that the snapshots taken while the date file is written and at the end count the date file lines and
+        keep the rates of the last snapshot for which input lines were processed, in a run of
+        find_political_donors_delta.py with a snapshot after every block and every date file line.
+
+        :return:
+        """
+
+        print('Testing MetricsExporter date file')
+
+        date_lines_check = metrics.DATE_LINES_CHECK
+        metrics.DATE_LINES_CHECK = 1
+        stdout = sys.stdout
+        try:
+            sys.stdout = open(os.devnull, 'w')
+            find_political_donors_delta.main(input_fullfilename, os.path.join(self.folder, 'medianvals_by_zip.txt'),
+                                             os.path.join(self.folder, 'medianvals_by_date.txt'),
+                                             metrics_fullfilename=self.metrics_fullfilename, metrics_format='jsonl',
+                                             metrics_seconds=0.0)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+            metrics.DATE_LINES_CHECK = date_lines_check
+
+        with open(self.metrics_fullfilename, 'rb') as fid:
+            snapshots = [json.loads(line) for line in fid]
+        with open(os.path.join(self.folder, 'medianvals_by_date.txt'), 'rb') as fid:
+            number_date_lines = len(fid.readlines())
+        input_snapshots = [snapshot for snapshot in snapshots if snapshot['date_lines'] is None]
+        date_snapshots = [snapshot for snapshot in snapshots if snapshot['date_lines'] is not None]
+        self.assertEqual([snapshot['date_lines'] for snapshot in date_snapshots],
+                         range(1, number_date_lines + 1) + [number_date_lines], 'Wrong numbers of date file lines')
+        self.assertEqual(snapshots[-1]['done'], 1, 'The last snapshot should be done')
+        self.assertGreater(input_snapshots[0]['lines_per_second'], 0, 'Wrong rate')
+        for snapshot in date_snapshots:
+            self.assertEqual((snapshot['lines_per_second'], snapshot['bytes_per_second'], snapshot['eta_seconds']),
+                             (input_snapshots[0]['lines_per_second'], input_snapshots[0]['bytes_per_second'], 0.0),
+                             'The rates of the input should be kept')
+
+    def test_FormatPrometheus(self):
+        """
+        Check that the metrics without a value are left out.
+
+        :return:
+        """
+
+        print('Testing FormatPrometheus')
+
+        snapshot = dict((key, 1) for _, _, _, key in metrics.PROMETHEUS_METRICS)
+        snapshot['eta_seconds'] = None
+        snapshot['bytes_per_second'] = 2.5
+        text = metrics.FormatPrometheus(snapshot)
+        self.assertNotIn('\n' + metrics.METRIC_PREFIX + 'eta_seconds ', text, 'The metric without a value is there')
+        self.assertIn(metrics.METRIC_PREFIX + 'bytes_per_second 2.5\n', text, 'Wrong value')
+        self.assertIn('# TYPE {}groups gauge\n'.format(metrics.METRIC_PREFIX), text, 'Wrong type')
+
+
+if __name__ == '__main__':
+    unittest.main()
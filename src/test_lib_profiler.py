@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Unit tests for the per-stage profiling of profiler.py.  The unittest of the Python Standard Library is used.
+The user is expected to run run_unit_tests.sh at the base of the repository in order to run these tests.
+
+The input and expected output of the insight_testsuite test_1 are used.
+
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import profiler, readers
+from aggregator import ContributionAggregator
+
+test_folder = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'insight_testsuite', 'tests', 'test_1')
+input_fullfilename = os.path.join(test_folder, 'input', 'itcont.txt')
+with open(os.path.join(test_folder, 'output', 'medianvals_by_zip.txt'), 'rb') as fid:
+    expected_zip_lines = fid.read().splitlines(True)
+with open(os.path.join(test_folder, 'output', 'medianvals_by_date.txt'), 'rb') as fid:
+    expected_date_lines = fid.read().splitlines(True)
+
+
+class TestStageProfiler(unittest.TestCase):
+    """
+        Check StageProfiler class.
+
+    """
+
+    def test_GetResults(self):
+        """
+        Check that the time of the aggregation is shared out between its stages in the proportions of the sampled
+        records and that the report and the JSON file have every stage.
+
+        :return:
+        """
+
+        print('Testing StageProfiler GetResults')
+
+        stage_profiler = profiler.StageProfiler()
+        stage_profiler.Add('read', 1.0)
+        stage_profiler.Add('format_write', 0.5)
+        stage_profiler.Add('aggregate', 8.0)
+        stage_profiler.record_seconds.update({'validate': 0.1, 'zip_ingest': 0.2, 'format_write': 0.05,
+                                              'date_accumulate': 0.05})
+        stage_profiler.counts['records'] = 1000
+        stage_profiler.Stop()
+
+        stage_seconds = stage_profiler.GetStageSeconds()
+        for stage, seconds in [('read', 1.0), ('parse', 0.0), ('validate', 2.0), ('zip_ingest', 4.0),
+                               ('format_write', 1.5), ('date_accumulate', 1.0), ('date_write', 0.0)]:
+            self.assertAlmostEqual(stage_seconds[stage], seconds, msg='Wrong time of ' + stage)
+
+        results = stage_profiler.GetResults()
+        self.assertEqual(sorted(results['stages']), sorted(profiler.STAGES + ('other',)), 'Wrong stages')
+        report = stage_profiler.GetReport()
+        for stage in profiler.STAGES:
+            self.assertIn(stage, report, 'Missing stage in the report')
+
+        folder = tempfile.mkdtemp()
+        try:
+            results_fullfilename = os.path.join(folder, 'profile.json')
+            stage_profiler.WriteResults(results_fullfilename)
+            with open(results_fullfilename, 'rb') as fid:
+                self.assertEqual(json.load(fid)['counts']['records'], 1000, 'Wrong JSON file')
+        finally:
+            shutil.rmtree(folder)
+
+    def test_profiled_run(self):
+        """
+        Check that profiling does not change the output, for every reader and several sample intervals, and that the
+        lines, sampled lines and bytes are counted.
+
+        :return:
+        """
+
+        print('Testing StageProfiler profiled run')
+
+        for reader_mode in ['mmap', 'lines']:
+            for sample_interval in [1, 3, 64]:
+                stage_profiler = profiler.StageProfiler(sample_interval)
+                aggregator = ContributionAggregator()
+                reader = readers.ReaderFactory(reader_mode)(input_fullfilename, block_size=100,
+                                                            profiler=stage_profiler)
+                zip_lines = [lineOut for block_zip_lines in aggregator.ProcessBlocks(reader, stage_profiler)
+                             for lineOut in block_zip_lines]
+                self.assertEqual(zip_lines, expected_zip_lines, 'Wrong zip file lines')
+                self.assertEqual([lineOut for _, _, lineOut in aggregator.IterateDateLines()], expected_date_lines,
+                                 'Wrong date file lines')
+
+                self.assertEqual(stage_profiler.counts['records'], aggregator.line_number, 'Wrong number of lines')
+                self.assertEqual(stage_profiler.counts['zip_lines'], len(expected_zip_lines),
+                                 'Wrong number of zip file lines')
+                self.assertEqual(stage_profiler.counts['input_bytes'], os.path.getsize(input_fullfilename),
+                                 'Wrong number of bytes')
+                self.assertGreater(stage_profiler.counts['blocks'], 0, 'No block was counted')
+                if sample_interval == 1:
+                    self.assertEqual(stage_profiler.counts['sampled_records'], aggregator.line_number,
+                                     'Every line should be sampled')
+                self.assertGreater(stage_profiler.counts['sampled_records'], 0, 'No line was sampled')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+Unit tests for the query server of query_server.py.  The unittest of the Python Standard Library is used.
+The user is expected to run run_unit_tests.sh at the base of the repository in order to run these tests.
+
+The input and expected output of the insight_testsuite test_1 are used.
+
+"""
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import query_server, readers
+from aggregator import ContributionAggregator
+
+test_folder = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'insight_testsuite', 'tests', 'test_1')
+input_fullfilename = os.path.join(test_folder, 'input', 'itcont.txt')
+with open(os.path.join(test_folder, 'output', 'medianvals_by_zip.txt'), 'rb') as fid:
+    expected_zip_lines = fid.read().splitlines()
+with open(os.path.join(test_folder, 'output', 'medianvals_by_date.txt'), 'rb') as fid:
+    expected_date_lines = fid.read().splitlines()
+
+
+def ZipLine(result):
+    return '{id}|{zip}|{median}|{count}|{total}'.format(**result)
+
+
+def DateLine(result):
+    return '{id}|{date}|{median}|{count}|{total}'.format(**result)
+
+
+class TestAggregateIndex(unittest.TestCase):
+    """
+        Check AggregateIndex class.
+
+    """
+
+    def test_queries(self):
+        """
+        Check that the index has the groups created before and after it, and that the queries give the last line of
+        the zip file of each recipient and zip code and the lines of the date file.
+
+        :return:
+        """
+
+        print('Testing AggregateIndex queries')
+
+        aggregator = ContributionAggregator()
+        blocks = aggregator.ProcessBlocks(readers.MappedBlockReader(input_fullfilename, block_size=200))
+        next(blocks)
+        index = query_server.AggregateIndex(aggregator)
+        for _ in blocks:
+            index.Update()
+        self.assertEqual((aggregator.new_zip_keys, aggregator.new_date_keys), ([], []), 'The new keys were not used')
+
+        # the last line of each recipient and zip code has the current values
+        last_zip_lines = dict((tuple(line.split('|')[:2]), line) for line in expected_zip_lines)
+        for (id, zipcode), line in last_zip_lines.iteritems():
+            self.assertEqual(ZipLine(index.GetZip(id, zipcode + '1234')), line, 'Wrong zip values')
+        self.assertEqual([ZipLine(result) for result in index.GetZips('C00177436')],
+                         sorted(line for (id, _), line in last_zip_lines.iteritems() if id == 'C00177436'),
+                         'Wrong zip codes of the recipient')
+        self.assertIsNone(index.GetZip('C00177436', '02895'), 'The recipient has no contribution from the zip code')
+        self.assertIsNone(index.GetZips('C99999999'), 'Unknown recipient')
+
+        self.assertEqual([DateLine(result) for result in index.GetDates('C00177436')],
+                         [line for line in expected_date_lines if line.startswith('C00177436|')], 'Wrong dates')
+        self.assertEqual([DateLine(result) for result in index.GetDates('C00177436', 20170101, 20170131)],
+                         ['C00177436|01312017|384|4|1382'], 'Wrong range of dates')
+        self.assertEqual(index.GetDates('C00177436', 20170201), [], 'There are no dates in the range')
+        self.assertEqual(index.GetStatus(), {'lines': 7, 'groups_zip': 4, 'groups_date': 2}, 'Wrong status')
+
+
+class TestQueryServer(unittest.TestCase):
+    """
+        Check QueryServer class.
+
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.socket_fullfilename = os.path.join(self.folder, 'query.sock')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def Get(self, path):
+        """
+        Sends a GET request over the Unix socket.
+
+        :param path: the path and query [string]
+        :return: tuple of the status code and the JSON body [tuple]
+        """
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(self.socket_fullfilename)
+        client.sendall('GET {} HTTP/1.0\r\n\r\n'.format(path))
+        response = ''
+        data = client.recv(4096)
+        while data:
+            response += data
+            data = client.recv(4096)
+        client.close()
+        head, body = response.split('\r\n\r\n', 1)
+        return int(head.split()[1]), json.loads(body)
+
+    def test_QueryServer(self):
+        """
+        Check the answers of the server during and after the run, the errors, and that the socket is removed.
+
+        :return:
+        """
+
+        print('Testing QueryServer')
+
+        aggregator = ContributionAggregator()
+        server = query_server.QueryServer(query_server.streaming.UNIX_PREFIX + self.socket_fullfilename, aggregator)
+        server.Start()
+        try:
+            reader = readers.MappedBlockReader(input_fullfilename, block_size=200)
+            for _ in aggregator.ProcessBlocks(server.LockBlocks(reader)):
+                # the lock is held until the next block is requested
+                self.assertTrue(server.lock.locked(), 'The lock is not held during the block')
+            self.assertEqual(self.Get('/status'), (200, {'lines': 7, 'groups_zip': 4, 'groups_date': 2,
+                                                         'done': False}), 'Wrong status')
+            server.done = True
+
+            status, result = self.Get('/zip?id=C00384818&zip=02895')
+            self.assertEqual((status, ZipLine(result)), (200, 'C00384818|02895|292|2|583'), 'Wrong zip values')
+            status, result = self.Get('/zips?id=C00177436')
+            self.assertEqual((status, len(result['zips'])), (200, 3), 'Wrong zip codes')
+            status, result = self.Get('/dates?id=C00177436&start=01312017&end=01312017')
+            self.assertEqual((status, [DateLine(date_result) for date_result in result['dates']]),
+                             (200, ['C00177436|01312017|384|4|1382']), 'Wrong dates')
+            self.assertTrue(self.Get('/status')[1]['done'], 'The run should be done')
+
+            self.assertEqual(self.Get('/zip?id=C00384818')[0], 400, 'The zip code is missing')
+            self.assertEqual(self.Get('/dates?id=C00177436&start=13012017')[0], 400, 'The date is invalid')
+            self.assertEqual(self.Get('/zip?id=C00384818&zip=99999')[0], 404, 'Unknown zip code')
+            self.assertEqual(self.Get('/unknown')[0], 404, 'Unknown query')
+        finally:
+            server.Shutdown()
+        self.assertFalse(os.path.exists(self.socket_fullfilename), 'The socket was left behind')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+"""
+Unit tests for the readers of readers.py.  The unittest of the Python Standard Library is used.
+The user is expected to run run_unit_tests.sh at the base of the repository in order to run these tests.
+
+"""
+import bz2
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+import zipfile
+from StringIO import StringIO
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import find_political_donors_delta
+import helpers
+import readers
+
+
+# example entries from itcont.txt
+entries = ['C00629618|N|TER|P|201701230300133512|15C|IND|PEREZ, JOHN A|LOS ANGELES|CA|90017|PRINCIPAL|DOUBLE NICKEL ADVISORS|01032017|40|H6CA34245|SA01251735122|1141239|||2012520171368850783',
+         'C00177436|N|M2|P|201702039042410894|15|IND|FOLEY, JOSEPH|FALMOUTH|ME|041051935|UNUM|SVP, CORP MKTG & PUBLIC RELAT.|01312017|384||PR2283904845050|1147350||P/R DEDUCTION ($192.00 BI-WEEKLY)|4020820171370029339',
+         'C00384818|N|M2|P|201702039042412112|15|IND|ABBOTT, JOSEPH|WOONSOCKET|RI|028956146|CVS HEALTH|VP, RETAIL PHARMACY OPS|01122017|250||2017020211435-887|1147467|||4020820171370030285']
+
+# a line that is missing most of its columns
+malformed_entry = 'C00384818|N|M2|P|201702039042412112'
+
+
+class TestParseBlock(unittest.TestCase):
+    """
+        Check ParseBlock function.
+
+    """
+
+    def test_ParseBlock(self):
+        """
+        Check that ParseBlock returns the same records as ParseLine.
+
+        :return:
+        """
+
+        print('Testing ParseBlock')
+
+        block = '\n'.join(entries) + '\n'
+        self.assertEqual(readers.ParseBlock(block), [helpers.ParseLine(entry) for entry in entries],
+                         'Did not properly parse the block.')
+
+    def test_ParseBlock_malformed(self):
+        """
+        Check that ParseBlock skips malformed lines and a missing final newline without misaligning the other lines.
+
+        :return:
+        """
+
+        print('Testing ParseBlock with a malformed line')
+
+        block = '\n'.join([entries[0], malformed_entry, entries[1], entries[2]])
+        self.assertEqual(readers.ParseBlock(block), [helpers.ParseLine(entry) for entry in entries],
+                         'Did not properly parse the block with a malformed line.')
+
+        # a short line and a long one have 20 pipes each on average, which must not make the columns drift
+        short_entry = '|'.join(entries[0].split('|')[:14])
+        long_entry = entries[1] + '|x' * 7
+        block = short_entry + '\n' + long_entry + '\n'
+        self.assertEqual(block.count('|'), 40, 'The lines should have 40 pipes together')
+        self.assertEqual(readers.ParseBlock(block), [helpers.ParseLine(entries[1])],
+                         'Did not properly parse the block with a short and a long line.')
+
+
+class TestBlockReaders(unittest.TestCase):
+    """
+        Check the MappedBlockReader and LineBlockReader classes.
+
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.input_fullfilename = os.path.join(self.temp_dir, 'itcont.txt')
+        with open(self.input_fullfilename, 'wb') as fid:
+            fid.write('\n'.join(entries * 10) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_readers_small_blocks(self):
+        """
+        Check that both readers return every record, in order, when the blocks are smaller than a line and that the
+        offset ends at the end of the file.
+
+        :return:
+        """
+
+        print('Testing MappedBlockReader and LineBlockReader')
+
+        expected_records = [helpers.ParseLine(entry) for entry in entries * 10]
+        for reader_mode in ['mmap', 'lines']:
+            reader = readers.ReaderFactory(reader_mode)(self.input_fullfilename, block_size=100)
+            records = [record for block in reader for record in block]
+
+            self.assertEqual(records, expected_records, 'Wrong records from the {} reader'.format(reader_mode))
+            self.assertEqual(reader.offset, os.path.getsize(self.input_fullfilename), 'Wrong offset at the end')
+            self.assertEqual(reader.line_number, len(expected_records), 'Wrong line number at the end')
+
+    def test_readers_start_offset(self):
+        """
+        Check that both readers start at the given byte offset.
+
+        :return:
+        """
+
+        print('Testing reader start offset')
+
+        start_offset = len(entries[0]) + 1
+        for reader_mode in ['mmap', 'lines']:
+            reader = readers.ReaderFactory(reader_mode)(self.input_fullfilename, start_offset=start_offset)
+            records = [record for block in reader for record in block]
+            self.assertEqual(records[0], helpers.ParseLine(entries[1]), 'Did not start at the offset')
+            self.assertEqual(len(records), len(entries) * 10 - 1, 'Wrong number of records')
+
+
+
+class TestCompressedBlockReader(unittest.TestCase):
+    """
+        Check CompressedBlockReader class.
+
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.content = '\n'.join(entries * 10) + '\n'
+        self.expected_records = [helpers.ParseLine(entry) for entry in entries * 10]
+
+        # the content in every format, with the gzip and bzip2 files made of two concatenated streams
+        half = len(self.content) // 2
+        self.input_fullfilenames = []
+        for extension, Compress in [('.gz', CompressGzip), ('.bz2', bz2.compress)]:
+            input_fullfilename = os.path.join(self.temp_dir, 'itcont.txt' + extension)
+            with open(input_fullfilename, 'wb') as fid:
+                fid.write(Compress(self.content[:half]) + Compress(self.content[half:]))
+            self.input_fullfilenames.append(input_fullfilename)
+        input_fullfilename = os.path.join(self.temp_dir, 'indiv16.zip')
+        with zipfile.ZipFile(input_fullfilename, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('itcont.txt', self.content)
+            archive.writestr('README.txt', 'not the input')
+        self.input_fullfilenames.append(input_fullfilename)
+        if readers.lzma is not None:
+            input_fullfilename = os.path.join(self.temp_dir, 'itcont.txt.xz')
+            with open(input_fullfilename, 'wb') as fid:
+                fid.write(readers.lzma.compress(self.content))
+            self.input_fullfilenames.append(input_fullfilename)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_CompressedBlockReader(self):
+        """
+        Check that every compressed file gives every record, in order, for blocks smaller than a line and larger than
+        the input, and that the offset ends at the size of the decompressed input.
+
+        :return:
+        """
+
+        print('Testing CompressedBlockReader')
+
+        for input_fullfilename in self.input_fullfilenames:
+            for block_size in [10, 1000, readers.BLOCK_SIZE]:
+                reader = readers.CompressedBlockReader(input_fullfilename, block_size=block_size)
+                records = [record for block in reader for record in block]
+
+                self.assertEqual(records, self.expected_records, 'Wrong records from ' + input_fullfilename)
+                self.assertEqual(reader.offset, len(self.content), 'Wrong offset at the end')
+                self.assertEqual(reader.line_number, len(self.expected_records), 'Wrong line number at the end')
+
+    def test_CompressedBlockReader_start_offset(self):
+        """
+        Check that the reader starts at the given offset of the decompressed input, and that stopping early does not
+        leave the decompression thread behind.
+
+        :return:
+        """
+
+        print('Testing CompressedBlockReader start offset')
+
+        start_offset = len(entries[0]) + 1
+        for input_fullfilename in self.input_fullfilenames:
+            reader = readers.CompressedBlockReader(input_fullfilename, block_size=10, start_offset=start_offset)
+            records = [record for block in reader for record in block]
+            self.assertEqual(records, self.expected_records[1:], 'Did not start at the offset')
+
+            blocks = iter(readers.CompressedBlockReader(input_fullfilename, block_size=10))
+            next(blocks)
+            blocks.close()
+            self.assertEqual(threading.active_count(), 1, 'The decompression thread is still running')
+
+    def test_CompressedBlockReader_errors(self):
+        """
+        Check that truncated and corrupt files and an archive without the input raise errors.
+
+        :return:
+        """
+
+        print('Testing CompressedBlockReader errors')
+
+        for extension, Compress in [('.gz', CompressGzip), ('.bz2', bz2.compress)]:
+            compressed = Compress(self.content)
+            for corrupt in [compressed[:-20], compressed[:len(compressed) // 2] + 'corrupt' +
+                            compressed[len(compressed) // 2 + 7:]]:
+                input_fullfilename = os.path.join(self.temp_dir, 'corrupt' + extension)
+                with open(input_fullfilename, 'wb') as fid:
+                    fid.write(corrupt)
+                with self.assertRaises(IOError):
+                    list(readers.CompressedBlockReader(input_fullfilename))
+
+        input_fullfilename = os.path.join(self.temp_dir, 'archive.zip')
+        with zipfile.ZipFile(input_fullfilename, 'w') as archive:
+            archive.writestr('a.txt', self.content)
+            archive.writestr('b.txt', self.content)
+        with self.assertRaises(IOError):
+            list(readers.CompressedBlockReader(input_fullfilename))
+
+    def test_IterateDecompressed(self):
+        """
+        Check the streams that end right at the end of a chunk of the compressed file.
+
+        :return:
+        """
+
+        print('Testing IterateDecompressed')
+
+        half = len(self.content) // 2
+        for extension, Compress in [('.gz', CompressGzip), ('.bz2', bz2.compress)]:
+            first_stream = Compress(self.content[:half])
+            input_fullfilename = os.path.join(self.temp_dir, 'streams' + extension)
+            with open(input_fullfilename, 'wb') as fid:
+                fid.write(first_stream + Compress(self.content[half:]))
+            self.assertEqual(''.join(readers.IterateDecompressed(input_fullfilename, len(first_stream))),
+                             self.content, 'Wrong content of ' + extension)
+
+    def test_GetCompression(self):
+        """
+        Check the compression of the input files.
+
+        :return:
+        """
+
+        print('Testing GetCompression')
+
+        self.assertEqual([readers.GetCompression(input_fullfilename) for input_fullfilename in
+                          ['itcont.txt', 'indiv16.ZIP', 'itcont.txt.gz', 'a/itcont.txt.bz2', 'itcont.xz']],
+                         [None, 'zip', 'gz', 'bz2', 'xz'], 'Wrong compression')
+
+
+class TestValidatedBlockReader(unittest.TestCase):
+    """
+        Check ValidatedBlockReader class.
+
+    """
+
+    def test_ValidatedBlockReader(self):
+        """
+        Check that the columns checked a block at a time are the same as those checked a record at a time, for
+        records with every kind of invalid field and for a block that falls back to the checks of the records.
+
+        :return:
+        """
+
+        print('Testing ValidatedBlockReader')
+
+        records = [helpers.ParseLine(entry) for entry in entries]
+        records += [('C00384818', '2895', '01122017', '250', ''), ('C00384818', '02895', '02292017', '250', ''),
+                    ('', '02895', '01122017', '250', ''), ('C00384818', '02895', '01122017', '', ''),
+                    ('C00177436', '02895-6146', '13012017', '-7', ''), ('C00999999', ' 1234', '01122017', ' 12', ''),
+                    ('C00999999', 'a2895', 'aa122017', '30', ''), ('C00999999', 'ABCDE', 'notadate', '12.50', '')]
+        blocks = [records, [], records[::-1] + [('C00384818', '02895', '01122017', '250', '\x00')]]
+
+        column_reader = readers.ValidatedBlockReader(blocks)
+        record_reader = readers.ValidatedBlockReader(blocks)
+        for block, columns in zip(blocks, column_reader):
+            expected_columns = record_reader.CheckRecords(block)
+            for column, expected_column in zip(columns, expected_columns):
+                self.assertEqual(column.tolist(), expected_column.tolist(), 'Wrong columns')
+        self.assertIsNone(column_reader.CheckColumns(blocks[-1]), 'The zero byte should fall back to the records')
+        self.assertEqual((column_reader.id_keys, column_reader.zip_keys),
+                         (record_reader.id_keys, record_reader.zip_keys), 'Wrong ids or zip codes')
+        self.assertEqual(column_reader.zip_keys, ['04105', '02895', ' 1234'], 'Wrong zip codes')
+        flags = column_reader.CheckColumns(records)[-1].tolist()
+        # OTHER_ID, then a valid record and a short zip code
+        self.assertEqual(flags[:4], [0, helpers.FLAG_ENTRY | helpers.FLAG_ZIP | helpers.FLAG_DATE,
+                                     helpers.FLAG_ENTRY | helpers.FLAG_ZIP | helpers.FLAG_DATE,
+                                     helpers.FLAG_ENTRY | helpers.FLAG_DATE], 'Wrong flags')
+        # the amount of a record used for neither file is not converted
+        self.assertEqual(column_reader.CheckColumns(records)[3].tolist()[-1], 0, 'Wrong amount')
+        with self.assertRaises(ValueError):
+            list(readers.ValidatedBlockReader([[('C00384818', '02895', '01122017', '1.5', '')]]))
+
+    def test_main(self):
+        """
+        Check that find_political_donors_delta.py gives the expected output of the insight_testsuite test_1 with the
+        input lines checked a block at a time.
+
+        :return:
+        """
+
+        print('Testing ValidatedBlockReader main')
+
+        test_folder = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'insight_testsuite', 'tests',
+                                   'test_1')
+        output_folder = tempfile.mkdtemp()
+        stdout = sys.stdout
+        try:
+            sys.stdout = open(os.devnull, 'w')
+            find_political_donors_delta.main(os.path.join(test_folder, 'input', 'itcont.txt'),
+                                             os.path.join(output_folder, 'medianvals_by_zip.txt'),
+                                             os.path.join(output_folder, 'medianvals_by_date.txt'),
+                                             validate_mode='columns')
+            for name in ['medianvals_by_zip.txt', 'medianvals_by_date.txt']:
+                with open(os.path.join(output_folder, name), 'rb') as fid, \
+                        open(os.path.join(test_folder, 'output', name), 'rb') as fid_expected:
+                    self.assertEqual(fid.read(), fid_expected.read(), 'Wrong ' + name)
+            with self.assertRaises(ValueError):
+                find_political_donors_delta.main(os.path.join(test_folder, 'input', 'itcont.txt'),
+                                                 os.path.join(output_folder, 'medianvals_by_zip.txt'),
+                                                 os.path.join(output_folder, 'medianvals_by_date.txt'),
+                                                 rejections=True, validate_mode='columns')
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+            shutil.rmtree(output_folder)
+
+    def test_main_invalid_fields(self):
+        """
+        Check that find_political_donors_delta.py gives the same output with the input lines checked a block at a time
+        as one record at a time, for dates and zip codes that are too long, too short or have characters after a
+        valid value.
+
+        :return:
+        """
+
+        print('Testing ValidatedBlockReader main with invalid fields')
+
+        dates = ['01312017', '011520179', '0115201', '01152017 ', '01152017', '1152017']
+        zipcodes = ['02895', '028951234', '0289', ' 02895', '02895X', '02895']
+        lines = []
+        for index, (date, zipcode) in enumerate(zip(dates, zipcodes)):
+            fields = entries[2].split('|')
+            fields[10], fields[13], fields[14] = zipcode, date, str(100 * (index + 1))
+            lines.append('|'.join(fields) + '\n')
+        output_folder = tempfile.mkdtemp()
+        input_fullfilename = os.path.join(output_folder, 'itcont.txt')
+        with open(input_fullfilename, 'wb') as fid:
+            fid.write(''.join(lines))
+        stdout = sys.stdout
+        try:
+            sys.stdout = open(os.devnull, 'w')
+            outputs = []
+            for validate_mode in ['records', 'columns']:
+                find_political_donors_delta.main(input_fullfilename,
+                                                 os.path.join(output_folder, 'medianvals_by_zip.txt'),
+                                                 os.path.join(output_folder, 'medianvals_by_date.txt'),
+                                                 validate_mode=validate_mode)
+                outputs.append([open(os.path.join(output_folder, name), 'rb').read()
+                                for name in ['medianvals_by_zip.txt', 'medianvals_by_date.txt']])
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+            shutil.rmtree(output_folder)
+        self.assertEqual(outputs[1], outputs[0], 'The columns and the records disagree')
+        # only the first and the fifth dates are valid
+        self.assertEqual(outputs[0][1], 'C00384818|01152017|500|1|500\nC00384818|01312017|100|1|100\n',
+                         'Wrong date file')
+
+
+def CompressGzip(content):
+    """
+    Compresses a string into a gzip stream.
+
+    :param content: the string [string]
+    :return: the gzip stream [string]
+    """
+    compressed = StringIO()
+    with gzip.GzipFile(fileobj=compressed, mode='wb') as fid:
+        fid.write(content)
+    return compressed.getvalue()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Unit tests for the spilling of the date file values of spill.py.  The unittest of the Python Standard Library is used.
+The user is expected to run run_unit_tests.sh at the base of the repository in order to run these tests.
+
+"""
+import os
+import sys
+import unittest
+from itertools import groupby
+from operator import itemgetter
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import spill
+
+
+class TestDateSpiller(unittest.TestCase):
+    """
+        Check DateSpiller class.
+
+    """
+
+    def test_DateSpiller(self):
+        """
+        Write random values to several runs and check that merging them with values in memory gives every value of
+        every recipient and date, one group after the other in order, and that Remove deletes the runs.
+
+        :return: Nothing
+        """
+
+        print('Testing DateSpiller')
+
+        NUMBER_RUNS = 5
+        ids = ['C00177436', 'C00384818', 'C0062961', 'C00629618']
+        dates = [20161231, 20170104, 20170131]
+
+        expected_values = {}
+        runs = []
+        for _ in xrange(NUMBER_RUNS + 1):
+            run = []
+            for id in ids:
+                for date_key in dates:
+                    values = list(np.random.randint(-10, 1000, np.random.randint(0, 4)))
+                    if values:
+                        run.append((id, date_key, values))
+                        expected_values.setdefault((id, date_key), []).extend(values)
+            runs.append(run)
+
+        spiller = spill.DateSpiller()
+        for run in runs[:NUMBER_RUNS]:
+            spiller.WriteRun(run)
+        self.assertEqual(spiller.number_runs, NUMBER_RUNS, 'Wrong number of runs')
+
+        values_in_memory = ((id, date_key, value) for id, date_key, values in runs[-1] for value in values)
+        merged = [(key, sorted(value for _, _, value in date_values))
+                  for key, date_values in groupby(spiller.IterateValues(values_in_memory), itemgetter(0, 1))]
+        self.assertEqual(merged, [(key, sorted(expected_values[key])) for key in sorted(expected_values)],
+                         'Wrong merged values')
+
+        run_directory = spiller.run_directory
+        spiller.Remove()
+        self.assertFalse(os.path.exists(run_directory), 'The runs were not deleted')
+        self.assertEqual(list(spiller.IterateValues()), [], 'There should be no runs')
+
+
+if __name__ == '__main__':
+    unittest.main()
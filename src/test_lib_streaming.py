@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Unit tests for the streaming mode of streaming.py.  The unittest of the Python Standard Library is used.
+The user is expected to run run_unit_tests.sh at the base of the repository in order to run these tests.
+
+The input and expected output of the insight_testsuite test_1 are used.
+
+"""
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import helpers, streaming
+
+source_folder = os.path.dirname(os.path.realpath(__file__))
+test_folder = os.path.join(source_folder, '..', 'insight_testsuite', 'tests', 'test_1')
+input_fullfilename = os.path.join(test_folder, 'input', 'itcont.txt')
+with open(input_fullfilename, 'rb') as fid:
+    input_data = fid.read()
+
+
+class TestLatencyRecorder(unittest.TestCase):
+    """
+        Check LatencyRecorder class.
+
+    """
+
+    def test_GetPercentile(self):
+        """
+        Check that the percentiles are within the relative error of the exact ones.
+
+        :return:
+        """
+
+        print('Testing LatencyRecorder GetPercentile')
+
+        random.seed(0)
+        latencies = sorted(random.expovariate(1000.0) for _ in xrange(10000))
+        recorder = streaming.LatencyRecorder(relative_error=0.01)
+        self.assertIsNone(recorder.GetPercentile(50), 'No latency was added')
+        for latency in latencies:
+            recorder.Add(latency)
+        recorder.Add(1.0, 0)
+        self.assertEqual(recorder.number_latencies, len(latencies), 'Wrong number of latencies')
+        for percentile in [50, 90, 99]:
+            exact = latencies[int(percentile / 100.0 * len(latencies)) - 1]
+            self.assertLess(abs(recorder.GetPercentile(percentile) - exact), 0.011 * exact,
+                            'Wrong percentile {}'.format(percentile))
+        self.assertEqual(recorder.GetPercentile(100), latencies[-1], 'Wrong maximum')
+        self.assertTrue(recorder.GetReport().startswith('10000 lines: p50 '), 'Wrong report')
+
+
+class TestStreamReader(unittest.TestCase):
+    """
+        Check StreamReader class.
+
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.socket_fullfilename = os.path.join(self.folder, 'socket')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def SendInput(self, pause_seconds):
+        """
+        Connects to the socket and sends the test input in pieces that split the lines.
+
+        :param pause_seconds: pause before the last piece [float]
+        :return: Nothing
+        """
+        while not os.path.exists(self.socket_fullfilename):
+            time.sleep(0.01)
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(self.socket_fullfilename)
+        middle = len(input_data) // 2
+        for start, end in [(0, 10), (10, middle), (middle, len(input_data) - 5)]:
+            client.sendall(input_data[start:end])
+            time.sleep(0.01)
+        time.sleep(pause_seconds)
+        # the last line does not end with a new line
+        client.sendall(input_data[-5:].rstrip('\n'))
+        client.close()
+
+    def test_StreamReader(self):
+        """
+        Check that the lines sent in pieces over a Unix socket are handed out whole, that an empty block is handed out
+        when the stream is idle and that the socket is removed.
+
+        :return:
+        """
+
+        print('Testing StreamReader')
+
+        sender = threading.Thread(target=self.SendInput, args=(0.3,))
+        sender.start()
+        reader = streaming.StreamReader(streaming.UNIX_PREFIX + self.socket_fullfilename, idle_seconds=0.1)
+        blocks = list(reader)
+        sender.join()
+
+        self.assertIn([], blocks, 'No empty block while the stream was idle')
+        records = [record for block in blocks for record in block]
+        self.assertEqual(records, [helpers.ParseLine(line) for line in input_data.splitlines()], 'Wrong records')
+        self.assertEqual(reader.line_number, len(records), 'Wrong number of lines')
+        self.assertEqual(reader.offset, len(input_data.rstrip('\n')), 'Wrong offset')
+        self.assertFalse(os.path.exists(self.socket_fullfilename), 'The socket was left behind')
+
+    def test_standard_input(self):
+        """
+        Check that find_political_donors_delta.py gives the expected output for the standard input.
+
+        :return:
+        """
+
+        print('Testing streaming mode standard input')
+
+        zip_fullfilename = os.path.join(self.folder, 'medianvals_by_zip.txt')
+        date_fullfilename = os.path.join(self.folder, 'medianvals_by_date.txt')
+        process = subprocess.Popen([sys.executable, os.path.join(source_folder, 'find_political_donors_delta.py'), '-',
+                                    zip_fullfilename, date_fullfilename],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        output = process.communicate(input_data)[0]
+        self.assertEqual(process.returncode, 0, 'The run failed')
+        self.assertIn('Latency of the zip file lines: 6 lines', output, 'Wrong latency report')
+        for fullfilename in [zip_fullfilename, date_fullfilename]:
+            with open(fullfilename, 'rb') as fid, \
+                    open(os.path.join(test_folder, 'output', os.path.basename(fullfilename)), 'rb') as fid_expected:
+                self.assertEqual(fid.read(), fid_expected.read(), 'Wrong ' + os.path.basename(fullfilename))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Unit tests for the writer of writers.py.  The unittest of the Python Standard Library is used.
+The user is expected to run run_unit_tests.sh at the base of the repository in order to run these tests.
+
+"""
+import os
+import sys
+import unittest
+from StringIO import StringIO
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import writers
+
+
+# example output lines
+zip_lines = ['C00629618|90017|40|1|40\n', 'C00177436|30004|384|1|384\n', 'C00384818|02895|250|1|250\n',
+             'C00177436|30004|384|2|768\n']
+
+
+class CountingFile(StringIO):
+    """
+        In-memory file that counts the number of writes.
+
+    """
+
+    def __init__(self):
+        StringIO.__init__(self)
+        self.number_writes = 0
+
+    def write(self, s):
+        self.number_writes += 1
+        StringIO.write(self, s)
+
+
+class TestBufferedLineWriter(unittest.TestCase):
+    """
+        Check BufferedLineWriter class.
+
+    """
+
+    def test_BufferedLineWriter_output(self):
+        """
+        Check that the file gets exactly the lines written, for every flush policy.
+
+        :return:
+        """
+
+        print('Testing BufferedLineWriter output')
+
+        for flush_policy in [{}, {'flush_bytes': 1}, {'flush_records': 3}, {'flush_seconds': 0.0},
+                             {'flush_bytes': None}]:
+            fid = CountingFile()
+            with writers.BufferedLineWriter(fid, **flush_policy) as writer:
+                writer.write(zip_lines[0])
+                writer.writelines(zip_lines[1:])
+                writer.writelines([])
+            self.assertEqual(fid.getvalue(), ''.join(zip_lines), 'Wrong output with {}'.format(flush_policy))
+
+    def test_BufferedLineWriter_flush_policy(self):
+        """
+        Check the number of writes to the file for the flush policies.
+
+        :return:
+        """
+
+        print('Testing BufferedLineWriter flush policy')
+
+        # everything in a single write
+        fid = CountingFile()
+        with writers.BufferedLineWriter(fid) as writer:
+            for lineOut in zip_lines * 100:
+                writer.write(lineOut)
+        self.assertEqual(fid.number_writes, 1, 'Wrong number of writes with the default policy')
+
+        # a write every 100 lines
+        fid = CountingFile()
+        with writers.BufferedLineWriter(fid, flush_records=100) as writer:
+            for lineOut in zip_lines * 100:
+                writer.write(lineOut)
+        self.assertEqual(fid.number_writes, 4, 'Wrong number of writes with flush_records')
+
+        # a write every ~ 10 lines
+        fid = CountingFile()
+        with writers.BufferedLineWriter(fid, flush_bytes=len(''.join(zip_lines)) * 2) as writer:
+            for lineOut in zip_lines * 10:
+                writer.write(lineOut)
+        self.assertEqual(fid.number_writes, 5, 'Wrong number of writes with flush_bytes')
+
+        # a write for every line
+        fid = CountingFile()
+        with writers.BufferedLineWriter(fid, flush_seconds=0.0) as writer:
+            for lineOut in zip_lines:
+                writer.write(lineOut)
+        self.assertEqual(fid.number_writes, 4, 'Wrong number of writes with flush_seconds')
+
+
+if __name__ == '__main__':
+    unittest.main()
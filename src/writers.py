@@ -0,0 +1,102 @@
+"""
+Writer for the medianvals_by_zip.txt and medianvals_by_date.txt files.
+
+The lines are collected in a buffer and written to the file in large chunks, which matters on network file systems
+where every write is expensive.  When the buffer is written out is set by a flush policy: a number of bytes, a number
+of lines and/or a number of seconds since the last flush, whichever comes first.
+
+"""
+import time
+
+# Default number of bytes collected before they are written to the file
+FLUSH_BYTES = 1 << 22
+
+
+class BufferedLineWriter(object):
+    """
+        Collects output lines and writes them to a file in large chunks.
+
+        How to use: write(line) or writelines(lines) and close() at the end (or use it in a with statement).
+        The file should be opened unbuffered, since this class does the buffering.
+
+    """
+
+    def __init__(self, fid, flush_bytes=FLUSH_BYTES, flush_records=None, flush_seconds=None):
+        """
+        :param fid: opened output file [file]
+        :param flush_bytes: write out the buffer once it holds this many bytes; None for no limit [int]
+        :param flush_records: write out the buffer once it holds this many lines; None for no limit [int]
+        :param flush_seconds: write out the buffer once this many seconds have passed since the last time it was
+                              written out, checked when lines are added; None for no limit [float]
+        """
+        self.fid = fid
+        self.buffer = []
+        self.buffered_bytes = 0
+        self.number_records = 0
+
+        # None means there is no limit
+        self.flush_bytes = flush_bytes if flush_bytes is not None else float('inf')
+        self.flush_records = flush_records if flush_records is not None else float('inf')
+        self.flush_seconds = flush_seconds
+        self.time_flushed = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def write(self, line):
+        """
+        Adds a line to the buffer and writes out the buffer if the flush policy says so.
+
+        :param line: line for the output file [string]
+        :return: whether the buffer was written out [bool]
+        """
+        self.buffer.append(line)
+        self.buffered_bytes += len(line)
+        self.number_records += 1
+        if self.buffered_bytes >= self.flush_bytes or self.number_records >= self.flush_records or \
+                (self.flush_seconds is not None and time.time() - self.time_flushed >= self.flush_seconds):
+            self.flush()
+            return True
+        return False
+
+    def writelines(self, lines):
+        """
+        Adds lines to the buffer and writes out the buffer if the flush policy says so.
+
+        :param lines: lines for the output file [list]
+        :return: whether the buffer was written out [bool]
+        """
+        self.buffer.extend(lines)
+        self.buffered_bytes += sum(map(len, lines))
+        self.number_records += len(lines)
+        if self.buffered_bytes >= self.flush_bytes or self.number_records >= self.flush_records or \
+                (self.flush_seconds is not None and time.time() - self.time_flushed >= self.flush_seconds):
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        """
+        Writes out the buffer in a single write and empties it (the list is reused).
+
+        :return: Nothing
+        """
+        if self.buffer:
+            self.fid.write(''.join(self.buffer))
+            del self.buffer[:]
+            self.buffered_bytes = 0
+            self.number_records = 0
+        self.fid.flush()
+        if self.flush_seconds is not None:
+            self.time_flushed = time.time()
+
+    def close(self):
+        """
+        Writes out what is left in the buffer.  The file itself is not closed.
+
+        :return: Nothing
+        """
+        self.flush()